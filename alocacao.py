@@ -0,0 +1,194 @@
+# Alocação automática de vagas abertas aos pacientes em espera
+import json
+import os
+import threading
+import uuid
+from collections import deque
+
+import pandas as pd
+
+from armazenamento import trava_arquivo
+from espera import dias_para_gravar
+from filas import TURNOS_COMPATIVEIS
+
+ARQUIVO_VAGAS = "vagas_abertas.json"
+
+CAMPOS_VAGA = ["Profissional", "Especialidade", "Turno", "Horário", "Data de Início"]
+
+# ============================
+# VAGAS ABERTAS
+# ============================
+# Cada vaga é um dicionário com "id" e CAMPOS_VAGA, guardado em um JSON ao lado
+# dos dados para que todas as sessões vejam as mesmas vagas. Abrir e fechar
+# leem e regravam o arquivo inteiro, então seguram a trava da thread e a do
+# arquivo (caminho + ".lock") para não perder vagas gravadas por outro processo.
+
+_trava_vagas = threading.Lock()
+
+def carregar_vagas(caminho=ARQUIVO_VAGAS):
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return []
+
+def _gravar_vagas(vagas, caminho):
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(vagas, arquivo, ensure_ascii=False, default=str)
+    os.replace(temporario, caminho)
+
+def abrir_vagas(vaga, quantidade=1, caminho=ARQUIVO_VAGAS):
+    with _trava_vagas, trava_arquivo(caminho + ".lock"):
+        vagas = carregar_vagas(caminho)
+        novas = [dict({c: vaga.get(c) for c in CAMPOS_VAGA}, id=uuid.uuid4().hex) for _ in range(quantidade)]
+        _gravar_vagas(vagas + novas, caminho)
+        return novas
+
+def fechar_vagas(ids, caminho=ARQUIVO_VAGAS):
+    ids = set(ids)
+    with _trava_vagas, trava_arquivo(caminho + ".lock"):
+        _gravar_vagas([v for v in carregar_vagas(caminho) if v["id"] not in ids], caminho)
+
+# ============================
+# EMPARELHAMENTO
+# ============================
+
+def _profissional(valor):
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    valor = " ".join(str(valor).split()).casefold()
+    return valor or None
+
+# Escolhe quais pacientes recebem as vagas maximizando a soma dos dias de
+# espera atendidos. Uma vaga aceita pacientes da mesma especialidade com turno
+# compatível (TURNOS_COMPATIVEIS) e, com respeitar_profissional, só aceita quem
+# indicou um profissional se for a vaga dele.
+#
+# Como o peso está só no paciente, os conjuntos de pacientes que cabem nas
+# vagas formam uma matroide transversal e o guloso é ótimo: em ordem de espera
+# decrescente, cada paciente entra se existir um caminho aumentante que abra
+# espaço para ele. Pacientes e vagas são agrupados por tipo (especialidade,
+# turno, profissional), então cada busca percorre só os tipos, e um tipo de
+# paciente que não couber uma vez não cabe mais e é descartado.
+#
+# Devolve um DataFrame com "id" (paciente), "vaga" (id da vaga) e "Dias de
+# Espera", na ordem de espera.
+def alocar_vagas(espera, vagas, respeitar_profissional=True):
+    colunas = ["id", "vaga", "Dias de Espera"]
+    if espera.empty or not vagas:
+        return pd.DataFrame(columns=colunas)
+
+    # Tipos de vaga e capacidade de cada um
+    vagas_por_tipo = {}
+    for vaga in sorted(vagas, key=lambda v: str(v.get("Data de Início") or "")):
+        tipo = (vaga["Especialidade"], vaga["Turno"], _profissional(vaga.get("Profissional")))
+        vagas_por_tipo.setdefault(tipo, []).append(vaga["id"])
+    tipos_vaga = list(vagas_por_tipo)
+    capacidade = [len(vagas_por_tipo[t]) for t in tipos_vaga]
+    livres = capacidade[:]
+    por_especialidade = {}
+    for j, (especialidade, turno, profissional) in enumerate(tipos_vaga):
+        por_especialidade.setdefault(especialidade, []).append((j, turno, profissional))
+
+    # Só interessa quem é de uma especialidade com vaga, do mais antigo ao mais novo
+    candidatos = espera[espera["Especialidade"].isin(list(por_especialidade))]
+    dias = pd.to_numeric(candidatos["Dias de Espera"], errors="coerce").fillna(0)
+    ordem = dias.sort_values(ascending=False, kind="stable").index
+    indicados = candidatos["Profissional Indicado"] if respeitar_profissional else pd.Series(None, index=candidatos.index)
+    if respeitar_profissional and "Preferência Profissional" in candidatos:
+        indicados = indicados.where(candidatos["Preferência Profissional"].astype(object) == "Sim")
+
+    linhas_ordenadas = zip(ordem.tolist(), candidatos.loc[ordem, "Especialidade"].astype(object).tolist(),
+                           candidatos.loc[ordem, "Horário Preferencial"].astype(object).tolist(),
+                           indicados.loc[ordem].tolist())
+
+    tipos_paciente = {}   # tipo -> índice
+    vizinhos = []         # índice do tipo de paciente -> tipos de vaga compatíveis
+    escolhidos = []       # índice do tipo de paciente -> ids aceitos
+    ocupantes = [{} for _ in tipos_vaga]
+    descartados = set()
+    restantes = sum(capacidade)
+
+    for id_, especialidade, turno, indicado in linhas_ordenadas:
+        if restantes == 0:
+            break
+        tipo = (especialidade, turno, _profissional(indicado))
+        i = tipos_paciente.get(tipo)
+        if i is None:
+            i = tipos_paciente[tipo] = len(vizinhos)
+            profissional = tipo[2]
+            vizinhos.append([j for j, turno_vaga, profissional_vaga in por_especialidade[especialidade]
+                             if turno in TURNOS_COMPATIVEIS.get(turno_vaga, ())
+                             and (profissional is None or profissional == profissional_vaga)])
+            escolhidos.append([])
+        if i in descartados:
+            continue
+        if _aumentar(i, vizinhos, ocupantes, livres):
+            escolhidos[i].append(id_)
+            restantes -= 1
+        else:
+            descartados.add(i)
+
+    # Distribui os pacientes de cada tipo pelas vagas conforme o fluxo; os que
+    # esperam há mais tempo ficam com as vagas que começam antes
+    inicio = {vaga["id"]: str(vaga.get("Data de Início") or "") for vaga in vagas}
+    proximas = {j: deque(vagas_por_tipo[t]) for j, t in enumerate(tipos_vaga)}
+    fluxo = [{} for _ in escolhidos]
+    for j, quantidades in enumerate(ocupantes):
+        for i, quantidade in quantidades.items():
+            fluxo[i][j] = quantidade
+    linhas = []
+    for i, ids in enumerate(escolhidos):
+        destinos = sorted(fluxo[i].items(), key=lambda par: inicio[proximas[par[0]][0]])
+        pendentes = deque(ids)
+        for j, quantidade in destinos:
+            for _ in range(quantidade):
+                id_ = pendentes.popleft()
+                linhas.append((id_, proximas[j].popleft(), dias.at[id_]))
+    resultado = pd.DataFrame(linhas, columns=colunas)
+    return resultado.sort_values("Dias de Espera", ascending=False, kind="stable").reset_index(drop=True)
+
+# Busca em largura sobre os tipos de vaga por um caminho do tipo de paciente
+# i até um tipo com vaga livre, passando por tipos cheios cujos ocupantes podem
+# trocar de vaga. Se achar, aplica o caminho em ocupantes (tipo de vaga ->
+# {tipo de paciente: quantidade}).
+def _aumentar(i, vizinhos, ocupantes, livres):
+    for j in vizinhos[i]:
+        if livres[j]:
+            livres[j] -= 1
+            ocupantes[j][i] = ocupantes[j].get(i, 0) + 1
+            return True
+    anterior = {j: (-1, i) for j in vizinhos[i]}  # tipo de vaga -> (tipo anterior, tipo de paciente)
+    fila = deque(anterior)
+    while fila:
+        j = fila.popleft()
+        if livres[j]:
+            livres[j] -= 1
+            while j != -1:
+                j_anterior, k = anterior[j]
+                ocupantes[j][k] = ocupantes[j].get(k, 0) + 1
+                if j_anterior != -1:
+                    ocupantes[j_anterior][k] -= 1
+                    if not ocupantes[j_anterior][k]:
+                        del ocupantes[j_anterior][k]
+                j = j_anterior
+            return True
+        for k in ocupantes[j]:
+            for j_seguinte in vizinhos[k]:
+                if j_seguinte not in anterior:
+                    anterior[j_seguinte] = (j, k)
+                    fila.append(j_seguinte)
+    return False
+
+# Campos gravados em atendidos para cada paciente alocado
+def campos_da_vaga(vaga, usuario, agora, dias_espera=None):
+    return {
+        "Dias de Espera": dias_para_gravar(dias_espera),
+        "Profissional Responsável": vaga.get("Profissional") or "",
+        "Horário Atendimento": " - ".join(str(v) for v in (vaga.get("Turno"), vaga.get("Horário")) if v),
+        "Data de Início": vaga.get("Data de Início"),
+        "Vaga Concedida": "Sim",
+        "Data Registro": agora,
+        "Registrado Por": usuario,
+    }
@@ -1,105 +1,179 @@
 import pandas as pd
-from datetime import datetime, date
+from datetime import datetime
 import streamlit as st
-import hashlib
-import os
+import uuid
+from armazenamento import ConflitoEdicao, criar_armazenamento, filtrar_pacientes, valores_lidos
+from esquema import ESPECIALIDADES, colunas_padrao, concatenar
+from cache_dados import CacheDados
+from usuarios import PERFIS, USUARIO_PROTEGIDO, CadastroUsuarios
+from desempenho import RegistroDesempenho
+from indice import CarteirinhaDuplicada
+from filas import FilasPrioridade
+from estatisticas import EstatisticasEspera
+from previsao import PrevisaoAdmissao
+from historico import HistoricoDiario
+from espera import DiasEsperaMaterializados, calcular_dias_espera, dias_para_gravar, hoje_referencia, iniciar_renovacao_diaria
+from componentes import lista_paginada
+from alocacao import CAMPOS_VAGA, abrir_vagas, alocar_vagas, campos_da_vaga, carregar_vagas, fechar_vagas
+from metricas import REGISTRO, iniciar_servidor
+from importacao import ErroImportacao, operacao_lote, preparar_importacao
+from exportacao import FORMATOS_STREAMING, MIME_XLSX, arquivo_em_cache, excel_disponivel, excel_em_cache
 
 # ============================
 # SISTEMA DE LOGIN COM GESTÃO
 # ============================
 
-if "usuarios" not in st.session_state:
-    st.session_state.usuarios = {
-        "admin": {
-            "senha": hashlib.sha256("admin123".encode()).hexdigest(),
-            "perfil": "Administrador"
-        },
-        "user1": {
-            "senha": hashlib.sha256("senha123".encode()).hexdigest(),
-            "perfil": "Comum"
-        }
-    }
+PERMISSOES_PADRAO = ["editar_espera"]
+
+# Cadastro único por processo, gravado em usuarios.json: usuários criados ou
+# excluídos valem para todas as sessões e sobrevivem a reinícios
+@st.cache_resource
+def obter_usuarios():
+    return CadastroUsuarios()
+
+usuarios = obter_usuarios()
 
 def autenticar(usuario, senha):
-    senha_cripto = hashlib.sha256(senha.encode()).hexdigest()
-    if usuario in st.session_state.usuarios:
-        return st.session_state.usuarios[usuario]["senha"] == senha_cripto
-    return False
+    return usuarios.autenticar(usuario, senha)
 
 # ============================
 # FUNÇÕES AUXILIARES
 # ============================
 
-def calcular_dias_espera(data_contato):
-    if isinstance(data_contato, pd.Timestamp):
-        data_contato = data_contato.to_pydatetime()
-    elif isinstance(data_contato, date):
-        data_contato = datetime.combine(data_contato, datetime.min.time())
-    hoje = datetime.today()
-    return (hoje - data_contato).days
-
-def cor_tempo_espera(dias):
-    if dias < 15:
-        return 'background-color: #d4edda'
-    elif dias < 30:
-        return 'background-color: #fff3cd'
-    else:
-        return 'background-color: #f8d7da'
-
-def aplicar_estilo(df):
-    return df.style.applymap(lambda x: cor_tempo_espera(x) if isinstance(x, int) else "")
+# Administradores podem tudo; demais perfis usam a lista "permissoes" do usuário
+def tem_permissao(usuario, permissao):
+    dados_usuario = usuarios.obter(usuario) or {}
+    if dados_usuario.get("perfil") == "Administrador":
+        return True
+    return permissao in dados_usuario.get("permissoes", PERMISSOES_PADRAO)
 
 def alterar_senha(usuario, nova_senha):
-    st.session_state.usuarios[usuario]["senha"] = hashlib.sha256(nova_senha.encode()).hexdigest()
+    usuarios.alterar_senha(usuario, nova_senha)
 
 def alterar_perfil(usuario, novo_perfil):
-    st.session_state.usuarios[usuario]["perfil"] = novo_perfil
+    usuarios.alterar_perfil(usuario, novo_perfil)
 
 def adicionar_usuario(novo_usuario, senha, perfil):
-    if novo_usuario not in st.session_state.usuarios:
-        st.session_state.usuarios[novo_usuario] = {
-            "senha": hashlib.sha256(senha.encode()).hexdigest(),
-            "perfil": perfil
-        }
-        return True
-    return False
+    return usuarios.adicionar(novo_usuario, senha, perfil)
 
 def excluir_usuario(usuario):
-    if usuario in st.session_state.usuarios and usuario != "admin":
-        del st.session_state.usuarios[usuario]
+    usuarios.excluir(usuario)
 
 # ============================
 # DADOS E ARQUIVOS
 # ============================
 
-DATA_FILE_ESPERA = "data_espera.csv"
-DATA_FILE_ATENDIDOS = "data_atendidos.csv"
-
-colunas_padrao = [
+# Modos disponíveis em armazenamento.MODOS_ARMAZENAMENTO ("csv" reescreve os
+# arquivos inteiros a cada alteração, "diario" apenas acrescenta a operação,
+# "sqlite" grava linha a linha em um banco embutido com índices, "parquet" é
+# o modo diário com snapshots colunares tipados; para migrar os CSVs use
+# armazenamento.converter_csv_para_parquet())
+MODO_ARMAZENAMENTO = "diario"
+
+# Armazenamento e cache de dados são únicos por processo: todas as sessões
+# leem a mesma cópia em vez de guardar a lista inteira em st.session_state
+@st.cache_resource
+def obter_cache():
+    cache = CacheDados(criar_armazenamento(MODO_ARMAZENAMENTO))
+    cache.filas = cache.adicionar_derivado(FilasPrioridade())
+    cache.dias_espera = cache.adicionar_derivado(DiasEsperaMaterializados())
+    cache.estatisticas = cache.adicionar_derivado(EstatisticasEspera())
+    cache.previsao = cache.adicionar_derivado(PrevisaoAdmissao(cache.estatisticas))
+    cache.historico = HistoricoDiario()
+
+    # Na virada do dia: "Dias de Espera" recalculado e fotografia do dia gravada
+    def virada_do_dia():
+        cache.dias_espera.renovar()
+        cache.historico.fotografar(*cache.obter())
+
+    cache.historico.fotografar(*cache.obter())
+    iniciar_renovacao_diaria(virada_do_dia)
+    return cache
+
+cache = obter_cache()
+armazenamento = cache.armazenamento
+
+# Métricas no formato do Prometheus em http://127.0.0.1:PORTA_METRICAS/metrics
+# (None desliga). O servidor é único por processo; se a porta estiver em uso,
+# o app segue sem ele.
+PORTA_METRICAS = 9464
+
+@st.cache_resource
+def iniciar_metricas():
+    REGISTRO.medidor("lista_espera_sessoes_ativas", "Sessões com atividade recente.",
+                     funcao=cache.sessoes_ativas)
+    REGISTRO.medidor("lista_espera_pacientes_em_espera", "Pacientes na lista de espera por especialidade.",
+                     ["especialidade"], funcao=lambda: {e: cache.filas.tamanho(e) for e in ESPECIALIDADES})
+    if PORTA_METRICAS is None:
+        return None
+    try:
+        return iniciar_servidor(PORTA_METRICAS)
+    except OSError:
+        return None
+
+iniciar_metricas()
+
+if "id_sessao" not in st.session_state:
+    st.session_state.id_sessao = uuid.uuid4().hex
+
+# Tempo de cada etapa desta execução, visto no painel "Desempenho" e gravado
+# em desempenho.log. Execuções cortadas por st.rerun() são fechadas aqui.
+@st.cache_resource
+def obter_desempenho():
+    return RegistroDesempenho()
+
+desempenho = obter_desempenho()
+execucao_anterior = st.session_state.get("execucao")
+if execucao_anterior is not None:
+    execucao_anterior.finalizar(interrompida=True)
+execucao = st.session_state.execucao = desempenho.iniciar(st.session_state.id_sessao)
+
+# Os DataFrames devolvidos são compartilhados entre sessões: não altere no lugar
+def carregar_dados():
+    with execucao.etapa("carregar_dados"):
+        return cache.obter(st.session_state.id_sessao)
+
+# Aplica a alteração na cópia compartilhada e grava apenas a operação no armazenamento.
+# Levanta ConflitoEdicao se outra sessão alterou os mesmos pacientes antes.
+def registrar_operacao(operacao):
+    with execucao.etapa("salvar_dados"):
+        return cache.registrar(operacao)
+
+# Cadastro pelo formulário, medido na mesma etapa das demais gravações
+def adicionar_paciente(tabela, registro, duplicados):
+    with execucao.etapa("salvar_dados"):
+        return cache.adicionar_paciente(tabela, registro, duplicados)
+
+# Carteirinha e data do 1º contato de cada id como foram exibidas na execução
+# anterior (a que o usuário via ao confirmar), para o "esperado" das saídas da
+# lista: se o id passou a ser de outro paciente, a gravação dá conflito
+def identidade_exibida(chave, df, ids):
+    anterior = st.session_state.get(chave) or {}
+    atual = dict(zip(ids, valores_lidos(df, ids)))
+    st.session_state[chave] = atual
+    return [anterior.get(id_, atual[id_]) for id_ in ids]
+
+COLUNAS_LISTA_ESPERA = [
     "Nome", "Nº Carteirinha", "Data 1º Contato", "Dias de Espera", "Especialidade",
-    "Telefone", "Horário Preferencial", "Preferência Profissional", "Profissional Indicado",
-    "Registrado Por", "Data Registro", "Vaga Concedida", "Profissional Responsável",
-    "Horário Atendimento", "Data de Início"
+    "Telefone", "Horário Preferencial", "Profissional Indicado"
 ]
 
-def carregar_dados():
-    if "dados" not in st.session_state:
-        if os.path.exists(DATA_FILE_ESPERA):
-            st.session_state.dados = pd.read_csv(DATA_FILE_ESPERA)
-            st.session_state.dados["Data 1º Contato"] = pd.to_datetime(st.session_state.dados["Data 1º Contato"], errors="coerce")
-        else:
-            st.session_state.dados = pd.DataFrame(columns=colunas_padrao)
-
-    if "atendidos" not in st.session_state:
-        if os.path.exists(DATA_FILE_ATENDIDOS):
-            st.session_state.atendidos = pd.read_csv(DATA_FILE_ATENDIDOS)
-            st.session_state.atendidos["Data 1º Contato"] = pd.to_datetime(st.session_state.atendidos["Data 1º Contato"], errors="coerce")
-        else:
-            st.session_state.atendidos = pd.DataFrame(columns=colunas_padrao)
-
-def salvar_dados():
-    st.session_state.dados.to_csv(DATA_FILE_ESPERA, index=False)
-    st.session_state.atendidos.to_csv(DATA_FILE_ATENDIDOS, index=False)
+# Pacientes oferecidos de uma vez na alocação em lote
+LIMITE_ALOCACAO_LOTE = 500
+
+# Carteirinha vai direto ao índice em memória; especialidade usa a consulta
+# indexada do armazenamento quando existir, senão filtra em memória
+def filtrar_espera(espera, especialidade=None, carteirinha=None):
+    if carteirinha:
+        ids = [i for i in cache.indice.ids_em(carteirinha, "dados") if i in espera.index]
+        return filtrar_pacientes(espera.loc[ids], especialidade=especialidade)
+    if not especialidade:
+        return espera
+    if armazenamento.suporta_consulta:
+        resultado = armazenamento.consultar("dados", especialidade=especialidade)
+        resultado["Dias de Espera"] = espera["Dias de Espera"].reindex(resultado.index)
+        return resultado
+    return filtrar_pacientes(espera, especialidade=especialidade)
 
 # ============================
 # INTERFACE STREAMLIT
@@ -108,7 +182,7 @@ def salvar_dados():
 st.set_page_config(page_title="Lista de Espera - Reabilitação", layout="wide")
 st.title("📋 Sistema de Lista de Espera - Centro de Reabilitação")
 
-# Carrega os dados
+# Carrega os dados (na primeira sessão do processo) e marca esta sessão como ativa
 carregar_dados()
 
 # Login
@@ -127,10 +201,15 @@ if "usuario" not in st.session_state:
             else:
                 st.error("Usuário ou senha incorretos.")
 
+# Usuário excluído por um administrador em outra sessão perde o acesso
+if "usuario" in st.session_state and not usuarios.existe(st.session_state.usuario):
+    del st.session_state.usuario
+    st.warning("Seu usuário foi removido. Entre novamente.")
+
 # Após login
 if "usuario" in st.session_state:
     usuario_atual = st.session_state.usuario
-    perfil = st.session_state.usuarios[usuario_atual]["perfil"]
+    perfil = usuarios.perfil(usuario_atual)
     st.sidebar.success(f"Usuário: {usuario_atual} ({perfil})")
 
     if st.sidebar.button("Sair"):
@@ -156,7 +235,7 @@ if "usuario" in st.session_state:
         with st.sidebar.expander("➕ Novo Usuário"):
             novo_user = st.text_input("Usuário")
             nova_senha = st.text_input("Senha", type="password")
-            tipo = st.selectbox("Perfil", ["Administrador", "Comum"])
+            tipo = st.selectbox("Perfil", PERFIS)
             if st.button("Criar"):
                 if adicionar_usuario(novo_user, nova_senha, tipo):
                     st.success("Usuário criado.")
@@ -164,16 +243,37 @@ if "usuario" in st.session_state:
                     st.error("Usuário já existe.")
 
         with st.sidebar.expander("👥 Lista de Usuários"):
-            for u, dados in st.session_state.usuarios.items():
+            # A versão do cadastro entra na chave para que uma alteração feita em
+            # outra sessão não seja desfeita pelo valor antigo do widget
+            for u, dados in usuarios.listar().items():
                 col1, col2, col3 = st.columns([4, 3, 1])
                 col1.markdown(f"**{u}**")
-                p = col2.selectbox(f"Perfil de {u}", ["Administrador", "Comum"], index=0 if dados["perfil"] == "Administrador" else 1, key=f"perfil_{u}")
+                p = col2.selectbox(f"Perfil de {u}", PERFIS, index=PERFIS.index(dados["perfil"]),
+                                   key=f"perfil_{u}_{usuarios.versao}")
                 if p != dados["perfil"]:
                     alterar_perfil(u, p)
-                if u != "admin":
+                    st.rerun()
+                if u != USUARIO_PROTEGIDO:
                     if col3.button("❌", key=f"del_{u}"):
                         excluir_usuario(u)
-                        st.experimental_rerun()
+                        st.rerun()
+
+        with st.sidebar.expander("💾 Cache de Dados"):
+            memoria = cache.relatorio_memoria()
+            st.markdown(f"Sessões ativas: **{memoria['sessoes_ativas']}**")
+            st.markdown(f"Tamanho da cópia compartilhada: **{memoria['bytes_por_copia'] / 1024 ** 2:.1f} MB**")
+            st.markdown(f"Economia por sessão extra: **{memoria['bytes_economizados_por_sessao_extra'] / 1024 ** 2:.1f} MB**")
+            st.markdown(f"Economia total: **{memoria['bytes_economizados'] / 1024 ** 2:.1f} MB**")
+
+        with st.sidebar.expander("⏱️ Desempenho"):
+            ultima = desempenho.ultima(st.session_state.id_sessao)
+            if ultima is not None:
+                st.markdown(f"Última execução desta sessão: **{ultima.duracao * 1000:.0f} ms**")
+                st.dataframe(pd.DataFrame([(nome, round(inicio * 1000, 1), round(duracao * 1000, 1))
+                                           for nome, inicio, duracao in ultima.etapas],
+                                          columns=["Etapa", "Início (ms)", "Duração (ms)"]), hide_index=True)
+            st.markdown(f"Últimas {len(desempenho.execucoes())} execuções (todas as sessões):")
+            st.dataframe(desempenho.resumo())
 
     # Formulário
     st.subheader("➕ Adicionar Novo Paciente")
@@ -181,12 +281,7 @@ if "usuario" in st.session_state:
         nome = st.text_input("Nome")
         carteirinha = st.text_input("Nº da Carteirinha")
         data_contato = st.date_input("Data do Primeiro Contato", datetime.today())
-        especialidade = st.selectbox("Especialidade", [
-            "Fisioterapia Traumato-Ortopédica", "Fisioterapia Neurofuncional",
-            "Fisioterapia Uroginecológica", "Reeducação Postural Global",
-            "Disfunção Temporomandibular", "Acupuntura", "Fonoaudiologia",
-            "Psicologia", "Terapia Ocupacional"
-        ])
+        especialidade = st.selectbox("Especialidade", ESPECIALIDADES)
         telefone = st.text_input("Telefone")
         horario = st.radio("Turno Preferido", ["Manhã", "Tarde", "Indiferente"])
         preferencia = st.radio("Preferência por Profissional?", ["Não", "Sim"])
@@ -203,40 +298,138 @@ if "usuario" in st.session_state:
             horario_atend = st.text_input("Horário de Atendimento")
             data_inicio = st.date_input("Data de Início")
 
+        acao_duplicado = st.radio("Se a carteirinha já estiver na lista de espera",
+                                  ["Recusar", "Atualizar cadastro existente"])
+
         enviar = st.form_submit_button("Salvar Paciente")
         if enviar:
-            dias = calcular_dias_espera(data_contato)
+            # Só quem já sai com vaga grava os dias de espera (os do dia da
+            # vaga); para quem fica na lista o valor é calculado a cada dia
+            dias = calcular_dias_espera(data_contato) if vaga == "Sim" else None
             agora = datetime.now().strftime("%d/%m/%Y %H:%M")
-            novo = pd.DataFrame([[nome, carteirinha, data_contato, dias, especialidade, telefone, horario,
-                                  preferencia, prof_indicado, usuario_atual, agora, vaga, prof_resp,
-                                  horario_atend, data_inicio]], columns=colunas_padrao)
-
-            if vaga == "Sim":
-                st.session_state.atendidos = pd.concat([st.session_state.atendidos, novo], ignore_index=True)
-                st.success("Paciente movido para atendidos.")
+            registro = dict(zip(colunas_padrao, [nome, carteirinha, data_contato, dias, especialidade, telefone, horario,
+                                                 preferencia, prof_indicado, usuario_atual, agora, vaga, prof_resp,
+                                                 horario_atend, data_inicio]))
+            duplicados = "mesclar" if acao_duplicado == "Atualizar cadastro existente" else "rejeitar"
+
+            try:
+                operacao = adicionar_paciente("atendidos" if vaga == "Sim" else "dados", registro, duplicados)
+            except CarteirinhaDuplicada as erro:
+                existente = carregar_dados()[0].loc[erro.ids[0]]
+                st.error(f"{erro} ({existente['Nome']} - {existente['Especialidade']}).")
             else:
-                st.session_state.dados = pd.concat([st.session_state.dados, novo], ignore_index=True)
-                st.success("Paciente adicionado à lista de espera.")
-            salvar_dados()
-
-    # Atualiza dias de espera
-    st.session_state.dados["Dias de Espera"] = st.session_state.dados["Data 1º Contato"].apply(
-        lambda x: calcular_dias_espera(pd.to_datetime(x))
-    )
+                if operacao["op"] == "editar":
+                    st.success("Cadastro existente atualizado.")
+                elif vaga == "Sim":
+                    st.success("Paciente movido para atendidos.")
+                else:
+                    st.success("Paciente adicionado à lista de espera.")
+
+    # Importação em lote: o arquivo é lido e validado em blocos e os pacientes
+    # válidos são gravados com uma única operação no armazenamento
+    with st.expander("📥 Importar Pacientes em Lote"):
+        st.caption("Arquivo CSV ou XLSX com cabeçalho nas colunas da lista de espera. "
+                   "Obrigatórios: Nome, Especialidade e Data 1º Contato.")
+        arquivo_importacao = st.file_uploader("Arquivo", type=["csv", "xlsx"], key="arquivo_importacao")
+        tudo_ou_nada = st.checkbox("Não importar nada se alguma linha tiver erro", value=True)
+        if arquivo_importacao is not None and st.button("Importar"):
+            try:
+                cache.obter()
+                registros, erros = preparar_importacao(
+                    arquivo_importacao, arquivo_importacao.name, usuario_atual,
+                    lambda c: bool(cache.indice.ids_em(c, "dados")))
+            except ErroImportacao as erro:
+                st.error(str(erro))
+            else:
+                if erros and (tudo_ou_nada or registros.empty):
+                    st.error(f"Nenhum paciente importado: {len(erros)} linha(s) com erro.")
+                else:
+                    if not registros.empty:
+                        registrar_operacao(operacao_lote(registros))
+                    st.success(f"{len(registros)} paciente(s) importado(s).")
+                if erros:
+                    st.dataframe(pd.DataFrame(erros, columns=["Linha", "Erro"]), hide_index=True)
+
+    # Dias de espera já materializados para hoje: só são recalculados na virada
+    # do dia ou para as linhas que mudaram
+    hoje = hoje_referencia()
+    espera, atendidos = carregar_dados()
+    with execucao.etapa("dias_espera"):
+        espera = cache.dias_espera.tabela(espera, hoje)
+
+    # Indicadores mantidos a cada operação: o custo não depende do tamanho da lista
+    with st.expander("📊 Indicadores"):
+        resumo_espera = cache.estatisticas.resumo(hoje)
+        col_i1, col_i2 = st.columns(2)
+        col_i1.metric("Pacientes em espera", int(resumo_espera["Pacientes"].sum()))
+        col_i2.metric("Maior espera (dias)", int(resumo_espera["Maior Espera (dias)"].max())
+                      if resumo_espera["Maior Espera (dias)"].notna().any() else "-")
+        st.dataframe(resumo_espera, hide_index=True)
+        st.markdown("**Admissões por semana**")
+        st.bar_chart(cache.estatisticas.admissoes_por_semana(hoje=hoje))
+        st.markdown("**Percentis da espera (dias)**")
+        periodo = st.selectbox("Atendidos com início em", ["Últimos 12 meses", "Todo o histórico"],
+                               key="periodo_percentis")
+        desde = (hoje - pd.DateOffset(months=11)).strftime("%Y-%m") if periodo == "Últimos 12 meses" else None
+        st.dataframe(cache.estatisticas.percentis(hoje=hoje, desde=desde), hide_index=True)
+
+    # Próximos da fila de uma especialidade, direto das filas de prioridade
+    st.subheader("📣 Próximos a Chamar")
+    col_prox1, col_prox2, col_prox3 = st.columns([3, 2, 1])
+    prox_especialidade = col_prox1.selectbox("Especialidade da vaga", ESPECIALIDADES)
+    prox_turno = col_prox2.selectbox("Turno da vaga", ["Qualquer", "Manhã", "Tarde"])
+    prox_quantidade = col_prox3.number_input("Quantos", min_value=1, max_value=50, value=5)
+    prox_priorizar = st.checkbox("Chamar antes quem pediu exatamente esse turno",
+                                 disabled=prox_turno == "Qualquer",
+                                 help="Sem marcar, quem escolheu \"Indiferente\" entra pela data do 1º contato")
+    prox_ids = [i for i in cache.filas.proximos(prox_especialidade, int(prox_quantidade),
+                                                None if prox_turno == "Qualquer" else prox_turno,
+                                                priorizar_turno=prox_priorizar)
+                if i in espera.index]
+    if prox_ids:
+        st.dataframe(espera.loc[prox_ids, ["Nome", "Nº Carteirinha", "Telefone", "Data 1º Contato",
+                                           "Dias de Espera", "Horário Preferencial", "Profissional Indicado"]])
+    else:
+        st.info("Nenhum paciente aguardando nessa especialidade e turno.")
 
     # Tabelas
     st.subheader("🕐 Pacientes em Espera")
-    st.subheader("🕐 Pacientes em Espera")
-
-for i, row in st.session_state.dados.iterrows():
-    with st.expander(f"{row['Nome']} - {row['Especialidade']}"):
+    col_filtro1, col_filtro2 = st.columns(2)
+    filtro_especialidade = col_filtro1.selectbox("Filtrar por Especialidade", ["Todas"] + ESPECIALIDADES)
+    filtro_carteirinha = col_filtro2.text_input("Buscar por Nº da Carteirinha")
+    espera_filtrada = filtrar_espera(
+        espera,
+        None if filtro_especialidade == "Todas" else filtro_especialidade,
+        filtro_carteirinha.strip() or None)
+    if filtro_carteirinha.strip():
+        ja_atendidos = cache.indice.ids_em(filtro_carteirinha, "atendidos")
+        if ja_atendidos:
+            st.info(f"Carteirinha {filtro_carteirinha.strip()} já consta em atendidos ({len(ja_atendidos)} registro(s)).")
+
+    # Só a página visível é desenhada e só o paciente selecionado ganha o
+    # formulário de vaga, então a tela não cresce com o tamanho da lista
+    with execucao.etapa("estilo"):
+        selecionado = lista_paginada(
+            espera_filtrada, "espera", colunas=COLUNAS_LISTA_ESPERA,
+            chave_estilo=(cache.versao, hoje, filtro_especialidade, filtro_carteirinha))
+
+    if selecionado is not None:
+        i, row = selecionado
         col1, col2, col3 = st.columns(3)
-        col1.markdown(f"📅 Esperando desde: **{row['Data 1º Contato'].strftime('%d/%m/%Y')}**")
+        data_contato = row["Data 1º Contato"]
+        col1.markdown(f"📅 Esperando desde: **{data_contato.strftime('%d/%m/%Y') if pd.notna(data_contato) else '-'}**")
         col2.markdown(f"📞 Telefone: **{row['Telefone']}**")
         col3.markdown(f"🕐 Preferência: **{row['Horário Preferencial']}**")
-
-        if "editar_espera" in st.session_state.usuarios[usuario_atual]["permissoes"]:
-            with st.form(f"alocar_form_{i}"):
+        previsao = cache.previsao.paciente(i, hoje)
+        if previsao is not None:
+            estimativa = (previsao["data"].strftime("%d/%m/%Y") if pd.notna(previsao["data"])
+                          else "sem admissões recentes na especialidade")
+            st.markdown(f"📆 Posição na fila: **{previsao['posicao']} de {previsao['na_fila']}** · "
+                        f"Previsão de vaga: **{estimativa}**")
+
+        if tem_permissao(usuario_atual, "editar_espera"):
+            esperado = identidade_exibida("identidade_vaga", espera_filtrada, [i])[0]
+            with st.form("alocar_form"):
                 st.markdown("### 📌 Marcar Vaga Encontrada")
                 prof_resp = st.text_input("Profissional Responsável", key=f"prof_{i}")
                 horario_atend = st.text_input("Horário de Atendimento", key=f"horario_{i}")
@@ -245,35 +438,186 @@ for i, row in st.session_state.dados.iterrows():
 
                 if confirmar:
                     agora = datetime.now().strftime("%d/%m/%Y %H:%M")
-                    row_data = row.copy()
-                    row_data["Profissional Responsável"] = prof_resp
-                    row_data["Horário Atendimento"] = horario_atend
-                    row_data["Data de Início"] = data_inicio
-                    row_data["Vaga Concedida"] = "Sim"
-                    row_data["Data Registro"] = agora
-                    row_data["Registrado Por"] = usuario_atual
-
-                    st.session_state.atendidos = pd.concat([st.session_state.atendidos, pd.DataFrame([row_data])], ignore_index=True)
-                    st.session_state.dados.drop(index=i, inplace=True)
-                    st.success(f"Paciente {row['Nome']} movido para atendidos.")
-                    salvar_dados()
-                    st.experimental_rerun()
-
+                    try:
+                        registrar_operacao({"op": "mover", "id": i, "esperado": esperado, "campos": {
+                            "Dias de Espera": dias_para_gravar(row["Dias de Espera"]),
+                            "Profissional Responsável": prof_resp,
+                            "Horário Atendimento": horario_atend,
+                            "Data de Início": data_inicio,
+                            "Vaga Concedida": "Sim",
+                            "Data Registro": agora,
+                            "Registrado Por": usuario_atual,
+                        }})
+                    except ConflitoEdicao as erro:
+                        st.error(f"Vaga não registrada: {erro} Atualize a página para ver a lista atual.")
+                    else:
+                        st.success(f"Paciente {row['Nome']} movido para atendidos.")
+                        st.rerun()
+
+    # Alocação em lote: vários pacientes vão para atendidos em uma única
+    # operação e uma única gravação
+    if tem_permissao(usuario_atual, "editar_espera"):
+        with st.expander("👥 Alocação em Lote"):
+            candidatos = espera_filtrada.head(LIMITE_ALOCACAO_LOTE)
+            if len(espera_filtrada) > LIMITE_ALOCACAO_LOTE:
+                st.caption(f"Exibindo os {LIMITE_ALOCACAO_LOTE} primeiros da lista filtrada; "
+                           "use os filtros para chegar aos demais.")
+            ids_lote = st.multiselect(
+                "Pacientes", list(candidatos.index), key="ids_lote",
+                format_func=lambda i: f"{candidatos.at[i, 'Nome']} - {candidatos.at[i, 'Especialidade']}")
+            col_l1, col_l2, col_l3 = st.columns(3)
+            prof_lote = col_l1.text_input("Profissional Responsável", key="prof_lote")
+            horario_lote = col_l2.text_input("Horário de Atendimento", key="horario_lote")
+            inicio_lote = col_l3.date_input("Data de Início", key="inicio_lote")
+            st.caption("Campos em branco na tabela usam os valores acima.")
+            por_paciente = st.data_editor(
+                pd.DataFrame({"Nome": candidatos.loc[ids_lote, "Nome"].astype(str),
+                              "Profissional Responsável": "", "Horário Atendimento": "",
+                              "Data de Início": pd.Series(pd.NaT, index=ids_lote)}, index=ids_lote),
+                disabled=["Nome"], key=f"editor_lote_{'_'.join(map(str, ids_lote))}")
+            esperados_lote = identidade_exibida("identidade_lote", candidatos, ids_lote)
+
+            if st.button("Confirmar Vagas", disabled=not ids_lote):
+                agora = datetime.now().strftime("%d/%m/%Y %H:%M")
+                campos = []
+                for id_ in ids_lote:
+                    linha = por_paciente.loc[id_]
+                    campos.append({
+                        "Dias de Espera": dias_para_gravar(candidatos.at[id_, "Dias de Espera"]),
+                        "Profissional Responsável": linha["Profissional Responsável"] or prof_lote,
+                        "Horário Atendimento": linha["Horário Atendimento"] or horario_lote,
+                        "Data de Início": linha["Data de Início"] if pd.notna(linha["Data de Início"]) else inicio_lote,
+                        "Vaga Concedida": "Sim",
+                        "Data Registro": agora,
+                        "Registrado Por": usuario_atual,
+                    })
+                try:
+                    registrar_operacao({"op": "mover_lote", "ids": [int(i) for i in ids_lote], "campos": campos,
+                                        "esperados": esperados_lote})
+                except ConflitoEdicao as erro:
+                    # Nada foi gravado: o lote inteiro volta para revisão
+                    st.error(f"Vagas não registradas: {erro} Revise a seleção.")
+                else:
+                    del st.session_state["ids_lote"]
+                    st.success(f"{len(ids_lote)} paciente(s) movido(s) para atendidos.")
+                    st.rerun()
+
+    # Vagas abertas pelos profissionais e alocação automática: o motor escolhe
+    # quem recebe cada vaga maximizando o tempo de espera atendido
+    if tem_permissao(usuario_atual, "editar_espera"):
+        with st.expander("🧩 Vagas Abertas e Alocação Automática"):
+            with st.form("nova_vaga"):
+                col_v1, col_v2, col_v3 = st.columns(3)
+                vaga_profissional = col_v1.text_input("Profissional")
+                vaga_especialidade = col_v2.selectbox("Especialidade", ESPECIALIDADES, key="vaga_especialidade")
+                vaga_turno = col_v3.radio("Turno", ["Manhã", "Tarde"], key="vaga_turno")
+                col_v4, col_v5, col_v6 = st.columns(3)
+                vaga_horario = col_v4.text_input("Horário (ex.: seg/qua 08:00)")
+                vaga_inicio = col_v5.date_input("Data de Início", key="vaga_inicio")
+                vaga_quantidade = col_v6.number_input("Quantidade", min_value=1, max_value=100, value=1, step=1)
+                if st.form_submit_button("Abrir Vagas"):
+                    if vaga_profissional.strip():
+                        abrir_vagas({"Profissional": vaga_profissional.strip(), "Especialidade": vaga_especialidade,
+                                     "Turno": vaga_turno, "Horário": vaga_horario.strip(),
+                                     "Data de Início": vaga_inicio.isoformat()}, int(vaga_quantidade))
+                        st.success(f"{int(vaga_quantidade)} vaga(s) aberta(s).")
+                    else:
+                        st.error("Informe o profissional.")
+
+            vagas_abertas = carregar_vagas()
+            if vagas_abertas:
+                st.dataframe(pd.DataFrame(vagas_abertas)[CAMPOS_VAGA], hide_index=True)
+                col_a1, col_a2 = st.columns([3, 1])
+                fechar = col_a1.multiselect(
+                    "Fechar vagas", [v["id"] for v in vagas_abertas],
+                    format_func=lambda v: next(f"{x['Profissional']} - {x['Especialidade']} - {x['Turno']} ({x['Data de Início']})"
+                                               for x in vagas_abertas if x["id"] == v))
+                if col_a2.button("Fechar", disabled=not fechar):
+                    fechar_vagas(fechar)
+                    st.rerun()
+
+                respeitar_profissional = st.checkbox("Respeitar profissional indicado pelo paciente", value=True)
+                if st.button("Calcular Alocação"):
+                    st.session_state.proposta_alocacao = alocar_vagas(espera, vagas_abertas, respeitar_profissional)
+
+                # A proposta continua valendo se a lista mudar em outras sessões:
+                # só saem dela as vagas fechadas e os pacientes que já saíram da espera
+                resultado = st.session_state.get("proposta_alocacao")
+                if resultado is not None:
+                    vagas_por_id = {v["id"]: v for v in vagas_abertas}
+                    resultado = resultado[resultado["vaga"].isin(vagas_por_id) & resultado["id"].isin(espera.index)]
+                    esperados_alocacao = identidade_exibida("identidade_alocacao", espera, list(resultado["id"]))
+                    st.markdown(f"**{len(resultado)}** de {len(vagas_abertas)} vaga(s) preenchida(s), "
+                                f"somando **{int(resultado['Dias de Espera'].sum())}** dias de espera.")
+                    st.dataframe(pd.DataFrame({
+                        "Paciente": espera.loc[resultado["id"], "Nome"].astype(str).to_numpy(),
+                        "Especialidade": espera.loc[resultado["id"], "Especialidade"].astype(str).to_numpy(),
+                        "Dias de Espera": resultado["Dias de Espera"].to_numpy(),
+                        "Profissional": [vagas_por_id[v]["Profissional"] for v in resultado["vaga"]],
+                        "Turno": [vagas_por_id[v]["Turno"] for v in resultado["vaga"]],
+                        "Início": [vagas_por_id[v]["Data de Início"] for v in resultado["vaga"]],
+                    }), hide_index=True)
+                    if st.button("Confirmar Alocação", disabled=resultado.empty):
+                        agora = datetime.now().strftime("%d/%m/%Y %H:%M")
+                        try:
+                            registrar_operacao({"op": "mover_lote", "ids": [int(i) for i in resultado["id"]],
+                                                "campos": [campos_da_vaga(vagas_por_id[v], usuario_atual, agora, dias)
+                                                           for v, dias in zip(resultado["vaga"],
+                                                                              resultado["Dias de Espera"])],
+                                                "esperados": esperados_alocacao})
+                        except ConflitoEdicao as erro:
+                            st.error(f"Alocação não registrada: {erro} Calcule a alocação novamente.")
+                        else:
+                            fechar_vagas(resultado["vaga"])
+                            del st.session_state.proposta_alocacao
+                            st.success(f"{len(resultado)} paciente(s) alocado(s).")
+                            st.rerun()
+            else:
+                st.caption("Nenhuma vaga aberta.")
 
     st.subheader("✅ Pacientes Atendidos")
-    st.dataframe(st.session_state.atendidos)
+    st.dataframe(atendidos)
 
     # Exportar Excel com duas abas
     st.subheader("📥 Exportar Dados")
-    from io import BytesIO
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        st.session_state.dados.to_excel(writer, sheet_name="Em Espera", index=False)
-        st.session_state.atendidos.to_excel(writer, sheet_name="Atendidos", index=False)
-    st.download_button("📤 Baixar Excel", data=output.getvalue(), file_name="lista_reabilitacao.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    # O arquivo só é gerado quando alguém pede e fica em cache para a versão
+    # atual dos dados; reexecuções comuns da página não pagam por ele
+    versao_exportacao = (cache.versao, hoje)
+    if excel_disponivel(versao_exportacao) or st.button("⚙️ Gerar Excel"):
+        with execucao.etapa("exportar"):
+            conteudo_excel = excel_em_cache(versao_exportacao, espera, atendidos)
+        st.download_button("📤 Baixar Excel", data=conteudo_excel, file_name="lista_reabilitacao.xlsx", mime=MIME_XLSX)
+
+    # Para listas muito grandes: o arquivo é escrito em blocos em um arquivo
+    # temporário (memória constante), opcionalmente comprimido
+    with st.expander("📦 Exportação de listas grandes"):
+        formato = st.selectbox("Formato", list(FORMATOS_STREAMING))
+        if st.button("⚙️ Gerar arquivo"):
+            with execucao.etapa("exportar"):
+                caminho = arquivo_em_cache(versao_exportacao, formato, espera, atendidos)
+            extensao, mime = FORMATOS_STREAMING[formato]
+            with open(caminho, "rb") as arquivo:
+                st.download_button("📤 Baixar arquivo", data=arquivo, file_name="lista_reabilitacao" + extensao, mime=mime)
 
     # Histórico
     if perfil == "Administrador":
         st.subheader("📜 Histórico de Registros")
-        historico = pd.concat([st.session_state.dados, st.session_state.atendidos])
-        st.dataframe(historico[["Nome", "Especialidade", "Registrado Por", "Data Registro", "Vaga Concedida"]])
+        with execucao.etapa("historico"):
+            historico = concatenar([espera, atendidos])
+            st.dataframe(historico[["Nome", "Especialidade", "Registrado Por", "Data Registro", "Vaga Concedida"]])
+
+        # Lista reconstruída a partir das fotografias diárias
+        with st.expander("🕰️ Lista em uma Data Anterior"):
+            datas_historico = cache.historico.datas()
+            if datas_historico:
+                data_consulta = st.date_input("Data", value=datas_historico[-1], min_value=datas_historico[0],
+                                              max_value=hoje.date(), key="data_historico")
+                with execucao.etapa("historico"):
+                    espera_na_data, atendidos_na_data = cache.historico.em(data_consulta)
+                st.caption(f"Estado no início de {data_consulta.strftime('%d/%m/%Y')}: "
+                           f"{len(espera_na_data)} em espera, {len(atendidos_na_data)} atendidos.")
+                st.dataframe(espera_na_data[[c for c in COLUNAS_LISTA_ESPERA if c != "Dias de Espera"]])
+            else:
+                st.caption("Nenhuma fotografia gravada ainda.")
+
+execucao.finalizar()
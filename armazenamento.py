@@ -0,0 +1,814 @@
+# Armazenamento da lista de espera e dos pacientes atendidos
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+from esquema import aplicar_esquema, atribuir_coluna, colunas_padrao, concatenar
+
+# ============================
+# CONFIGURAÇÃO
+# ============================
+
+DATA_FILE_ESPERA = "data_espera.csv"
+DATA_FILE_ATENDIDOS = "data_atendidos.csv"
+DATA_FILE_DIARIO = "data_diario.jsonl"
+DATA_FILE_SQLITE = "data_lista_espera.db"
+
+# Número de operações no diário antes de consolidar em um novo snapshot
+LIMITE_COMPACTACAO = 500
+
+COLUNA_ID = "_id"
+TABELAS = ("dados", "atendidos")
+
+# ============================
+# OPERAÇÕES SOBRE OS DADOS
+# ============================
+# Cada alteração é descrita por um dicionário ("operação"):
+#   {"op": "adicionar", "tabela": "dados", "id": 7, "registro": {...}}
+#   {"op": "mover", "id": 7, "campos": {...}}          (dados -> atendidos)
+#   {"op": "editar", "tabela": "dados", "id": 7, "campos": {...}}
+#   {"op": "remover", "tabela": "dados", "id": 7}
+#   {"op": "adicionar_lote", "tabela": "dados", "ids": [7, 8], "registros": [{...}, {...}]}
+#   {"op": "mover_lote", "ids": [7, 8], "campos": [{...}, {...}]}   (dados -> atendidos)
+# A mesma função aplica a operação na memória da sessão e na reconstrução do
+# diário. Todas são idempotentes, então reaplicar uma operação não duplica linhas.
+# No diário, "mover" e "mover_lote" levam também a linha completa já movida
+# ("registro" / "registros"), para que a reaplicação a recupere mesmo se ela
+# não estiver em nenhum dos snapshots (queda entre a troca dos dois arquivos).
+#
+# "editar", "mover" e "remover" podem levar "esperado": {coluna: valor lido},
+# os valores que a sessão viu antes de alterar ("mover_lote" leva "esperados",
+# um por id). Na gravação, verificar_conflito() compara com o estado atual
+# (controle otimista). Saídas da lista mandam as colunas de COLUNAS_IDENTIDADE
+# (valores_lidos()), para que um id que hoje aponta para outro paciente não
+# seja movido no lugar do que a sessão viu.
+
+def novo_id(dados, atendidos):
+    maiores = [int(df.index.max()) for df in (dados, atendidos) if len(df)]
+    return max(maiores) + 1 if maiores else 0
+
+def _linha(id_, registro):
+    return aplicar_esquema(pd.DataFrame([registro], index=[id_]))
+
+def _inserir(df, id_, registro):
+    if id_ in df.index:
+        df = df.drop(index=id_)
+    return concatenar([df, _linha(id_, registro)])
+
+def _editar(df, id_, campos):
+    return _editar_varios(df, {id_: campos})
+
+# Edita várias linhas com uma única cópia da tabela e uma atribuição por coluna
+def _editar_varios(df, campos_por_id):
+    df = df.copy()
+    por_coluna = {}
+    for id_, campos in campos_por_id.items():
+        for coluna, valor in campos.items():
+            ids, valores = por_coluna.setdefault(coluna, ([], []))
+            ids.append(id_)
+            valores.append(valor)
+    for coluna, (ids, valores) in por_coluna.items():
+        atribuir_coluna(df, ids, coluna, valores)
+    return df
+
+def aplicar_operacao(dados, atendidos, operacao):
+    tipo = operacao["op"]
+    tabelas = {"dados": dados, "atendidos": atendidos}
+
+    if tipo == "adicionar":
+        tabela = operacao["tabela"]
+        tabelas[tabela] = _inserir(tabelas[tabela], operacao["id"], operacao["registro"])
+
+    elif tipo == "mover":
+        id_ = operacao["id"]
+        if id_ in dados.index:
+            registro = dados.loc[id_].to_dict()
+            registro.update(operacao["campos"])
+            tabelas["dados"] = dados.drop(index=id_)
+            tabelas["atendidos"] = _inserir(atendidos, id_, registro)
+        elif id_ in atendidos.index:
+            tabelas["atendidos"] = _editar(atendidos, id_, operacao["campos"])
+        elif operacao.get("registro") is not None:
+            tabelas["atendidos"] = _inserir(atendidos, id_, operacao["registro"])
+
+    elif tipo == "editar":
+        tabela = operacao["tabela"]
+        if operacao["id"] in tabelas[tabela].index:
+            tabelas[tabela] = _editar(tabelas[tabela], operacao["id"], operacao["campos"])
+
+    elif tipo == "remover":
+        df = tabelas[operacao["tabela"]]
+        if operacao["id"] in df.index:
+            tabelas[operacao["tabela"]] = df.drop(index=operacao["id"])
+
+    elif tipo == "adicionar_lote":
+        tabela = operacao["tabela"]
+        df = tabelas[tabela]
+        df = df.drop(index=df.index.intersection(operacao["ids"]))
+        novos = aplicar_esquema(pd.DataFrame(operacao["registros"], index=operacao["ids"]))
+        tabelas[tabela] = concatenar([df, novos])
+
+    elif tipo == "mover_lote":
+        campos = dict(zip(operacao["ids"], operacao["campos"]))
+        em_espera = [id_ for id_ in campos if id_ in dados.index]
+        ja_atendidos = {id_: c for id_, c in campos.items() if id_ not in dados.index and id_ in atendidos.index}
+        registros = dict(zip(operacao["ids"], operacao.get("registros") or []))
+        perdidos = [id_ for id_ in campos
+                    if id_ not in dados.index and id_ not in atendidos.index and registros.get(id_) is not None]
+        movidos = _editar_varios(dados.loc[em_espera], {id_: campos[id_] for id_ in em_espera})
+        if ja_atendidos:
+            atendidos = _editar_varios(atendidos, ja_atendidos)
+        frames = [atendidos.drop(index=atendidos.index.intersection(em_espera)), movidos]
+        if perdidos:
+            frames.append(aplicar_esquema(pd.DataFrame([registros[id_] for id_ in perdidos], index=perdidos)))
+        tabelas["dados"] = dados.drop(index=em_espera)
+        tabelas["atendidos"] = concatenar(frames)
+
+    else:
+        raise ValueError(f"Operação desconhecida: {tipo}")
+
+    return tabelas["dados"], tabelas["atendidos"]
+
+def _ids_da_operacao(operacao):
+    return operacao["ids"] if operacao["op"] in OPERACOES_EM_LOTE else [operacao["id"]]
+
+# Aplica uma sequência de operações (a reaplicação do diário) em blocos. Um
+# bloco junta operações seguidas sobre ids diferentes, que podem ser aplicadas
+# em qualquer ordem; cada bloco vira uma remoção, uma edição e uma inclusão por
+# tabela e um único mover_lote. Assim o esquema e a concatenação são pagos por
+# bloco, e não por operação.
+def aplicar_operacoes(dados, atendidos, operacoes):
+    bloco, tocados = [], set()
+    for operacao in operacoes:
+        ids = _ids_da_operacao(operacao)
+        if tocados.intersection(ids):
+            dados, atendidos = _aplicar_bloco(dados, atendidos, bloco)
+            bloco, tocados = [], set()
+        bloco.append(operacao)
+        tocados.update(ids)
+    if bloco:
+        dados, atendidos = _aplicar_bloco(dados, atendidos, bloco)
+    return dados, atendidos
+
+def _aplicar_bloco(dados, atendidos, bloco):
+    if len(bloco) == 1:
+        return aplicar_operacao(dados, atendidos, bloco[0])
+    remover = {tabela: [] for tabela in TABELAS}
+    editar = {tabela: {} for tabela in TABELAS}
+    adicionar = {tabela: {} for tabela in TABELAS}
+    mover = {"ids": [], "campos": [], "registros": []}
+    for operacao in bloco:
+        tipo = operacao["op"]
+        if tipo == "remover":
+            remover[operacao["tabela"]].append(operacao["id"])
+        elif tipo == "editar":
+            editar[operacao["tabela"]][operacao["id"]] = operacao["campos"]
+        elif tipo == "adicionar":
+            adicionar[operacao["tabela"]][operacao["id"]] = operacao["registro"]
+        elif tipo == "adicionar_lote":
+            adicionar[operacao["tabela"]].update(zip(operacao["ids"], operacao["registros"]))
+        elif tipo == "mover":
+            mover["ids"].append(operacao["id"])
+            mover["campos"].append(operacao["campos"])
+            mover["registros"].append(operacao.get("registro"))
+        elif tipo == "mover_lote":
+            mover["ids"] += operacao["ids"]
+            mover["campos"] += operacao["campos"]
+            mover["registros"] += operacao.get("registros") or [None] * len(operacao["ids"])
+        else:
+            raise ValueError(f"Operação desconhecida: {tipo}")
+
+    tabelas = {"dados": dados, "atendidos": atendidos}
+    for tabela in TABELAS:
+        df = tabelas[tabela]
+        if remover[tabela]:
+            df = df.drop(index=df.index.intersection(remover[tabela]))
+        campos = {id_: c for id_, c in editar[tabela].items() if id_ in df.index}
+        if campos:
+            df = _editar_varios(df, campos)
+        tabelas[tabela] = df
+    for tabela in TABELAS:
+        if adicionar[tabela]:
+            tabelas["dados"], tabelas["atendidos"] = aplicar_operacao(tabelas["dados"], tabelas["atendidos"], {
+                "op": "adicionar_lote", "tabela": tabela,
+                "ids": list(adicionar[tabela]), "registros": list(adicionar[tabela].values())})
+    if mover["ids"]:
+        tabelas["dados"], tabelas["atendidos"] = aplicar_operacao(tabelas["dados"], tabelas["atendidos"],
+                                                                  dict(mover, op="mover_lote"))
+    return tabelas["dados"], tabelas["atendidos"]
+
+# ============================
+# CONFLITOS ENTRE SESSÕES
+# ============================
+
+class ConflitoEdicao(ValueError):
+    def __init__(self, mensagem, ids=(), colunas=()):
+        super().__init__(mensagem)
+        self.ids = list(ids)
+        self.colunas = list(colunas)
+
+# Colunas que identificam o paciente que a sessão viu
+COLUNAS_IDENTIDADE = ["Nº Carteirinha", "Data 1º Contato"]
+
+# {coluna: valor} de cada id, como a sessão leu, para "esperado"/"esperados"
+def valores_lidos(df, ids, colunas=COLUNAS_IDENTIDADE):
+    linhas = df.loc[list(ids), colunas]
+    return linhas.astype(object).where(linhas.notna(), None).to_dict("records")
+
+def _mesmo_valor(a, b):
+    vazio_a = a is None or (not isinstance(a, str) and pd.isna(a))
+    vazio_b = b is None or (not isinstance(b, str) and pd.isna(b))
+    if vazio_a or vazio_b:
+        return vazio_a and vazio_b
+    if isinstance(a, (datetime, date, pd.Timestamp)) or isinstance(b, (datetime, date, pd.Timestamp)):
+        return pd.Timestamp(a) == pd.Timestamp(b)
+    return str(a) == str(b)
+
+# Colunas de "esperado" que mudaram desde a leitura. Em uma edição só contam
+# as colunas que ela altera; em saídas da lista (todas=True), qualquer uma
+def _colunas_alteradas(df, id_, esperado, campos, todas):
+    return [coluna for coluna, lido in esperado.items()
+            if not _mesmo_valor(df.at[id_, coluna], lido)
+            and not (coluna in campos and _mesmo_valor(df.at[id_, coluna], campos[coluna]))
+            and (todas or coluna in campos)]
+
+# Chamada na gravação, com o estado mais recente, antes de aplicar a operação.
+# Mescla em nível de coluna: só há conflito se uma coluna que a edição altera
+# mudou desde a leitura para um valor diferente do novo. Alterações de outras
+# sessões em outras colunas são preservadas. Em "mover" e "remover" qualquer
+# coluna de "esperado" alterada é conflito. Levanta ConflitoEdicao.
+def verificar_conflito(dados, atendidos, operacao):
+    tipo = operacao["op"]
+    if tipo in ("mover", "mover_lote"):
+        ids = [operacao["id"]] if tipo == "mover" else operacao["ids"]
+        fora = [id_ for id_ in ids if id_ not in dados.index]
+        if fora:
+            raise ConflitoEdicao(f"{len(fora)} paciente(s) já saíram da lista de espera em outra sessão.", fora)
+    if tipo == "mover_lote":
+        esperados = operacao.get("esperados") or [{}] * len(operacao["ids"])
+        alterados, colunas = [], []
+        for id_, esperado, campos in zip(operacao["ids"], esperados, operacao["campos"]):
+            conflitos = _colunas_alteradas(dados, id_, esperado, campos, True)
+            if conflitos:
+                alterados.append(id_)
+                colunas += [c for c in conflitos if c not in colunas]
+        if alterados:
+            raise ConflitoEdicao(f"{len(alterados)} paciente(s) alterado(s) em outra sessão: {', '.join(colunas)}.",
+                                 alterados, colunas)
+        return
+    if tipo not in ("editar", "mover", "remover"):
+        return
+    df = dados if tipo == "mover" else {"dados": dados, "atendidos": atendidos}[operacao["tabela"]]
+    id_ = operacao["id"]
+    if id_ not in df.index:
+        if tipo == "remover":
+            return
+        raise ConflitoEdicao("O registro foi removido em outra sessão.", [id_])
+    conflitos = _colunas_alteradas(df, id_, operacao.get("esperado", {}), operacao.get("campos", {}),
+                                   tipo in ("mover", "remover"))
+    if conflitos:
+        raise ConflitoEdicao(f"Alterado em outra sessão: {', '.join(conflitos)}.", [id_], conflitos)
+
+# Trava exclusiva entre processos (arquivo .lock ao lado dos dados), mantida só
+# durante a verificação e a gravação de uma operação
+@contextmanager
+def trava_arquivo(caminho):
+    if fcntl is None:
+        yield
+        return
+    with open(caminho, "a") as arquivo:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+
+OPERACOES_EM_LOTE = ("adicionar_lote", "mover_lote")
+
+# Desdobra operações em lote nas operações individuais equivalentes, para quem
+# acompanha as alterações linha a linha (índices, filas, estatísticas)
+def expandir_operacao(operacao):
+    if operacao["op"] == "adicionar_lote":
+        for id_, registro in zip(operacao["ids"], operacao["registros"]):
+            yield {"op": "adicionar", "tabela": operacao["tabela"], "id": id_, "registro": registro}
+    elif operacao["op"] == "mover_lote":
+        registros = operacao.get("registros") or [None] * len(operacao["ids"])
+        for id_, campos, registro in zip(operacao["ids"], operacao["campos"], registros):
+            individual = {"op": "mover", "id": id_, "campos": campos}
+            if registro is not None:
+                individual["registro"] = registro
+            yield individual
+    else:
+        yield operacao
+
+# Linhas completas de df, prontas para JSON (vazios como None)
+def _registros(df, ids):
+    linhas = df.loc[ids, colunas_padrao]
+    return linhas.astype(object).where(linhas.notna(), None).to_dict("records")
+
+# Acrescenta às saídas da lista a linha completa em atendidos (já com os campos
+# da vaga), gravada no diário junto com a operação
+def com_linhas_movidas(operacao, atendidos):
+    if operacao["op"] == "mover" and operacao["id"] in atendidos.index:
+        return dict(operacao, registro=_registros(atendidos, [operacao["id"]])[0])
+    if operacao["op"] == "mover_lote":
+        ids = [id_ for id_ in operacao["ids"] if id_ in atendidos.index]
+        if len(ids) == len(operacao["ids"]):
+            return dict(operacao, registros=_registros(atendidos, ids))
+    return operacao
+
+# ============================
+# LEITURA E ESCRITA DE CSV
+# ============================
+
+def _ler_csv(caminho):
+    if not os.path.exists(caminho):
+        return aplicar_esquema(pd.DataFrame(columns=colunas_padrao))
+    # Carteirinha e telefone são identificadores: lidos como texto para não
+    # virarem float (123.0) nem perderem zeros à esquerda
+    df = pd.read_csv(caminho, dtype={"Nº Carteirinha": str, "Telefone": str})
+    if COLUNA_ID in df.columns:
+        df = df.set_index(COLUNA_ID)
+        df.index.name = None
+    return aplicar_esquema(df)
+
+def _atribuir_ids(dados, atendidos):
+    # CSVs antigos não guardam identificador: numera as duas tabelas em sequência
+    dados = dados.reset_index(drop=True)
+    atendidos = atendidos.reset_index(drop=True)
+    atendidos.index = atendidos.index + len(dados)
+    return dados, atendidos
+
+def _gravar_csv_atomico(df, caminho):
+    temporario = caminho + ".tmp"
+    df.to_csv(temporario, index=True, index_label=COLUNA_ID)
+    os.replace(temporario, caminho)
+
+def _assinatura_arquivos(*caminhos):
+    assinatura = []
+    for caminho in caminhos:
+        try:
+            info = os.stat(caminho)
+            assinatura.append((info.st_mtime_ns, info.st_size))
+        except FileNotFoundError:
+            assinatura.append(None)
+    return tuple(assinatura)
+
+def _serializar(valor):
+    if valor is pd.NaT:
+        return None
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, np.generic):
+        return valor.item()
+    raise TypeError(f"Valor não serializável: {valor!r}")
+
+# ============================
+# FILTROS
+# ============================
+
+# Filtro em memória, usado pelos modos que não têm consulta indexada
+def filtrar_pacientes(df, especialidade=None, carteirinha=None, desde=None, ate=None):
+    mascara = pd.Series(True, index=df.index)
+    if especialidade:
+        mascara &= df["Especialidade"] == especialidade
+    if carteirinha:
+        mascara &= df["Nº Carteirinha"].astype(str) == str(carteirinha)
+    if desde is not None:
+        mascara &= df["Data 1º Contato"] >= pd.Timestamp(desde)
+    if ate is not None:
+        mascara &= df["Data 1º Contato"] <= pd.Timestamp(ate)
+    return df[mascara]
+
+# ============================
+# BACKENDS
+# ============================
+
+# Modo original: reescreve os dois CSVs a cada alteração. Os CSVs guardam o
+# identificador de cada linha (coluna _id), então os ids valem entre processos
+# e reinícios; arquivos antigos, sem a coluna, são numerados na carga e
+# ganham a coluna na primeira gravação.
+class ArmazenamentoCSV:
+    modo = "csv"
+    suporta_consulta = False
+
+    def __init__(self, arquivo_espera=DATA_FILE_ESPERA, arquivo_atendidos=DATA_FILE_ATENDIDOS):
+        self.arquivo_espera = arquivo_espera
+        self.arquivo_atendidos = arquivo_atendidos
+
+    def carregar(self):
+        dados = _ler_csv(self.arquivo_espera)
+        atendidos = _ler_csv(self.arquivo_atendidos)
+        if not (self._tem_id(self.arquivo_espera) and self._tem_id(self.arquivo_atendidos)):
+            dados, atendidos = _atribuir_ids(dados, atendidos)
+        return dados, atendidos
+
+    def salvar(self, dados, atendidos):
+        _gravar_csv_atomico(dados, self.arquivo_espera)
+        _gravar_csv_atomico(atendidos, self.arquivo_atendidos)
+
+    def registrar(self, operacao, dados, atendidos):
+        self.salvar(dados, atendidos)
+
+    # Arquivos em disco deste armazenamento
+    def arquivos(self):
+        return [self.arquivo_espera, self.arquivo_atendidos]
+
+    def trava_escrita(self):
+        return trava_arquivo(self.arquivo_espera + ".lock")
+
+    # Muda sempre que os arquivos mudam; usada para invalidar caches
+    def versao_disco(self):
+        return _assinatura_arquivos(*self.arquivos())
+
+    @staticmethod
+    def _tem_id(caminho):
+        if not os.path.exists(caminho):
+            return True
+        with open(caminho, encoding="utf-8") as arquivo:
+            return arquivo.readline().split(",")[0].strip() == COLUNA_ID
+
+# Modo diário: cada alteração é acrescentada ao final de um arquivo JSONL e os
+# CSVs passam a ser snapshots, consolidados a cada LIMITE_COMPACTACAO operações.
+# O custo de salvar deixa de depender do tamanho da lista.
+class ArmazenamentoDiario(ArmazenamentoCSV):
+    modo = "diario"
+
+    def __init__(self, arquivo_espera=DATA_FILE_ESPERA, arquivo_atendidos=DATA_FILE_ATENDIDOS,
+                 arquivo_diario=DATA_FILE_DIARIO, limite_compactacao=LIMITE_COMPACTACAO):
+        super().__init__(arquivo_espera, arquivo_atendidos)
+        self.arquivo_diario = arquivo_diario
+        self.limite_compactacao = limite_compactacao
+        self.operacoes_pendentes = 0
+        self._trava = threading.RLock()
+
+    def carregar(self):
+        with self._trava:
+            dados, atendidos, snapshot_sem_id = self._reconstruir()
+            # Grava os identificadores já na primeira carga para que o diário
+            # continue válido mesmo que os CSVs antigos não os tivessem
+            if snapshot_sem_id and (len(dados) or len(atendidos)):
+                self._gravar_snapshot(dados, atendidos)
+        return dados, atendidos
+
+    def salvar(self, dados, atendidos):
+        with self._trava:
+            self._gravar_snapshot(dados, atendidos)
+
+    def registrar(self, operacao, dados, atendidos):
+        operacao = com_linhas_movidas(operacao, atendidos)
+        linha = json.dumps(operacao, default=_serializar, ensure_ascii=False) + "\n"
+        with self._trava:
+            with open(self.arquivo_diario, "a", encoding="utf-8") as arquivo:
+                arquivo.write(linha)
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+            self.operacoes_pendentes += 1
+            if self.operacoes_pendentes >= self.limite_compactacao:
+                # dados e atendidos já são o estado completo depois da
+                # operação, lido e gravado sob trava_escrita() (CacheDados):
+                # compacta a partir deles, sem reaplicar o diário
+                self._gravar_snapshot(dados, atendidos)
+
+    def compactar(self):
+        with self._trava:
+            self._compactar()
+
+    def arquivos(self):
+        return super().arquivos() + [self.arquivo_diario]
+
+    # Compactação avulsa: o snapshot é reconstruído a partir do disco, para não
+    # perder operações registradas por outros processos
+    def _compactar(self):
+        dados, atendidos, _ = self._reconstruir()
+        self._gravar_snapshot(dados, atendidos)
+
+    def _reconstruir(self):
+        dados, atendidos, snapshot_sem_id = self._ler_snapshot()
+        operacoes = list(self._ler_diario())
+        dados, atendidos = aplicar_operacoes(dados, atendidos, operacoes)
+        self.operacoes_pendentes = len(operacoes)
+        return dados, atendidos, snapshot_sem_id
+
+    # Formato do snapshot: CSV com a coluna de identificador. Subclasses podem
+    # trocar o formato sobrescrevendo _ler_snapshot e _escrever_snapshot.
+    def _ler_snapshot(self):
+        dados = _ler_csv(self.arquivo_espera)
+        atendidos = _ler_csv(self.arquivo_atendidos)
+        snapshot_sem_id = not (self._tem_id(self.arquivo_espera) and self._tem_id(self.arquivo_atendidos))
+        if snapshot_sem_id:
+            dados, atendidos = _atribuir_ids(dados, atendidos)
+        return dados, atendidos, snapshot_sem_id
+
+    def _escrever_snapshot(self, dados, atendidos):
+        _gravar_csv_atomico(dados, self.arquivo_espera)
+        _gravar_csv_atomico(atendidos, self.arquivo_atendidos)
+
+    def _gravar_snapshot(self, dados, atendidos):
+        self._escrever_snapshot(dados, atendidos)
+        # Se o processo cair entre a troca dos dois arquivos ou antes da
+        # limpeza, a reaplicação do diário é inofensiva: as operações são
+        # idempotentes e as saídas da lista levam a linha completa
+        open(self.arquivo_diario, "w", encoding="utf-8").close()
+        self.operacoes_pendentes = 0
+
+    def _ler_diario(self):
+        if not os.path.exists(self.arquivo_diario):
+            return
+        with open(self.arquivo_diario, encoding="utf-8") as arquivo:
+            for linha in arquivo:
+                linha = linha.strip()
+                if not linha:
+                    continue
+                try:
+                    yield json.loads(linha)
+                except json.JSONDecodeError:
+                    # Última linha incompleta (queda durante a escrita)
+                    break
+
+# Modo Parquet: igual ao modo diário, mas o snapshot é colunar e tipado
+# (datas como date32/timestamp, especialidade e turno como categorias codificadas em
+# dicionário). A carga a frio não precisa reinterpretar texto nem datas.
+DATA_FILE_ESPERA_PARQUET = "data_espera.parquet"
+DATA_FILE_ATENDIDOS_PARQUET = "data_atendidos.parquet"
+DATA_FILE_DIARIO_PARQUET = "data_diario_parquet.jsonl"
+
+COLUNAS_CATEGORICAS_PARQUET = ["Especialidade", "Horário Preferencial"]
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as erro:
+        raise ImportError("O modo parquet precisa do pacote pyarrow (pip install pyarrow)") from erro
+    return pyarrow
+
+def esquema_parquet():
+    pa = _pyarrow()
+    campos = [pa.field(COLUNA_ID, pa.int64(), nullable=False)]
+    for coluna in colunas_padrao:
+        if coluna in ("Data 1º Contato", "Data de Início"):
+            tipo = pa.date32()
+        elif coluna == "Data Registro":
+            tipo = pa.timestamp("s")
+        elif coluna == "Dias de Espera":
+            tipo = pa.int32()
+        elif coluna in COLUNAS_CATEGORICAS_PARQUET:
+            tipo = pa.dictionary(pa.int16(), pa.string())
+        else:
+            tipo = pa.string()
+        campos.append(pa.field(coluna, tipo))
+    return pa.schema(campos)
+
+def _para_tabela_arrow(df):
+    pa = _pyarrow()
+    # Garante "Data Registro" lida como dd/mm/aaaa mesmo em tabelas ainda não tipadas
+    df = aplicar_esquema(df)
+    colunas = {COLUNA_ID: pd.Series(df.index, dtype="int64")}
+    for coluna in colunas_padrao:
+        serie = df[coluna].reset_index(drop=True)
+        if coluna in ("Data 1º Contato", "Data de Início"):
+            serie = pd.to_datetime(serie, errors="coerce").dt.normalize()
+        elif coluna == "Data Registro":
+            serie = pd.to_datetime(serie, errors="coerce").astype("datetime64[s]")
+        elif coluna == "Dias de Espera":
+            serie = pd.to_numeric(serie, errors="coerce").astype("Int32")
+        else:
+            serie = serie.astype("string")
+        colunas[coluna] = serie
+    return pa.Table.from_pandas(pd.DataFrame(colunas), schema=esquema_parquet(), preserve_index=False)
+
+def gravar_parquet(df, caminho):
+    _pyarrow()
+    import pyarrow.parquet as pq
+
+    temporario = caminho + ".tmp"
+    pq.write_table(_para_tabela_arrow(df), temporario, compression="zstd")
+    os.replace(temporario, caminho)
+
+def ler_parquet(caminho):
+    if not os.path.exists(caminho):
+        return aplicar_esquema(pd.DataFrame(columns=colunas_padrao))
+    _pyarrow()
+    import pyarrow.parquet as pq
+
+    df = pq.read_table(caminho).to_pandas(date_as_object=False)
+    df = df.set_index(COLUNA_ID)
+    df.index.name = None
+    return aplicar_esquema(df)
+
+class ArmazenamentoParquet(ArmazenamentoDiario):
+    modo = "parquet"
+
+    def __init__(self, arquivo_espera=DATA_FILE_ESPERA_PARQUET, arquivo_atendidos=DATA_FILE_ATENDIDOS_PARQUET,
+                 arquivo_diario=DATA_FILE_DIARIO_PARQUET, limite_compactacao=LIMITE_COMPACTACAO):
+        _pyarrow()
+        super().__init__(arquivo_espera, arquivo_atendidos, arquivo_diario, limite_compactacao)
+
+    def _ler_snapshot(self):
+        return ler_parquet(self.arquivo_espera), ler_parquet(self.arquivo_atendidos), False
+
+    def _escrever_snapshot(self, dados, atendidos):
+        gravar_parquet(dados, self.arquivo_espera)
+        gravar_parquet(atendidos, self.arquivo_atendidos)
+
+# Converte os CSVs atuais (já com o diário aplicado) para o modo parquet
+def converter_csv_para_parquet(arquivo_espera=DATA_FILE_ESPERA, arquivo_atendidos=DATA_FILE_ATENDIDOS,
+                               arquivo_diario=DATA_FILE_DIARIO,
+                               destino_espera=DATA_FILE_ESPERA_PARQUET,
+                               destino_atendidos=DATA_FILE_ATENDIDOS_PARQUET):
+    dados, atendidos = ArmazenamentoDiario(arquivo_espera, arquivo_atendidos, arquivo_diario).carregar()
+    ArmazenamentoParquet(destino_espera, destino_atendidos).salvar(dados, atendidos)
+    return len(dados), len(atendidos)
+
+# Modo SQLite: banco embutido com uma tabela por lista, colunas de colunas_padrao
+# e índices em carteirinha, especialidade e data do primeiro contato. Cada
+# operação vira inserts/updates/deletes de uma linha dentro de uma transação.
+TABELAS_SQL = {"dados": "espera", "atendidos": "atendidos"}
+COLUNAS_INDEXADAS = {
+    "carteirinha": "Nº Carteirinha",
+    "especialidade": "Especialidade",
+    "data_contato": "Data 1º Contato",
+}
+
+def _q(nome):
+    return '"' + nome.replace('"', '""') + '"'
+
+def _para_sql(coluna, valor):
+    if valor is None or valor is pd.NaT:
+        return None
+    if isinstance(valor, float) and np.isnan(valor):
+        return None
+    if coluna == "Data 1º Contato":
+        data = pd.to_datetime(valor, errors="coerce")
+        return None if pd.isna(data) else data.strftime("%Y-%m-%d")
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+class ArmazenamentoSQLite:
+    modo = "sqlite"
+    suporta_consulta = True
+
+    def __init__(self, arquivo_sqlite=DATA_FILE_SQLITE, arquivo_espera=DATA_FILE_ESPERA,
+                 arquivo_atendidos=DATA_FILE_ATENDIDOS):
+        self.bytes_ultima_escrita = 0
+        self.arquivo_sqlite = arquivo_sqlite
+        self.arquivo_espera = arquivo_espera
+        self.arquivo_atendidos = arquivo_atendidos
+        self._criar_esquema()
+
+    def arquivos(self):
+        return [self.arquivo_sqlite, self.arquivo_sqlite + "-wal"]
+
+    def trava_escrita(self):
+        return trava_arquivo(self.arquivo_sqlite + ".lock")
+
+    def versao_disco(self):
+        return _assinatura_arquivos(*self.arquivos())
+
+    def _conectar(self):
+        conexao = sqlite3.connect(self.arquivo_sqlite, timeout=30)
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        return conexao
+
+    def _criar_esquema(self):
+        colunas = ", ".join(
+            f"{_q(c)} INTEGER" if c == "Dias de Espera" else f"{_q(c)} TEXT" for c in colunas_padrao)
+        with closing(self._conectar()) as conexao, conexao:
+            vazio = conexao.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'espera'").fetchone()[0] == 0
+            for tabela in TABELAS_SQL.values():
+                conexao.execute(f"CREATE TABLE IF NOT EXISTS {tabela} (id INTEGER PRIMARY KEY, {colunas})")
+                for sufixo, coluna in COLUNAS_INDEXADAS.items():
+                    conexao.execute(
+                        f"CREATE INDEX IF NOT EXISTS idx_{tabela}_{sufixo} ON {tabela} ({_q(coluna)})")
+        # Na primeira execução importa os CSVs existentes
+        if vazio and (os.path.exists(self.arquivo_espera) or os.path.exists(self.arquivo_atendidos)):
+            self.salvar(*ArmazenamentoCSV(self.arquivo_espera, self.arquivo_atendidos).carregar())
+
+    def _ler(self, conexao, tabela, where="", parametros=()):
+        df = pd.read_sql_query(f"SELECT * FROM {TABELAS_SQL[tabela]} {where}", conexao,
+                               params=parametros, index_col="id")
+        df.index.name = None
+        return aplicar_esquema(df)
+
+    def carregar(self):
+        with closing(self._conectar()) as conexao:
+            return self._ler(conexao, "dados"), self._ler(conexao, "atendidos")
+
+    def consultar(self, tabela, especialidade=None, carteirinha=None, desde=None, ate=None):
+        condicoes, parametros = [], []
+        if especialidade:
+            condicoes.append(f"{_q('Especialidade')} = ?")
+            parametros.append(especialidade)
+        if carteirinha:
+            condicoes.append(f"{_q('Nº Carteirinha')} = ?")
+            parametros.append(str(carteirinha))
+        if desde is not None:
+            condicoes.append(f"{_q('Data 1º Contato')} >= ?")
+            parametros.append(_para_sql("Data 1º Contato", desde))
+        if ate is not None:
+            condicoes.append(f"{_q('Data 1º Contato')} <= ?")
+            parametros.append(_para_sql("Data 1º Contato", ate))
+        where = ("WHERE " + " AND ".join(condicoes)) if condicoes else ""
+        with closing(self._conectar()) as conexao:
+            return self._ler(conexao, tabela, where + f" ORDER BY {_q('Data 1º Contato')}", parametros)
+
+    def salvar(self, dados, atendidos):
+        with closing(self._conectar()) as conexao:
+            with conexao:
+                for tabela, df in (("dados", dados), ("atendidos", atendidos)):
+                    conexao.execute(f"DELETE FROM {TABELAS_SQL[tabela]}")
+                    conexao.executemany(self._sql_inserir(tabela), [
+                        self._valores(id_, registro) for id_, registro in zip(
+                            df.index, df.reindex(columns=colunas_padrao).to_dict("records"))])
+            self.bytes_ultima_escrita = self._bytes_wal(conexao)
+
+    def registrar(self, operacao, dados, atendidos):
+        with closing(self._conectar()) as conexao:
+            with conexao:
+                self._executar(conexao, operacao)
+            self.bytes_ultima_escrita = self._bytes_wal(conexao)
+
+    # O WAL é esvaziado quando a última conexão fecha, então o tamanho do
+    # arquivo não mostra o que foi gravado; conta as páginas escritas nele
+    @staticmethod
+    def _bytes_wal(conexao):
+        _, paginas, _ = conexao.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        tamanho_pagina = conexao.execute("PRAGMA page_size").fetchone()[0]
+        return max(paginas, 0) * tamanho_pagina
+
+    def _executar(self, conexao, operacao):
+        tipo = operacao["op"]
+        if tipo == "adicionar":
+            self._inserir(conexao, operacao["tabela"], operacao["id"], operacao["registro"])
+        elif tipo == "mover":
+            linha = self._ler(conexao, "dados", "WHERE id = ?", (int(operacao["id"]),))
+            if len(linha):
+                registro = linha.iloc[0].to_dict()
+                registro.update(operacao["campos"])
+                self._inserir(conexao, "atendidos", operacao["id"], registro)
+                conexao.execute("DELETE FROM espera WHERE id = ?", (int(operacao["id"]),))
+            else:
+                self._atualizar(conexao, "atendidos", operacao["id"], operacao["campos"])
+        elif tipo == "editar":
+            self._atualizar(conexao, operacao["tabela"], operacao["id"], operacao["campos"])
+        elif tipo == "remover":
+            conexao.execute(f"DELETE FROM {TABELAS_SQL[operacao['tabela']]} WHERE id = ?",
+                            (int(operacao["id"]),))
+        elif tipo == "adicionar_lote":
+            conexao.executemany(self._sql_inserir(operacao["tabela"]), [
+                self._valores(id_, registro) for id_, registro in zip(operacao["ids"], operacao["registros"])])
+        elif tipo == "mover_lote":
+            # Mesma conexão, então o lote inteiro entra em uma transação
+            for individual in expandir_operacao(operacao):
+                self._executar(conexao, individual)
+        else:
+            raise ValueError(f"Operação desconhecida: {tipo}")
+
+    @staticmethod
+    def _sql_inserir(tabela):
+        colunas = ", ".join(["id"] + [_q(c) for c in colunas_padrao])
+        marcadores = ", ".join("?" * (len(colunas_padrao) + 1))
+        return f"INSERT OR REPLACE INTO {TABELAS_SQL[tabela]} ({colunas}) VALUES ({marcadores})"
+
+    @staticmethod
+    def _valores(id_, registro):
+        return [int(id_)] + [_para_sql(c, registro.get(c)) for c in colunas_padrao]
+
+    def _inserir(self, conexao, tabela, id_, registro):
+        conexao.execute(self._sql_inserir(tabela), self._valores(id_, registro))
+
+    def _atualizar(self, conexao, tabela, id_, campos):
+        if not campos:
+            return
+        atribuicoes = ", ".join(f"{_q(c)} = ?" for c in campos)
+        valores = [_para_sql(c, v) for c, v in campos.items()] + [int(id_)]
+        conexao.execute(f"UPDATE {TABELAS_SQL[tabela]} SET {atribuicoes} WHERE id = ?", valores)
+
+MODOS_ARMAZENAMENTO = {
+    "csv": ArmazenamentoCSV,
+    "diario": ArmazenamentoDiario,
+    "sqlite": ArmazenamentoSQLite,
+    "parquet": ArmazenamentoParquet,
+}
+
+def criar_armazenamento(modo="diario", **opcoes):
+    if modo not in MODOS_ARMAZENAMENTO:
+        raise ValueError(f"Modo de armazenamento desconhecido: {modo}")
+    return MODOS_ARMAZENAMENTO[modo](**opcoes)
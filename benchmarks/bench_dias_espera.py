@@ -0,0 +1,45 @@
+# Compara o cálculo de "Dias de Espera" linha a linha (apply) com o vetorizado
+#
+#   python -m benchmarks.bench_dias_espera [linhas]
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from espera import calcular_dias_espera, calcular_dias_espera_vetorizado
+
+def gerar_datas(linhas, fracao_invalida=0.01, semente=42):
+    rng = np.random.default_rng(semente)
+    dias = rng.integers(0, 3 * 365, size=linhas)
+    datas = pd.Series(pd.Timestamp.today().normalize() - pd.to_timedelta(dias, unit="D"))
+    datas[rng.random(linhas) < fracao_invalida] = pd.NaT
+    return datas
+
+def cronometrar(funcao, repeticoes=3):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+# Mesmo código usado hoje pelos apps
+def por_linha(datas):
+    return datas.dropna().apply(lambda x: calcular_dias_espera(pd.to_datetime(x)))
+
+def main(linhas=100_000):
+    datas = gerar_datas(linhas)
+    tempo_apply, esperado = cronometrar(lambda: por_linha(datas))
+    tempo_vetor, obtido = cronometrar(lambda: calcular_dias_espera_vetorizado(datas))
+
+    assert (obtido.dropna().astype(int) == esperado.astype(int)).all()
+    assert obtido.isna().sum() == datas.isna().sum()
+
+    print(f"linhas:            {linhas}")
+    print(f"apply por linha:   {tempo_apply * 1000:10.1f} ms")
+    print(f"vetorizado:        {tempo_vetor * 1000:10.1f} ms")
+    print(f"aceleração:        {tempo_apply / tempo_vetor:10.1f}x")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,47 @@
+# Compara o armazenamento em CSV com o snapshot parquet: tempo de carga a frio,
+# tempo de gravação e tamanho em disco
+#
+#   python -m benchmarks.bench_formatos [linhas ...]
+import os
+import sys
+import tempfile
+import time
+
+from armazenamento import _ler_csv, gravar_parquet, ler_parquet
+from benchmarks.gerador import gerar_pacientes
+
+def cronometrar(funcao, repeticoes=3):
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        decorrido = time.perf_counter() - inicio
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return melhor
+
+def medir(linhas, pasta):
+    df = gerar_pacientes(linhas)
+    csv = os.path.join(pasta, f"espera_{linhas}.csv")
+    parquet = os.path.join(pasta, f"espera_{linhas}.parquet")
+    return {
+        "linhas": linhas,
+        "csv_gravar": cronometrar(lambda: df.to_csv(csv, index=False), 1),
+        "parquet_gravar": cronometrar(lambda: gravar_parquet(df, parquet), 1),
+        "csv_carregar": cronometrar(lambda: _ler_csv(csv)),
+        "parquet_carregar": cronometrar(lambda: ler_parquet(parquet)),
+        "csv_bytes": os.path.getsize(csv),
+        "parquet_bytes": os.path.getsize(parquet),
+    }
+
+def main(tamanhos):
+    print(f"{'linhas':>9} {'carga csv':>10} {'carga pq':>10} {'grav csv':>10} {'grav pq':>10} "
+          f"{'MB csv':>8} {'MB pq':>8}")
+    with tempfile.TemporaryDirectory() as pasta:
+        for linhas in tamanhos:
+            r = medir(linhas, pasta)
+            print(f"{r['linhas']:>9} {r['csv_carregar'] * 1000:>8.0f}ms {r['parquet_carregar'] * 1000:>8.0f}ms "
+                  f"{r['csv_gravar'] * 1000:>8.0f}ms {r['parquet_gravar'] * 1000:>8.0f}ms "
+                  f"{r['csv_bytes'] / 1e6:>8.2f} {r['parquet_bytes'] / 1e6:>8.2f}")
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10_000, 100_000])
@@ -0,0 +1,172 @@
+# Mede cada etapa de uma execução do app em vários tamanhos de lista e para
+# cada armazenamento, e grava os resultados em JSON para comparar versões
+#
+#   python -m benchmarks.bench_rerun [--tamanhos 1000 10000 ...] [--armazenamentos csv sqlite ...]
+#                                    [--saida resultados.json] [--comparar base.json]
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from armazenamento import MODOS_ARMAZENAMENTO, criar_armazenamento, filtrar_pacientes
+from benchmarks.gerador import gerar_atendidos, gerar_pacientes
+from cache_dados import CacheDados
+from componentes import paginar
+from espera import DiasEsperaMaterializados, calcular_dias_espera_vetorizado, hoje_referencia
+from estilo import aplicar_estilo
+from exportacao import exportar_em_blocos, gerar_excel
+
+TAMANHOS_PADRAO = [1_000, 10_000, 100_000, 1_000_000]
+
+# Atendidos gerados para cada paciente em espera
+PROPORCAO_ATENDIDOS = 0.2
+
+# Etapas caras demais para listas grandes só rodam até este número de linhas
+LIMITE_ETAPAS_PESADAS = 100_000
+ETAPAS_PESADAS = {"estilo_lista_inteira", "lista_expanders", "exportar_excel", "exportar_blocos"}
+
+# Tempo relativo à base a partir do qual a etapa conta como regressão
+TOLERANCIA_PADRAO = 1.5
+
+def cronometrar(funcao, repeticoes):
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        decorrido = time.perf_counter() - inicio
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return melhor
+
+# Mesmo laço da lista da v6.1 antes da paginação: um expander por paciente
+def _lista_expanders(df):
+    return [f"{row['Nome']} - {row['Especialidade']} ({row['Dias de Espera']} dias) {row['Telefone']}"
+            for _, row in df.iterrows()]
+
+# Etapas que não dependem do armazenamento, sobre os dados já carregados
+def etapas_em_memoria(dados, atendidos, pasta):
+    hoje = hoje_referencia()
+    com_dias = dados.assign(**{"Dias de Espera": calcular_dias_espera_vetorizado(dados["Data 1º Contato"], hoje)})
+    materializados = DiasEsperaMaterializados()
+    materializados.construir(dados, atendidos)
+    return {
+        "dias_espera": lambda: calcular_dias_espera_vetorizado(dados["Data 1º Contato"], hoje),
+        # Leitura em uma execução comum: a coluna já está calculada para hoje
+        "dias_espera_materializado": lambda: materializados.tabela(dados, hoje),
+        "filtrar_especialidade": lambda: filtrar_pacientes(com_dias, especialidade="Psicologia"),
+        "estilo_pagina": lambda: aplicar_estilo(paginar(com_dias, 1)).to_html(),
+        "estilo_lista_inteira": lambda: aplicar_estilo(com_dias).to_html(),
+        "lista_expanders": lambda: _lista_expanders(com_dias),
+        "exportar_excel": lambda: gerar_excel(com_dias, atendidos),
+        "exportar_blocos": lambda: exportar_em_blocos(com_dias, atendidos, "csv.gz",
+                                                      os.path.join(pasta, "exportacao.csv.gz")),
+    }
+
+# Etapas de um armazenamento: gravação completa, carga a frio e uma escrita
+# de paciente pelo cache compartilhado
+def medir_armazenamento(modo, dados, atendidos, repeticoes):
+    armazenamento = criar_armazenamento(modo)
+    resultados = {
+        "gravar": cronometrar(lambda: armazenamento.salvar(dados, atendidos), 1),
+        "carregar": cronometrar(armazenamento.carregar, repeticoes),
+    }
+    cache = CacheDados(armazenamento)
+    cache.obter()
+    registro = dados.iloc[0].to_dict()
+    resultados["registrar_paciente"] = cronometrar(
+        lambda: cache.registrar({"op": "adicionar", "tabela": "dados", "registro": registro}), repeticoes)
+    if getattr(armazenamento, "suporta_consulta", False):
+        resultados["consultar_especialidade"] = cronometrar(
+            lambda: armazenamento.consultar("dados", especialidade="Psicologia"), repeticoes)
+    return resultados
+
+def _resultado(tamanho, armazenamento, etapa, segundos):
+    return {"tamanho": tamanho, "armazenamento": armazenamento, "etapa": etapa, "segundos": segundos}
+
+def executar(tamanhos, armazenamentos, repeticoes=3, limite_pesadas=LIMITE_ETAPAS_PESADAS, progresso=None):
+    resultados = []
+    pasta_inicial = os.getcwd()
+    for tamanho in tamanhos:
+        dados = gerar_pacientes(tamanho)
+        atendidos = gerar_atendidos(int(tamanho * PROPORCAO_ATENDIDOS))
+        atendidos.index += len(dados)
+        for modo in armazenamentos:
+            with tempfile.TemporaryDirectory() as pasta:
+                # Os armazenamentos usam os nomes de arquivo padrão, relativos à pasta atual
+                os.chdir(pasta)
+                try:
+                    medidas = medir_armazenamento(modo, dados, atendidos, repeticoes)
+                finally:
+                    os.chdir(pasta_inicial)
+            for etapa, segundos in medidas.items():
+                resultados.append(_resultado(tamanho, modo, etapa, segundos))
+                if progresso:
+                    progresso(resultados[-1])
+        with tempfile.TemporaryDirectory() as pasta:
+            for etapa, funcao in etapas_em_memoria(dados, atendidos, pasta).items():
+                pesada = etapa in ETAPAS_PESADAS and tamanho > limite_pesadas
+                segundos = None if pesada else cronometrar(funcao, 1 if etapa in ETAPAS_PESADAS else repeticoes)
+                resultados.append(_resultado(tamanho, None, etapa, segundos))
+                if progresso:
+                    progresso(resultados[-1])
+    return resultados
+
+def ambiente():
+    return {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "plataforma": platform.platform(),
+    }
+
+# Compara com uma execução anterior; devolve as etapas que ficaram mais lentas
+# que a tolerância
+def comparar(resultados, base, tolerancia=TOLERANCIA_PADRAO):
+    chave = lambda r: (r["tamanho"], r["armazenamento"], r["etapa"])
+    anteriores = {chave(r): r["segundos"] for r in base["resultados"]}
+    regressoes = []
+    for r in resultados:
+        anterior = anteriores.get(chave(r))
+        if anterior and r["segundos"] is not None and r["segundos"] > anterior * tolerancia:
+            regressoes.append(dict(r, anterior=anterior, razao=r["segundos"] / anterior))
+    return regressoes
+
+def _imprimir(r):
+    onde = r["armazenamento"] or "-"
+    tempo = "pulada" if r["segundos"] is None else f"{r['segundos'] * 1000:10.1f} ms"
+    print(f"{r['tamanho']:>9} {onde:>8} {r['etapa']:<24} {tempo}", flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark das etapas de uma execução do app")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO)
+    parser.add_argument("--armazenamentos", nargs="+", default=list(MODOS_ARMAZENAMENTO),
+                        choices=list(MODOS_ARMAZENAMENTO))
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--limite-pesadas", type=int, default=LIMITE_ETAPAS_PESADAS)
+    parser.add_argument("--saida", help="arquivo JSON com os resultados")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO)
+    args = parser.parse_args(argv)
+
+    print(f"{'linhas':>9} {'armaz.':>8} {'etapa':<24} {'tempo':>13}")
+    resultados = executar(args.tamanhos, args.armazenamentos, args.repeticoes, args.limite_pesadas, _imprimir)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump({"ambiente": ambiente(), "resultados": resultados}, arquivo, ensure_ascii=False, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            regressoes = comparar(resultados, json.load(arquivo), args.tolerancia)
+        for r in regressoes:
+            print(f"REGRESSÃO {r['tamanho']} {r['armazenamento'] or '-'} {r['etapa']}: "
+                  f"{r['anterior'] * 1000:.1f} ms -> {r['segundos'] * 1000:.1f} ms ({r['razao']:.2f}x)")
+        return 1 if regressoes else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
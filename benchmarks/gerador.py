@@ -0,0 +1,41 @@
+# Gerador determinístico de pacientes sintéticos para os benchmarks
+import numpy as np
+import pandas as pd
+
+from esquema import ESPECIALIDADES, HORARIOS, colunas_padrao
+
+PROFISSIONAIS = [f"Profissional {n:02d}" for n in range(1, 31)]
+
+# Fração dos pacientes que indica um profissional
+FRACAO_PREFERENCIA = 0.15
+
+def gerar_pacientes(linhas, semente=42, hoje=None):
+    rng = np.random.default_rng(semente)
+    hoje = pd.Timestamp.today().normalize() if hoje is None else pd.Timestamp(hoje)
+    numeros = np.arange(linhas)
+    preferencia = rng.random(linhas) < FRACAO_PREFERENCIA
+    df = pd.DataFrame({
+        "Nome": pd.Series(numeros).map("Paciente {:07d}".format),
+        "Nº Carteirinha": pd.Series(rng.integers(10**9, 10**10, size=linhas)).astype(str),
+        "Data 1º Contato": hoje - pd.to_timedelta(rng.integers(0, 3 * 365, size=linhas), unit="D"),
+        "Especialidade": rng.choice(ESPECIALIDADES, size=linhas),
+        "Telefone": pd.Series(rng.integers(10**10, 10**11, size=linhas)).astype(str),
+        "Horário Preferencial": rng.choice(HORARIOS, size=linhas),
+        "Preferência Profissional": np.where(preferencia, "Sim", "Não"),
+        "Profissional Indicado": np.where(preferencia, rng.choice(PROFISSIONAIS, size=linhas), ""),
+        "Registrado Por": rng.choice(["admin", "user1", "recepcao"], size=linhas),
+        "Data Registro": hoje.strftime("%d/%m/%Y %H:%M"),
+        "Vaga Concedida": "Não",
+    })
+    return df.reindex(columns=colunas_padrao)
+
+# Pacientes já atendidos: mesma distribuição, com vaga, profissional e início
+def gerar_atendidos(linhas, semente=43, hoje=None):
+    rng = np.random.default_rng(semente)
+    df = gerar_pacientes(linhas, semente, hoje)
+    df["Nome"] = df["Nome"].str.replace("Paciente", "Atendido", regex=False)
+    df["Vaga Concedida"] = "Sim"
+    df["Profissional Responsável"] = rng.choice(PROFISSIONAIS, size=linhas)
+    df["Horário Atendimento"] = rng.choice(["Manhã", "Tarde"], size=linhas)
+    df["Data de Início"] = df["Data 1º Contato"] + pd.to_timedelta(rng.integers(1, 180, size=linhas), unit="D")
+    return df
@@ -0,0 +1,195 @@
+# Cache dos dados compartilhado por todas as sessões do processo
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from armazenamento import OPERACOES_EM_LOTE, aplicar_operacao, expandir_operacao, novo_id, verificar_conflito
+from espera import calcular_dias_espera_vetorizado, dias_para_gravar
+from indice import CarteirinhaDuplicada, IndiceCarteirinha, campos_para_mesclar, normalizar_carteirinha
+from metricas import BYTES_ARMAZENAMENTO, DURACAO_ARMAZENAMENTO, bytes_em_disco, bytes_gravados, estado_arquivos
+
+# Sessões sem atividade por mais tempo que isso deixam de contar como ativas
+TEMPO_SESSAO_INATIVA = 30 * 60
+
+# Guarda uma única cópia de "dados" e "atendidos" para o processo inteiro. As
+# sessões leem por aqui em vez de manter sua própria cópia em st.session_state.
+# A cópia é recarregada quando a versão em disco muda (escrita de outro
+# processo) e atualizada no lugar quando a escrita passa por este cache.
+# Os DataFrames devolvidos são compartilhados: nunca altere-os no lugar.
+#
+# Leituras não esperam por escritas: o par (dados, atendidos) é trocado de uma
+# vez a cada escrita (cópia nova, nunca alterada no lugar). As escritas são
+# otimistas: a sessão monta a operação sobre o que leu e, na gravação, sob uma
+# trava curta (a do processo e a do arquivo, entre processos), a operação é
+# conferida com o estado mais recente por verificar_conflito().
+#
+# Estruturas derivadas (índices, filas, estatísticas) são registradas com
+# adicionar_derivado(). Cada uma implementa construir(dados, atendidos), chamado
+# a cada carga completa, e aplicar(operacao, antes, depois), chamado a cada
+# escrita com as tabelas (dados, atendidos) de antes e de depois da operação.
+# Operações em lote chegam a aplicar() uma linha por vez, a menos que a
+# estrutura implemente aplicar_lote(operacao, antes, depois) para tratá-las de
+# uma vez.
+class CacheDados:
+    def __init__(self, armazenamento):
+        self.armazenamento = armazenamento
+        self.versao = 0
+        self._versao_disco = None
+        self._tabelas = None
+        self._sessoes = {}
+        self._trava = threading.RLock()
+        self._escritas_abertas = 0
+        self._derivados = []
+        self.indice = self.adicionar_derivado(IndiceCarteirinha())
+
+    def adicionar_derivado(self, derivado):
+        with self._trava:
+            self._derivados.append(derivado)
+            if self._tabelas is not None:
+                derivado.construir(*self._tabelas)
+        return derivado
+
+    def obter(self, id_sessao=None):
+        if id_sessao is not None:
+            self._sessoes[id_sessao] = time.monotonic()
+        tabelas = self._tabelas
+        if tabelas is not None and self.armazenamento.versao_disco() == self._versao_disco:
+            return tabelas
+        with self._trava:
+            versao_disco = self.armazenamento.versao_disco()
+            if self._tabelas is None or versao_disco != self._versao_disco:
+                # A assinatura é lida antes da carga: se outro processo gravar
+                # durante a leitura, a próxima chamada vê a diferença e recarrega
+                with self._medir("carregar"):
+                    tabelas = self.armazenamento.carregar()
+                for derivado in self._derivados:
+                    derivado.construir(*tabelas)
+                self._tabelas = tabelas
+                self._versao_disco = versao_disco
+                self.versao += 1
+            return self._tabelas
+
+    def invalidar(self):
+        with self._trava:
+            self._tabelas = None
+
+    # Seção crítica de uma escrita. A trava de arquivo é tomada uma vez só,
+    # mesmo com escritas aninhadas (adicionar_paciente -> registrar).
+    @contextmanager
+    def _escrita(self):
+        with self._trava:
+            trava = nullcontext()
+            if not self._escritas_abertas and hasattr(self.armazenamento, "trava_escrita"):
+                trava = self.armazenamento.trava_escrita()
+            self._escritas_abertas += 1
+            try:
+                with trava:
+                    yield
+            finally:
+                self._escritas_abertas -= 1
+
+    # Aplica a operação na cópia compartilhada e grava no armazenamento. O id
+    # de novos pacientes é atribuído aqui, sob a trava, para não repetir entre
+    # sessões nem entre processos. Levanta ConflitoEdicao se a operação foi
+    # montada sobre dados que outra sessão já alterou.
+    def registrar(self, operacao):
+        with self._escrita():
+            # Dentro da trava: inclui o que outro processo acabou de gravar
+            antes = self.obter()
+            verificar_conflito(*antes, operacao)
+            if operacao["op"] == "adicionar" and operacao.get("id") is None:
+                operacao = dict(operacao, id=novo_id(*antes))
+            elif operacao["op"] == "adicionar_lote" and operacao.get("ids") is None:
+                primeiro = novo_id(*antes)
+                operacao = dict(operacao, ids=list(range(primeiro, primeiro + len(operacao["registros"]))))
+            try:
+                depois = aplicar_operacao(*antes, operacao)
+                with self._medir("registrar"):
+                    self.armazenamento.registrar(operacao, *depois)
+            except Exception:
+                self.invalidar()
+                raise
+            for derivado in self._derivados:
+                if operacao["op"] in OPERACOES_EM_LOTE and hasattr(derivado, "aplicar_lote"):
+                    derivado.aplicar_lote(operacao, antes, depois)
+                else:
+                    for individual in expandir_operacao(operacao):
+                        derivado.aplicar(individual, antes, depois)
+            self._tabelas = depois
+            self._versao_disco = self.armazenamento.versao_disco()
+            self.versao += 1
+            return operacao
+
+    # Inclui um paciente verificando a carteirinha no índice. Se ela já estiver
+    # na lista de espera: duplicados="rejeitar" levanta CarteirinhaDuplicada,
+    # "mesclar" atualiza o cadastro existente (ou o move para atendidos, quando
+    # o novo registro já vem com vaga) e "permitir" inclui mesmo assim.
+    def adicionar_paciente(self, tabela, registro, duplicados="rejeitar"):
+        with self._escrita():
+            dados, _ = self.obter()
+            carteirinha = normalizar_carteirinha(registro.get("Nº Carteirinha"))
+            existentes = self.indice.ids_em(carteirinha, "dados") if carteirinha else []
+            if existentes and duplicados == "rejeitar":
+                raise CarteirinhaDuplicada(carteirinha, existentes)
+            if existentes and duplicados == "mesclar":
+                campos = campos_para_mesclar(registro)
+                if tabela == "atendidos":
+                    # A espera é a do cadastro existente (a data do 1º contato
+                    # dele é preservada), congelada hoje como nas outras saídas
+                    dias = calcular_dias_espera_vetorizado(dados.loc[[existentes[0]], "Data 1º Contato"]).iloc[0]
+                    campos["Dias de Espera"] = dias_para_gravar(dias)
+                    return self.registrar({"op": "mover", "id": existentes[0], "campos": campos})
+                return self.registrar({"op": "editar", "tabela": "dados", "id": existentes[0], "campos": campos})
+            return self.registrar({"op": "adicionar", "tabela": tabela, "registro": registro})
+
+    def salvar(self):
+        with self._escrita():
+            dados, atendidos = self.obter()
+            with self._medir("salvar"):
+                self.armazenamento.salvar(dados, atendidos)
+            self._versao_disco = self.armazenamento.versao_disco()
+
+    # Latência e bytes de cada acesso ao armazenamento, para metricas.py
+    @contextmanager
+    def _medir(self, operacao):
+        modo = getattr(self.armazenamento, "modo", type(self.armazenamento).__name__)
+        arquivos = self.armazenamento.arquivos() if hasattr(self.armazenamento, "arquivos") else []
+        antes = estado_arquivos(arquivos)
+        inicio = time.perf_counter()
+        yield
+        DURACAO_ARMAZENAMENTO.observar(time.perf_counter() - inicio, modo=modo, operacao=operacao)
+        if operacao == "carregar":
+            BYTES_ARMAZENAMENTO.incrementar(bytes_em_disco(arquivos), modo=modo, direcao="lidos")
+        else:
+            # Armazenamentos que sabem quanto gravaram informam em bytes_ultima_escrita
+            gravados = getattr(self.armazenamento, "bytes_ultima_escrita", None)
+            if gravados is None:
+                gravados = bytes_gravados(antes, estado_arquivos(arquivos))
+            BYTES_ARMAZENAMENTO.incrementar(gravados, modo=modo, direcao="gravados")
+
+    # ============================
+    # USO DE MEMÓRIA
+    # ============================
+
+    def sessoes_ativas(self):
+        limite = time.monotonic() - TEMPO_SESSAO_INATIVA
+        with self._trava:
+            self._sessoes = {s: visto for s, visto in self._sessoes.items() if visto >= limite}
+            return len(self._sessoes)
+
+    def memoria_por_copia(self):
+        tabelas = self._tabelas
+        if tabelas is None:
+            return 0
+        return int(sum(df.memory_usage(deep=True).sum() for df in tabelas))
+
+    # Cada sessão além da primeira teria carregado sua própria cópia
+    def relatorio_memoria(self):
+        por_copia = self.memoria_por_copia()
+        sessoes = self.sessoes_ativas()
+        return {
+            "bytes_por_copia": por_copia,
+            "sessoes_ativas": sessoes,
+            "bytes_economizados_por_sessao_extra": por_copia,
+            "bytes_economizados": por_copia * max(sessoes - 1, 0),
+        }
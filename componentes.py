@@ -0,0 +1,53 @@
+# Componentes de interface reutilizáveis
+import math
+
+import pandas as pd
+import streamlit as st
+
+from estilo import aplicar_estilo
+
+TAMANHO_PAGINA = 25
+
+# Colunas usadas pela busca textual
+COLUNAS_BUSCA = ["Nome", "Nº Carteirinha", "Telefone"]
+
+def buscar(df, termo):
+    termo = (termo or "").strip()
+    if not termo:
+        return df
+    mascara = pd.Series(False, index=df.index)
+    for coluna in COLUNAS_BUSCA:
+        mascara |= df[coluna].astype(str).str.contains(termo, case=False, regex=False, na=False)
+    return df[mascara]
+
+def total_paginas(linhas, tamanho=TAMANHO_PAGINA):
+    return max(1, math.ceil(linhas / tamanho))
+
+def paginar(df, pagina, tamanho=TAMANHO_PAGINA):
+    inicio = (pagina - 1) * tamanho
+    return df.iloc[inicio:inicio + tamanho]
+
+# Lista paginada com busca: só a página visível é desenhada, então o custo da
+# tela não cresce com o tamanho da lista. Devolve o (id, linha) do paciente
+# selecionado na página, ou None.
+def lista_paginada(df, chave, colunas=None, chave_estilo=None, tamanho=TAMANHO_PAGINA):
+    col_busca, col_pagina = st.columns([3, 1])
+    termo = col_busca.text_input("Buscar por nome, carteirinha ou telefone", key=f"{chave}_busca")
+    encontrados = buscar(df, termo)
+
+    paginas = total_paginas(len(encontrados), tamanho)
+    pagina = col_pagina.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas,
+                                     value=1, step=1, key=f"{chave}_pagina_{termo}")
+    visiveis = paginar(encontrados, int(pagina), tamanho)
+    st.caption(f"{len(encontrados)} paciente(s) — exibindo {len(visiveis)}")
+
+    tabela = visiveis if colunas is None else visiveis[colunas]
+    chave_pagina = None if chave_estilo is None else (chave_estilo, termo, int(pagina))
+    st.dataframe(aplicar_estilo(tabela, chave=chave_pagina))
+
+    if visiveis.empty:
+        return None
+    selecionado = st.selectbox(
+        "Selecionar paciente", list(visiveis.index), key=f"{chave}_selecionado",
+        format_func=lambda i: f"{visiveis.at[i, 'Nome']} - {visiveis.at[i, 'Especialidade']}")
+    return selecionado, visiveis.loc[selecionado]
@@ -0,0 +1,116 @@
+# Tempo gasto em cada etapa de uma execução do script (carga, gravação,
+# dias de espera, estilo, exportação, histórico)
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import pandas as pd
+
+from metricas import DURACAO_ETAPA, DURACAO_EXECUCAO
+
+# Log em JSON (uma execução por linha), trocado ao atingir o tamanho limite
+ARQUIVO_LOG_DESEMPENHO = "desempenho.log"
+TAMANHO_LOG_DESEMPENHO = 1_000_000
+ARQUIVOS_LOG_DESEMPENHO = 5
+
+# Execuções mais recentes mantidas em memória para o painel
+EXECUCOES_EM_MEMORIA = 500
+
+# Uma execução do script. Cada etapa é medida com
+#   with execucao.etapa("carregar_dados"): ...
+# e guardada como (nome, início relativo à execução, duração), em segundos.
+class Execucao:
+    def __init__(self, registro, sessao):
+        self._registro = registro
+        self.sessao = sessao
+        self.data = datetime.now()
+        self.inicio = time.perf_counter()
+        self.etapas = []
+        self.duracao = None
+        self.interrompida = False
+
+    @property
+    def finalizada(self):
+        return self.duracao is not None
+
+    @contextmanager
+    def etapa(self, nome):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.etapas.append((nome, inicio - self.inicio, time.perf_counter() - inicio))
+
+    # interrompida: a execução foi cortada por st.rerun() e só é fechada
+    # quando a seguinte começa
+    def finalizar(self, interrompida=False):
+        if not self.finalizada:
+            self.duracao = time.perf_counter() - self.inicio
+            self.interrompida = interrompida
+            self._registro._concluir(self)
+
+    def como_dict(self):
+        return {
+            "data": self.data.isoformat(timespec="milliseconds"),
+            "sessao": self.sessao,
+            "total_ms": round(self.duracao * 1000, 2),
+            "interrompida": self.interrompida,
+            "etapas": [{"etapa": nome, "inicio_ms": round(inicio * 1000, 2), "duracao_ms": round(duracao * 1000, 2)}
+                       for nome, inicio, duracao in self.etapas],
+        }
+
+# Guarda as execuções de todas as sessões do processo e grava cada uma no log
+class RegistroDesempenho:
+    def __init__(self, arquivo_log=ARQUIVO_LOG_DESEMPENHO, limite=EXECUCOES_EM_MEMORIA):
+        self._execucoes = deque(maxlen=limite)
+        self._trava = threading.Lock()
+        self._log = None
+        if arquivo_log:
+            self._log = logging.getLogger(f"desempenho.{arquivo_log}")
+            self._log.propagate = False
+            self._log.setLevel(logging.INFO)
+            if not self._log.handlers:
+                self._log.addHandler(RotatingFileHandler(arquivo_log, maxBytes=TAMANHO_LOG_DESEMPENHO,
+                                                         backupCount=ARQUIVOS_LOG_DESEMPENHO, encoding="utf-8"))
+
+    def iniciar(self, sessao=None):
+        return Execucao(self, sessao)
+
+    def _concluir(self, execucao):
+        with self._trava:
+            self._execucoes.append(execucao)
+        if not execucao.interrompida:
+            DURACAO_EXECUCAO.observar(execucao.duracao)
+        for nome, _, duracao in execucao.etapas:
+            DURACAO_ETAPA.observar(duracao, etapa=nome)
+        if self._log is not None:
+            self._log.info(json.dumps(execucao.como_dict(), ensure_ascii=False))
+
+    def execucoes(self, sessao=None):
+        with self._trava:
+            return [e for e in self._execucoes if sessao is None or e.sessao == sessao]
+
+    def ultima(self, sessao=None):
+        execucoes = self.execucoes(sessao)
+        return execucoes[-1] if execucoes else None
+
+    # Por etapa: número de medições, média, mediana, p95 e máximo em ms
+    def resumo(self):
+        linhas = [(nome, duracao * 1000) for e in self.execucoes() for nome, _, duracao in e.etapas]
+        linhas += [("execução inteira", e.duracao * 1000) for e in self.execucoes() if not e.interrompida]
+        if not linhas:
+            return pd.DataFrame(columns=["medições", "média (ms)", "mediana (ms)", "p95 (ms)", "máx (ms)"])
+        tempos = pd.DataFrame(linhas, columns=["etapa", "ms"]).groupby("etapa")["ms"]
+        resumo = pd.DataFrame({
+            "medições": tempos.size(),
+            "média (ms)": tempos.mean(),
+            "mediana (ms)": tempos.median(),
+            "p95 (ms)": tempos.quantile(0.95),
+            "máx (ms)": tempos.max(),
+        })
+        return resumo.sort_values("média (ms)", ascending=False).round(1)
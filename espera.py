@@ -0,0 +1,121 @@
+# Cálculo dos dias de espera
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+# Versão escalar, usada para um único paciente (ex.: no formulário de cadastro)
+def calcular_dias_espera(data_contato):
+    if isinstance(data_contato, pd.Timestamp):
+        data_contato = data_contato.to_pydatetime()
+    elif isinstance(data_contato, date):
+        data_contato = datetime.combine(data_contato, datetime.min.time())
+    hoje = datetime.today()
+    return (hoje - data_contato).days
+
+# "Hoje" fixado uma vez por execução do script, para todas as linhas
+def hoje_referencia():
+    return pd.Timestamp(date.today())
+
+# Dias de espera congelados no dia em que o paciente sai da lista, como int
+# (ou None) para poder ir ao diário em JSON
+def dias_para_gravar(valor):
+    return None if valor is None or pd.isna(valor) else int(valor)
+
+# Versão vetorizada: calcula a coluna inteira em uma única operação datetime64.
+# Datas inválidas (NaT vindo de errors="coerce") resultam em <NA>.
+def calcular_dias_espera_vetorizado(datas, hoje=None):
+    hoje = hoje_referencia() if hoje is None else pd.Timestamp(hoje).normalize()
+    datas = pd.to_datetime(pd.Series(datas), errors="coerce")
+    return (hoje - datas.dt.normalize()).dt.days.astype("Int64")
+
+# ============================
+# DIAS DE ESPERA MATERIALIZADOS
+# ============================
+
+# Estrutura derivada do CacheDados (como o índice e as filas) que guarda a lista
+# de espera já com "Dias de Espera" calculado para a data "data". O valor só muda
+# à meia-noite, então a coluna inteira é recalculada uma vez por dia; inclusões
+# e mudanças de data recalculam apenas as linhas afetadas, na próxima leitura.
+# O valor gravado no armazenamento é ignorado para quem ainda está esperando.
+class DiasEsperaMaterializados:
+    def __init__(self):
+        self.data = None
+        self._dados = None
+        self._dias = None
+        self._tabela = None
+        self._pendentes = set()
+        self._trava = threading.Lock()
+
+    def construir(self, dados, atendidos):
+        with self._trava:
+            self._dados = dados
+            self._dias = self._tabela = None
+            self._pendentes = set()
+
+    def aplicar(self, operacao, antes, depois):
+        with self._trava:
+            self._dados = depois[0]
+            self._tabela = None
+            tipo = operacao["op"]
+            if operacao.get("tabela") == "dados" and (
+                    tipo == "adicionar" or (tipo == "editar" and "Data 1º Contato" in operacao["campos"])):
+                self._pendentes.add(int(operacao["id"]))
+
+    def aplicar_lote(self, operacao, antes, depois):
+        with self._trava:
+            self._dados = depois[0]
+            self._tabela = None
+            if operacao["op"] == "adicionar_lote" and operacao["tabela"] == "dados":
+                self._pendentes.update(int(id_) for id_ in operacao["ids"])
+
+    # A lista de espera com a coluna calculada para hoje. Os DataFrames devolvidos
+    # são compartilhados entre sessões: não altere no lugar.
+    def tabela(self, dados=None, hoje=None):
+        hoje = hoje_referencia() if hoje is None else pd.Timestamp(hoje).normalize()
+        with self._trava:
+            if dados is not None and dados is not self._dados:
+                # Cópia diferente da que o cache acompanha: calcula sem guardar
+                return dados.assign(**{"Dias de Espera": calcular_dias_espera_vetorizado(dados["Data 1º Contato"], hoje)})
+            if self._tabela is None or self.data != hoje:
+                self._atualizar(hoje)
+                self._tabela = self._dados.assign(**{"Dias de Espera": self._dias})
+            return self._tabela
+
+    def _atualizar(self, hoje):
+        dados = self._dados
+        if self._dias is None or self.data != hoje:
+            self._dias = calcular_dias_espera_vetorizado(dados["Data 1º Contato"], hoje)
+        elif self._pendentes or not self._dias.index.equals(dados.index):
+            dias = self._dias.reindex(dados.index)
+            pendentes = dados.index.intersection(list(self._pendentes))
+            dias.loc[pendentes] = calcular_dias_espera_vetorizado(dados.loc[pendentes, "Data 1º Contato"], hoje)
+            self._dias = dias
+        self._dias.index = dados.index
+        self._pendentes = set()
+        self.data = hoje
+
+    # Chamada na virada do dia para que a primeira execução do dia já leia pronto
+    def renovar(self):
+        if self._dados is not None:
+            self.tabela()
+
+# Chama funcao() logo após cada meia-noite, em uma thread de fundo. O sono é
+# limitado a uma hora para não perder a virada se o relógio mudar.
+def iniciar_renovacao_diaria(funcao, nome="renovacao-diaria"):
+    def laco():
+        ultimo_dia = date.today()
+        while True:
+            meia_noite = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+            time.sleep(min(max((meia_noite - datetime.now()).total_seconds(), 0) + 1, 3600))
+            if date.today() != ultimo_dia:
+                ultimo_dia = date.today()
+                try:
+                    funcao()
+                except Exception:
+                    pass  # a próxima leitura recalcula mesmo assim
+
+    thread = threading.Thread(target=laco, name=nome, daemon=True)
+    thread.start()
+    return thread
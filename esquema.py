@@ -0,0 +1,137 @@
+# Esquema tipado das tabelas de espera e de atendidos
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+colunas_padrao = [
+    "Nome", "Nº Carteirinha", "Data 1º Contato", "Dias de Espera", "Especialidade",
+    "Telefone", "Horário Preferencial", "Preferência Profissional", "Profissional Indicado",
+    "Registrado Por", "Data Registro", "Vaga Concedida", "Profissional Responsável",
+    "Horário Atendimento", "Data de Início"
+]
+
+ESPECIALIDADES = [
+    "Fisioterapia Traumato-Ortopédica", "Fisioterapia Neurofuncional",
+    "Fisioterapia Uroginecológica", "Reeducação Postural Global",
+    "Disfunção Temporomandibular", "Acupuntura", "Fonoaudiologia",
+    "Psicologia", "Terapia Ocupacional"
+]
+
+HORARIOS = ["Manhã", "Tarde", "Indiferente"]
+SIM_NAO = ["Não", "Sim"]
+
+# Colunas de baixa cardinalidade guardadas como categoria. A lista indica as
+# categorias conhecidas de antemão; valores fora dela são acrescentados (nunca
+# descartados), e "Registrado Por" cresce conforme os usuários cadastram.
+COLUNAS_CATEGORICAS = {
+    "Especialidade": ESPECIALIDADES,
+    "Horário Preferencial": HORARIOS,
+    "Preferência Profissional": SIM_NAO,
+    "Vaga Concedida": SIM_NAO,
+    "Registrado Por": [],
+}
+
+COLUNAS_DATA = ["Data 1º Contato", "Data de Início", "Data Registro"]
+COLUNAS_INTEIRAS = ["Dias de Espera"]
+COLUNAS_TEXTO = [c for c in colunas_padrao
+                 if c not in COLUNAS_CATEGORICAS and c not in COLUNAS_DATA and c not in COLUNAS_INTEIRAS]
+
+# "Data Registro" é gravada como dd/mm/aaaa hh:mm pelos apps
+FORMATO_DATA_REGISTRO = "%d/%m/%Y %H:%M"
+
+# Origem das datas contadas em dias (chaves das filas e das estatísticas)
+EPOCA = pd.Timestamp(0)
+
+# Valor de uma célula como texto, ou None se vazio; usado para agrupar por
+# especialidade e turno sem depender do tipo da coluna
+def como_texto(valor):
+    return None if valor is None or (not isinstance(valor, str) and pd.isna(valor)) else str(valor)
+
+# Todas as datas ficam em microssegundos, qualquer que seja a origem (CSV,
+# Parquet, SQLite ou valores digitados), para que concatenar e comparar não
+# dependam de onde a linha veio
+UNIDADE_DATA = "datetime64[us]"
+
+def _para_data(serie, formato=None):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie if serie.dtype == UNIDADE_DATA else serie.astype(UNIDADE_DATA)
+    datas = pd.to_datetime(serie, format=formato, errors="coerce") if formato else \
+        pd.to_datetime(serie, errors="coerce")
+    faltando = datas.isna() & serie.notna()
+    if formato and faltando.any():
+        # Snapshots antigos ou já convertidos guardam a data em ISO
+        datas[faltando] = pd.to_datetime(serie[faltando], errors="coerce")
+    return datas.astype(UNIDADE_DATA)
+
+def _categorias(serie, base):
+    observados = [v for v in pd.unique(serie.dropna()) if v not in base]
+    return list(base) + sorted(map(str, observados))
+
+def _para_categoria(serie, base):
+    if isinstance(serie.dtype, CategoricalDtype) and set(base) <= set(serie.cat.categories):
+        return serie
+    preenchidos = serie.notna()
+    serie = serie.astype(object).where(preenchidos, None)
+    serie[preenchidos] = serie[preenchidos].astype(str)
+    return serie.astype(CategoricalDtype(_categorias(serie, base)))
+
+# Converte um DataFrame para o esquema: todas as colunas de colunas_padrao,
+# categorias, datas em datetime64 e inteiros anuláveis
+def aplicar_esquema(df):
+    df = df.reindex(columns=colunas_padrao)
+    for coluna in COLUNAS_DATA:
+        df[coluna] = _para_data(df[coluna], FORMATO_DATA_REGISTRO if coluna == "Data Registro" else None)
+    for coluna in COLUNAS_INTEIRAS:
+        if str(df[coluna].dtype) != "Int32":
+            df[coluna] = pd.to_numeric(df[coluna], errors="coerce").round().astype("Int32")
+    for coluna, base in COLUNAS_CATEGORICAS.items():
+        df[coluna] = _para_categoria(df[coluna], base)
+    for coluna in COLUNAS_TEXTO:
+        if not (pd.api.types.is_object_dtype(df[coluna]) or pd.api.types.is_string_dtype(df[coluna])):
+            df[coluna] = df[coluna].astype(object)
+    return df
+
+# pd.concat de categorias diferentes vira "object"; aqui as categorias são
+# unificadas antes, para que o resultado continue no esquema
+def concatenar(frames):
+    frames = [aplicar_esquema(df) for df in frames]
+    for coluna in COLUNAS_CATEGORICAS:
+        categorias = []
+        vistas = set()
+        for df in frames:
+            for categoria in df[coluna].cat.categories:
+                if categoria not in vistas:
+                    vistas.add(categoria)
+                    categorias.append(categoria)
+        tipo = CategoricalDtype(categorias)
+        for df in frames:
+            if list(df[coluna].cat.categories) != categorias:
+                df[coluna] = df[coluna].cat.set_categories(categorias)
+    frames = [df for df in frames if len(df)] or frames[:1]
+    return pd.concat(frames)
+
+def _converter(coluna, valor):
+    if coluna in COLUNAS_DATA:
+        return pd.to_datetime(valor, errors="coerce",
+                              format=FORMATO_DATA_REGISTRO if coluna == "Data Registro" and isinstance(valor, str) else None)
+    if coluna in COLUNAS_CATEGORICAS and valor is not None and not pd.isna(valor):
+        return str(valor)
+    return valor
+
+# Atribui valores a várias células de uma coluna de uma vez. Cada valor
+# distinto é convertido uma vez só (num lote de vagas, a data de início e a
+# do registro costumam ser as mesmas para todos).
+def atribuir_coluna(df, ids, coluna, valores):
+    convertidos = {}
+    for valor in valores:
+        if (type(valor), valor) not in convertidos:
+            convertidos[(type(valor), valor)] = _converter(coluna, valor)
+    valores = [convertidos[(type(valor), valor)] for valor in valores]
+    if coluna in COLUNAS_CATEGORICAS:
+        novas = [v for v in dict.fromkeys(valores)
+                 if v is not None and not pd.isna(v) and v not in df[coluna].cat.categories]
+        if novas:
+            df[coluna] = df[coluna].cat.add_categories(novas)
+    if len(ids) == 1:
+        df.at[ids[0], coluna] = valores[0]
+    else:
+        df.loc[ids, coluna] = pd.Series(valores, index=ids)
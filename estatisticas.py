@@ -0,0 +1,326 @@
+# Indicadores do painel gerencial, mantidos a cada operação em vez de
+# recalculados com groupby sobre as tabelas inteiras
+import math
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from espera import hoje_referencia
+from esquema import EPOCA, como_texto
+
+# Semanas exibidas no gráfico de admissões
+SEMANAS_PADRAO = 12
+
+QUANTIS_PADRAO = (0.5, 0.9, 0.99)
+
+# Erro relativo máximo dos quantis estimados pelos esboços
+PRECISAO_ESBOCO = 0.01
+
+def _data(valor, dia_primeiro=False):
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    data = pd.to_datetime(valor, errors="coerce", dayfirst=dia_primeiro)
+    return None if pd.isna(data) else data.normalize()
+
+# Dias desde 1970 (None sem data)
+def _dia(valor):
+    data = _data(valor)
+    return None if data is None else (data - EPOCA).days
+
+# Segunda-feira da semana de "Data Registro", gravada como dd/mm/aaaa pelos apps
+def _semana(valor):
+    data = _data(valor, dia_primeiro=True)
+    return None if data is None else (data - pd.Timedelta(days=data.weekday())).date()
+
+def _dias_vetorizado(datas):
+    return (pd.to_datetime(datas, errors="coerce").dt.normalize() - EPOCA).dt.days
+
+# Mês ("2024-05") da data de início no atendimento
+def _mes(valor):
+    data = _data(valor)
+    return None if data is None else data.strftime("%Y-%m")
+
+# Dias entre o primeiro contato e o início do atendimento
+def _espera_admitido(contato, inicio):
+    contato, inicio = _data(contato), _data(inicio)
+    return None if contato is None or inicio is None else (inicio - contato).days
+
+# ============================
+# ESBOÇO DE QUANTIS
+# ============================
+
+# Esboço com baldes logarítmicos: um valor v > 0 cai no balde
+# ceil(log(v) / log(gama)), e qualquer quantil sai com erro relativo de no
+# máximo "precisao". A memória cresce com o log do maior valor (algumas
+# centenas de baldes para décadas de espera em dias), não com a quantidade de
+# valores. Esboços com a mesma precisão se somam com mesclar(), e adicionar com
+# quantidade negativa desfaz uma inclusão.
+class EsbocoQuantis:
+    def __init__(self, precisao=PRECISAO_ESBOCO):
+        self.precisao = precisao
+        self.gama = (1 + precisao) / (1 - precisao)
+        self._log_gama = math.log(self.gama)
+        self.baldes = Counter()  # índice do balde -> quantidade; zero e negativos ficam no balde None
+        self.total = 0
+
+    def balde(self, valor):
+        return None if valor <= 0 else math.ceil(math.log(valor) / self._log_gama)
+
+    def baldes_vetorizado(self, valores):
+        valores = np.asarray(valores, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            indices = np.ceil(np.log(valores) / self._log_gama)
+        return [None if v <= 0 else int(i) for v, i in zip(valores.tolist(), indices.tolist())]
+
+    def adicionar(self, valor, quantidade=1):
+        self._somar(self.balde(valor), quantidade)
+
+    def _somar(self, balde, quantidade):
+        self.baldes[balde] += quantidade
+        self.total += quantidade
+        if self.baldes[balde] <= 0:
+            del self.baldes[balde]
+
+    def mesclar(self, outro):
+        if outro.precisao != self.precisao:
+            raise ValueError("Só é possível mesclar esboços com a mesma precisão")
+        for balde, quantidade in outro.baldes.items():
+            self._somar(balde, quantidade)
+        return self
+
+    def copia(self):
+        return EsbocoQuantis(self.precisao).mesclar(self)
+
+    def quantil(self, q):
+        if self.total <= 0:
+            return None
+        posicao = q * (self.total - 1)
+        acumulado = 0
+        for balde in sorted(self.baldes, key=lambda b: -math.inf if b is None else b):
+            acumulado += self.baldes[balde]
+            if acumulado > posicao:
+                return 0.0 if balde is None else 2 * self.gama ** balde / (self.gama + 1)
+        return None
+
+# Quantis de {valor: quantidade}, exatos
+def _quantis_contagem(contagem, quantis):
+    total = sum(contagem.values())
+    if total <= 0:
+        return [None] * len(quantis)
+    ordenados = sorted(contagem.items())
+    resultado = []
+    for q in quantis:
+        posicao = q * (total - 1)
+        acumulado = 0
+        for valor, quantidade in ordenados:
+            acumulado += quantidade
+            if acumulado > posicao:
+                resultado.append(valor)
+                break
+    return resultado
+
+def _rotulo_quantil(q):
+    return f"p{q * 100:g}"
+
+# Estrutura derivada do CacheDados. Para cada (especialidade, turno) da lista de
+# espera guarda quantos pacientes esperam desde cada dia; média e maior espera
+# saem dessas contagens, que crescem com o número de dias distintos e não com
+# o tamanho da lista. Admissões são contadas por (semana, especialidade) a
+# partir de "Data Registro" dos atendidos.
+#
+# Para os percentis, a espera de quem está na lista sai das mesmas contagens
+# por dia do primeiro contato (exatas, e válidas em qualquer dia sem recálculo);
+# a espera dos atendidos ("Data de Início" - "Data 1º Contato") vai para um
+# EsbocoQuantis por (especialidade, mês de início), somados na consulta.
+#
+# Cada operação retira a contribuição da linha antes dela e soma a de depois,
+# então inclusão, vaga, edição e remoção custam O(1).
+class EstatisticasEspera:
+    def __init__(self):
+        self._espera = {}     # (especialidade, turno) -> Counter {dia do 1º contato: pacientes}
+        self._sem_data = Counter()  # (especialidade, turno) -> pacientes sem data válida
+        self._admissoes = Counter()  # (semana, especialidade) -> pacientes
+        self._esbocos = {}    # (especialidade, mês de início) -> EsbocoQuantis da espera dos atendidos
+        self._trava = threading.Lock()
+
+    # Contagens das linhas de (dados, atendidos) de uma vez, com value_counts:
+    # (especialidade, turno, dia), (semana, especialidade) e
+    # (especialidade, mês, balde do esboço)
+    @staticmethod
+    def _contagens(dados, atendidos):
+        espera = pd.DataFrame({
+            "especialidade": dados["Especialidade"].astype(object),
+            "turno": dados["Horário Preferencial"].astype(object),
+            "dia": _dias_vetorizado(dados["Data 1º Contato"]).astype("Int64"),
+        }).value_counts(dropna=False)
+        registro = pd.to_datetime(atendidos["Data Registro"], errors="coerce", dayfirst=True).dt.normalize()
+        admissoes = pd.DataFrame({
+            "semana": (registro - pd.to_timedelta(registro.dt.weekday, unit="D")).dt.date,
+            "especialidade": atendidos["Especialidade"].astype(object),
+        }).dropna(subset=["semana"]).value_counts(dropna=False)
+        inicio = pd.to_datetime(atendidos["Data de Início"], errors="coerce").dt.normalize()
+        esbocos = pd.DataFrame({
+            "especialidade": atendidos["Especialidade"].astype(object),
+            "mes": inicio.dt.strftime("%Y-%m"),
+            "espera": (inicio - pd.to_datetime(atendidos["Data 1º Contato"], errors="coerce").dt.normalize()).dt.days,
+        }).dropna(subset=["mes", "espera"])
+        esbocos["balde"] = EsbocoQuantis().baldes_vetorizado(esbocos["espera"])
+        return espera, admissoes, esbocos.drop(columns="espera").value_counts(dropna=False)
+
+    # Soma (sinal=1) ou retira (sinal=-1) contagens de _contagens() (chamar com a trava)
+    def _somar_contagens(self, contagens, sinal):
+        espera, admissoes, esbocos = contagens
+        for (especialidade, turno, dia), quantidade in espera.items():
+            grupo = (como_texto(especialidade), como_texto(turno))
+            contagem = self._sem_data if pd.isna(dia) else self._espera.setdefault(grupo, Counter())
+            chave = grupo if pd.isna(dia) else int(dia)
+            contagem[chave] += sinal * int(quantidade)
+            if contagem[chave] <= 0:
+                del contagem[chave]
+        for (semana, especialidade), quantidade in admissoes.items():
+            chave = (semana, como_texto(especialidade))
+            self._admissoes[chave] += sinal * int(quantidade)
+            if self._admissoes[chave] <= 0:
+                del self._admissoes[chave]
+        for (especialidade, mes, balde), quantidade in esbocos.items():
+            chave = (como_texto(especialidade), mes)
+            esboco = self._esbocos.setdefault(chave, EsbocoQuantis())
+            esboco._somar(None if pd.isna(balde) else int(balde), sinal * int(quantidade))
+            if not esboco.total:
+                del self._esbocos[chave]
+
+    def construir(self, dados, atendidos):
+        contagens = self._contagens(dados, atendidos)
+        with self._trava:
+            self._espera = {}
+            self._sem_data = Counter()
+            self._admissoes = Counter()
+            self._esbocos = {}
+            self._somar_contagens(contagens, 1)
+
+    def _contar(self, tabela, df, id_, sinal):
+        especialidade = como_texto(df.at[id_, "Especialidade"])
+        if tabela == "dados":
+            grupo = (especialidade, como_texto(df.at[id_, "Horário Preferencial"]))
+            dia = _dia(df.at[id_, "Data 1º Contato"])
+            contagem = self._sem_data if dia is None else self._espera.setdefault(grupo, Counter())
+            chave = grupo if dia is None else dia
+            contagem[chave] += sinal
+            if contagem[chave] <= 0:
+                del contagem[chave]
+        else:
+            semana = _semana(df.at[id_, "Data Registro"])
+            if semana is not None:
+                self._admissoes[(semana, especialidade)] += sinal
+                if self._admissoes[(semana, especialidade)] <= 0:
+                    del self._admissoes[(semana, especialidade)]
+            espera = _espera_admitido(df.at[id_, "Data 1º Contato"], df.at[id_, "Data de Início"])
+            if espera is not None:
+                chave = (especialidade, _mes(df.at[id_, "Data de Início"]))
+                self._esbocos.setdefault(chave, EsbocoQuantis()).adicionar(espera, sinal)
+                if not self._esbocos[chave].total:
+                    del self._esbocos[chave]
+
+    def aplicar(self, operacao, antes, depois):
+        id_ = int(operacao["id"])
+        with self._trava:
+            for tabela, df in zip(("dados", "atendidos"), antes):
+                if id_ in df.index:
+                    self._contar(tabela, df, id_, -1)
+            for tabela, df in zip(("dados", "atendidos"), depois):
+                if id_ in df.index:
+                    self._contar(tabela, df, id_, 1)
+
+    # Lote: retira as linhas de antes e soma as de depois com as mesmas
+    # contagens vetorizadas da construção, em vez de uma consulta por linha
+    def aplicar_lote(self, operacao, antes, depois):
+        ids = pd.Index(operacao["ids"])
+        retirar = self._contagens(*(df.loc[df.index.intersection(ids)] for df in antes))
+        somar = self._contagens(*(df.loc[df.index.intersection(ids)] for df in depois))
+        with self._trava:
+            self._somar_contagens(retirar, -1)
+            self._somar_contagens(somar, 1)
+
+    # ============================
+    # CONSULTAS
+    # ============================
+
+    # Uma linha por (especialidade, turno): pacientes, média e maior espera em dias
+    def resumo(self, hoje=None):
+        hoje = (hoje_referencia() if hoje is None else pd.Timestamp(hoje).normalize()) - EPOCA
+        with self._trava:
+            grupos = {grupo: dict(dias) for grupo, dias in self._espera.items() if dias}
+            sem_data = dict(self._sem_data)
+        linhas = []
+        for grupo in sorted(set(grupos) | set(sem_data), key=lambda g: (g[0] or "", g[1] or "")):
+            dias = grupos.get(grupo, {})
+            com_data = sum(dias.values())
+            media = hoje.days - sum(dia * n for dia, n in dias.items()) / com_data if com_data else None
+            maior = hoje.days - min(dias) if dias else None
+            linhas.append((*grupo, com_data + sem_data.get(grupo, 0), media, maior))
+        resumo = pd.DataFrame(linhas, columns=["Especialidade", "Turno", "Pacientes",
+                                               "Média de Espera (dias)", "Maior Espera (dias)"])
+        resumo["Média de Espera (dias)"] = resumo["Média de Espera (dias)"].astype(float).round(1)
+        return resumo
+
+    # Admissões por semana (linhas, a partir da segunda-feira) e especialidade
+    # (colunas), nas últimas "semanas" semanas
+    def admissoes_por_semana(self, semanas=SEMANAS_PADRAO, hoje=None):
+        hoje = hoje_referencia() if hoje is None else pd.Timestamp(hoje).normalize()
+        fim = (hoje - pd.Timedelta(days=hoje.weekday())).date()
+        inicio = fim - pd.Timedelta(weeks=semanas - 1)
+        with self._trava:
+            contagens = [(semana, especialidade, n) for (semana, especialidade), n in self._admissoes.items()
+                         if inicio <= semana <= fim]
+        todas = pd.date_range(inicio, fim, freq="W-MON").date
+        if not contagens:
+            return pd.DataFrame(index=pd.Index(todas, name="Semana"))
+        tabela = pd.DataFrame(contagens, columns=["Semana", "Especialidade", "Admissões"])
+        tabela = tabela.pivot_table(index="Semana", columns="Especialidade", values="Admissões", aggfunc="sum")
+        return tabela.reindex(todas, fill_value=0).fillna(0).astype(int).rename_axis("Semana")
+
+    # Admissões por especialidade nas "semanas" semanas completas antes da atual
+    def admissoes_recentes(self, semanas=SEMANAS_PADRAO, hoje=None):
+        hoje = hoje_referencia() if hoje is None else pd.Timestamp(hoje).normalize()
+        fim = (hoje - pd.Timedelta(days=hoje.weekday() + 7)).date()
+        inicio = fim - pd.Timedelta(weeks=semanas - 1)
+        recentes = Counter()
+        with self._trava:
+            for (semana, especialidade), n in self._admissoes.items():
+                if inicio <= semana <= fim:
+                    recentes[especialidade] += n
+        return dict(recentes)
+
+    # Percentis da espera em dias por especialidade. "em espera" usa quem ainda
+    # está na lista (espera até hoje); "atendidos" usa os esboços dos meses de
+    # início entre desde e ate ("aaaa-mm", inclusive; None = sem limite).
+    def percentis(self, quantis=QUANTIS_PADRAO, hoje=None, desde=None, ate=None):
+        hoje = (hoje_referencia() if hoje is None else pd.Timestamp(hoje).normalize()) - EPOCA
+        with self._trava:
+            espera = {}
+            for (especialidade, _), dias in self._espera.items():
+                contagem = espera.setdefault(especialidade, Counter())
+                for dia, quantidade in dias.items():
+                    contagem[hoje.days - dia] += quantidade
+            atendidos = {}
+            for (especialidade, mes), esboco in self._esbocos.items():
+                if (desde is None or mes >= desde) and (ate is None or mes <= ate):
+                    if especialidade in atendidos:
+                        atendidos[especialidade].mesclar(esboco)
+                    else:
+                        atendidos[especialidade] = esboco.copia()
+        linhas = []
+        for especialidade in sorted(set(espera) | set(atendidos), key=lambda e: e or ""):
+            contagem = espera.get(especialidade, Counter())
+            esboco = atendidos.get(especialidade)
+            linhas.append([especialidade, sum(contagem.values())] + _quantis_contagem(contagem, quantis)
+                          + [esboco.total if esboco else 0]
+                          + [esboco.quantil(q) if esboco else None for q in quantis])
+        colunas = (["Especialidade", "Em espera"] + [f"{_rotulo_quantil(q)} em espera" for q in quantis]
+                   + ["Atendidos"] + [f"{_rotulo_quantil(q)} atendidos" for q in quantis])
+        resultado = pd.DataFrame(linhas, columns=colunas)
+        rotulos = [f"{_rotulo_quantil(q)} atendidos" for q in quantis]
+        resultado[rotulos] = resultado[rotulos].astype(float).round()
+        return resultado
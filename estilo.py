@@ -0,0 +1,56 @@
+# Coloração da lista de espera conforme o tempo de espera
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+COLUNA_ESPERA = "Dias de Espera"
+
+# Faixas: menos de 15 dias, menos de 30 dias, 30 dias ou mais
+LIMITES_ESPERA = [15, 30]
+CORES_ESPERA = np.array([
+    'background-color: #d4edda',  # Verde claro
+    'background-color: #fff3cd',  # Amarelo
+    'background-color: #f8d7da',  # Vermelho claro
+    '',                           # Sem data de contato
+])
+
+# Quantos vetores de cores manter em memória (um por combinação de chave)
+TAMANHO_CACHE_ESTILO = 32
+
+_cache_cores = OrderedDict()
+_trava_cores = threading.Lock()
+
+# Faixa de cada linha calculada de uma vez para a coluna inteira
+def classificar_espera(dias):
+    dias = pd.to_numeric(pd.Series(dias), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    faixas = np.digitize(dias, LIMITES_ESPERA)
+    faixas[np.isnan(dias)] = len(CORES_ESPERA) - 1
+    return faixas
+
+def cores_espera(dias):
+    return CORES_ESPERA[classificar_espera(dias)]
+
+# Aplica as cores apenas na coluna "Dias de Espera". Com uma chave (ex.: versão
+# dos dados + data de hoje + página exibida), as cores ficam em cache até ela
+# mudar. O Styler é sempre novo: o Streamlit o recalcula ao desenhar e ele não
+# pode ser compartilhado entre sessões.
+def aplicar_estilo(df, chave=None):
+    estilo = df.style
+    if COLUNA_ESPERA not in df.columns:
+        return estilo
+    cores = None
+    if chave is not None:
+        with _trava_cores:
+            cores = _cache_cores.get(chave)
+            if cores is not None:
+                _cache_cores.move_to_end(chave)
+    if cores is None:
+        cores = cores_espera(df[COLUNA_ESPERA])
+        if chave is not None:
+            with _trava_cores:
+                _cache_cores[chave] = cores
+                while len(_cache_cores) > TAMANHO_CACHE_ESTILO:
+                    _cache_cores.popitem(last=False)
+    return estilo.apply(lambda _coluna: cores, subset=[COLUNA_ESPERA])
@@ -0,0 +1,151 @@
+# Exportação da lista de espera e dos atendidos
+import gzip
+import io
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from io import BytesIO
+
+import pandas as pd
+
+from metricas import DURACAO_EXPORTACAO, EXPORTACOES
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Linhas convertidas por vez na exportação em blocos
+TAMANHO_BLOCO = 5_000
+
+ABAS = {"dados": "Em Espera", "atendidos": "Atendidos"}
+
+# Formatos da exportação em blocos: extensão do arquivo e tipo MIME
+FORMATOS_STREAMING = {
+    "xlsx": (".xlsx", MIME_XLSX),
+    "csv.gz": (".csv.gz", "application/gzip"),
+    "zip": (".zip", "application/zip"),
+}
+
+# Quantas versões do arquivo manter em memória
+TAMANHO_CACHE_EXPORTACAO = 4
+
+_cache_excel = OrderedDict()
+_trava = threading.Lock()
+
+def gerar_excel(dados, atendidos):
+    inicio = time.perf_counter()
+    saida = BytesIO()
+    with pd.ExcelWriter(saida, engine="xlsxwriter") as writer:
+        dados.to_excel(writer, sheet_name="Em Espera", index=False)
+        atendidos.to_excel(writer, sheet_name="Atendidos", index=False)
+    _contar_exportacao("xlsx", "memoria", inicio)
+    return saida.getvalue()
+
+def _contar_exportacao(formato, metodo, inicio):
+    EXPORTACOES.incrementar(formato=formato, metodo=metodo)
+    DURACAO_EXPORTACAO.observar(time.perf_counter() - inicio, formato=formato, metodo=metodo)
+
+# Devolve o Excel da versão indicada, gerando-o só se ainda não estiver em cache.
+# A chave deve mudar sempre que os dados mudarem (ex.: versão do cache + dia).
+def excel_em_cache(chave, dados, atendidos):
+    with _trava:
+        if chave in _cache_excel:
+            _cache_excel.move_to_end(chave)
+            return _cache_excel[chave]
+    conteudo = gerar_excel(dados, atendidos)
+    with _trava:
+        _cache_excel[chave] = conteudo
+        while len(_cache_excel) > TAMANHO_CACHE_EXPORTACAO:
+            _cache_excel.popitem(last=False)
+    return conteudo
+
+def excel_disponivel(chave):
+    with _trava:
+        return chave in _cache_excel
+
+# ============================
+# EXPORTAÇÃO EM BLOCOS
+# ============================
+# Escreve direto em um arquivo temporário, TAMANHO_BLOCO linhas por vez, sem
+# montar o arquivo inteiro na memória. O pico de memória depende do tamanho do
+# bloco e não do número de linhas.
+
+def _blocos(df, tamanho=TAMANHO_BLOCO):
+    for inicio in range(0, len(df), tamanho):
+        yield df.iloc[inicio:inicio + tamanho]
+
+def escrever_csv_em_blocos(df, saida_texto, tamanho=TAMANHO_BLOCO):
+    df.iloc[:0].to_csv(saida_texto, index=False)
+    for bloco in _blocos(df, tamanho):
+        bloco.to_csv(saida_texto, index=False, header=False)
+
+def escrever_xlsx_em_blocos(tabelas, caminho, tamanho=TAMANHO_BLOCO):
+    import xlsxwriter
+
+    # constant_memory: cada linha vai para o disco assim que a próxima começa
+    with xlsxwriter.Workbook(caminho, {"constant_memory": True,
+                                       "default_date_format": "dd/mm/yyyy"}) as planilha:
+        for aba, df in tabelas.items():
+            folha = planilha.add_worksheet(aba)
+            folha.write_row(0, 0, list(df.columns))
+            linha = 1
+            for bloco in _blocos(df, tamanho):
+                bloco = bloco.astype(object).where(bloco.notna(), None)
+                for valores in bloco.itertuples(index=False, name=None):
+                    folha.write_row(linha, 0, valores)
+                    linha += 1
+
+def exportar_em_blocos(dados, atendidos, formato, caminho, tamanho=TAMANHO_BLOCO):
+    inicio = time.perf_counter()
+    tabelas = {"dados": dados, "atendidos": atendidos}
+    if formato == "xlsx":
+        escrever_xlsx_em_blocos({ABAS[n]: df for n, df in tabelas.items()}, caminho, tamanho)
+    elif formato == "csv.gz":
+        # As duas listas em um único CSV, identificadas pela coluna "Situação"
+        with gzip.open(caminho, "wt", encoding="utf-8", newline="") as saida:
+            cabecalho = True
+            for nome, df in tabelas.items():
+                for bloco in _blocos(df, tamanho):
+                    bloco.assign(**{"Situação": ABAS[nome]}).to_csv(saida, index=False, header=cabecalho)
+                    cabecalho = False
+            if cabecalho:
+                dados.iloc[:0].assign(**{"Situação": None}).to_csv(saida, index=False)
+    elif formato == "zip":
+        with zipfile.ZipFile(caminho, "w", compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+            for nome, df in tabelas.items():
+                with arquivo_zip.open(f"{nome}.csv", "w") as binario:
+                    with io.TextIOWrapper(binario, encoding="utf-8", newline="") as saida:
+                        escrever_csv_em_blocos(df, saida, tamanho)
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    _contar_exportacao(formato, "blocos", inicio)
+    return caminho
+
+_cache_arquivos = OrderedDict()
+
+# Como excel_em_cache, mas devolve o caminho de um arquivo temporário. Arquivos
+# que saem do cache são apagados.
+def arquivo_em_cache(chave, formato, dados, atendidos):
+    chave = (chave, formato)
+    with _trava:
+        caminho = _cache_arquivos.get(chave)
+        if caminho and os.path.exists(caminho):
+            _cache_arquivos.move_to_end(chave)
+            return caminho
+
+    descritor, caminho = tempfile.mkstemp(prefix="lista_reabilitacao_", suffix=FORMATOS_STREAMING[formato][0])
+    os.close(descritor)
+    try:
+        exportar_em_blocos(dados, atendidos, formato, caminho)
+    except Exception:
+        os.remove(caminho)
+        raise
+
+    with _trava:
+        _cache_arquivos[chave] = caminho
+        while len(_cache_arquivos) > TAMANHO_CACHE_EXPORTACAO:
+            _, antigo = _cache_arquivos.popitem(last=False)
+            if os.path.exists(antigo):
+                os.remove(antigo)
+    return caminho
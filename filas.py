@@ -0,0 +1,158 @@
+# Filas de prioridade por especialidade: quem chamar quando abre uma vaga
+import heapq
+import math
+import threading
+
+import pandas as pd
+
+from esquema import EPOCA, como_texto
+
+# Turnos de paciente aceitos por uma vaga em cada turno
+TURNOS_COMPATIVEIS = {
+    "Manhã": ("Manhã", "Indiferente"),
+    "Tarde": ("Tarde", "Indiferente"),
+}
+
+# Dias desde 1970; datas ausentes vão para o fim da fila
+def _chave_data(data):
+    return math.inf if pd.isna(data) else (pd.Timestamp(data).normalize() - EPOCA).days
+
+def _chaves_data(datas):
+    dias = (pd.to_datetime(datas, errors="coerce").dt.normalize() - EPOCA).dt.days
+    return dias.astype(float).fillna(math.inf).tolist()
+
+# (id, (especialidade, turno, chave)) de cada linha, com as datas convertidas de uma vez
+def _entradas(dados):
+    colunas = zip(dados.index.tolist(), dados["Especialidade"].tolist(),
+                  dados["Horário Preferencial"].tolist(), _chaves_data(dados["Data 1º Contato"]))
+    for id_, especialidade, turno, chave in colunas:
+        yield id_, (como_texto(especialidade), como_texto(turno), chave)
+
+# Um heap por (especialidade, turno preferido), ordenado pela data do primeiro
+# contato. Saídas da fila são removidas de forma preguiçosa: a entrada fica no
+# heap e é ignorada na consulta, então inclusão, remoção e consulta dos N
+# próximos custam O(log n) por paciente envolvido.
+#
+# Várias sessões consultam as mesmas filas enquanto uma delas grava: toda
+# leitura e alteração dos heaps passa pela mesma trava, e a consulta não mexe
+# no heap.
+class FilasPrioridade:
+    def __init__(self):
+        self._heaps = {}
+        self._ativos = {}  # id -> (especialidade, turno, chave)
+        self._tamanhos = {}  # (especialidade, turno) -> pacientes ativos
+        self._trava = threading.Lock()
+
+    def construir(self, dados, atendidos):
+        heaps = {}
+        ativos = {}
+        for id_, entrada in _entradas(dados):
+            ativos[id_] = entrada
+            heaps.setdefault(entrada[:2], []).append((entrada[2], id_))
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        with self._trava:
+            self._heaps = heaps
+            self._ativos = ativos
+            self._tamanhos = {fila: len(heap) for fila, heap in heaps.items()}
+
+    def _incluir(self, id_, entrada):
+        self._ativos[id_] = entrada
+        self._tamanhos[entrada[:2]] = self._tamanhos.get(entrada[:2], 0) + 1
+        heapq.heappush(self._heaps.setdefault(entrada[:2], []), (entrada[2], id_))
+
+    def _excluir(self, id_):
+        entrada = self._ativos.pop(id_, None)
+        if entrada is None:
+            return
+        fila = entrada[:2]
+        self._tamanhos[fila] -= 1
+        # Reconstrói o heap quando a maior parte dele já é lixo
+        heap = self._heaps.get(fila, [])
+        if len(heap) > 64 and len(heap) > 2 * self._tamanhos[fila]:
+            self._heaps[fila] = [(c, i) for c, i in heap if self._valida(fila, c, i)]
+            heapq.heapify(self._heaps[fila])
+
+    def tamanho(self, especialidade):
+        with self._trava:
+            return sum(n for (e, _), n in self._tamanhos.items() if e == especialidade)
+
+    def _valida(self, fila, chave, id_):
+        return self._ativos.get(id_) == (*fila, chave)
+
+    def aplicar(self, operacao, antes, depois):
+        id_ = int(operacao["id"])
+        tipo = operacao["op"]
+        incluir = ((tipo == "adicionar" and operacao["tabela"] == "dados")
+                   or (tipo == "editar" and operacao["tabela"] == "dados" and id_ in depois[0].index))
+        entrada = None
+        if incluir:
+            linha = depois[0].loc[id_]
+            entrada = (como_texto(linha["Especialidade"]), como_texto(linha["Horário Preferencial"]),
+                       _chave_data(linha["Data 1º Contato"]))
+        with self._trava:
+            # Edição que não muda a posição na fila: a entrada do heap continua valendo
+            if incluir and self._ativos.get(id_) == entrada:
+                return
+            if incluir or tipo in ("mover", "remover"):
+                self._excluir(id_)
+            if incluir:
+                self._incluir(id_, entrada)
+
+    # Lote inteiro de uma vez: as chaves saem de uma conversão só e, quando o
+    # lote é grande perto da fila, as entradas são anexadas e o heap refeito
+    # uma vez em vez de receber um heappush por paciente
+    def aplicar_lote(self, operacao, antes, depois):
+        ids = [int(id_) for id_ in operacao["ids"]]
+        incluir = operacao["op"] == "adicionar_lote" and operacao["tabela"] == "dados"
+        if not incluir and operacao["op"] != "mover_lote":
+            return
+        novas = {}
+        if incluir:
+            for id_, entrada in _entradas(depois[0].loc[ids]):
+                novas.setdefault(entrada[:2], []).append((id_, entrada))
+        with self._trava:
+            for id_ in ids:
+                self._excluir(id_)
+            for fila, entradas in novas.items():
+                heap = self._heaps.setdefault(fila, [])
+                for id_, entrada in entradas:
+                    self._ativos[id_] = entrada
+                self._tamanhos[fila] = self._tamanhos.get(fila, 0) + len(entradas)
+                if len(entradas) > len(heap) // 8:
+                    heap.extend((entrada[2], id_) for id_, entrada in entradas)
+                    heapq.heapify(heap)
+                else:
+                    for id_, entrada in entradas:
+                        heapq.heappush(heap, (entrada[2], id_))
+
+    # Os n menores válidos do heap sem retirar nada dele: percorre a árvore a
+    # partir da raiz, sempre pelo menor nó ainda não visitado (chamar com a
+    # trava). Um paciente que saiu da posição e voltou a ela tem duas entradas
+    # iguais no heap; só a primeira conta.
+    def _topo(self, fila, n):
+        heap = self._heaps.get(fila, [])
+        encontrados = []
+        vistos = set()
+        fronteira = [(heap[0], 0)] if heap else []
+        while fronteira and len(encontrados) < n:
+            (chave, id_), posicao = heapq.heappop(fronteira)
+            if id_ not in vistos and self._valida(fila, chave, id_):
+                vistos.add(id_)
+                encontrados.append((chave, id_))
+            for filho in (2 * posicao + 1, 2 * posicao + 2):
+                if filho < len(heap):
+                    heapq.heappush(fronteira, (heap[filho], filho))
+        return encontrados
+
+    # Ids dos próximos n pacientes da especialidade. Com turno, só entram
+    # pacientes compatíveis com ele; priorizar_turno coloca quem pediu
+    # exatamente aquele turno à frente de quem marcou "Indiferente".
+    def proximos(self, especialidade, n=5, turno=None, priorizar_turno=False):
+        candidatos = []
+        with self._trava:
+            turnos = TURNOS_COMPATIVEIS.get(turno) or [t for e, t in self._heaps if e == especialidade]
+            for turno_paciente in turnos:
+                prioridade = 0 if (priorizar_turno and turno_paciente == turno) else 1
+                candidatos += [(prioridade, chave, id_) for chave, id_ in self._topo((especialidade, turno_paciente), n)]
+        return [id_ for _, _, id_ in sorted(candidatos)[:n]]
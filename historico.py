@@ -0,0 +1,173 @@
+# Fotografias diárias da lista, guardadas como diferenças comprimidas, para
+# consultar como estavam "dados" e "atendidos" em uma data passada
+import gzip
+import json
+import os
+import threading
+from datetime import date
+
+import pandas as pd
+
+from armazenamento import TABELAS, _serializar, trava_arquivo
+from esquema import COLUNAS_CATEGORICAS, COLUNAS_DATA, COLUNAS_INTEIRAS, aplicar_esquema, colunas_padrao, concatenar
+
+PASTA_HISTORICO = "historico"
+
+# Uma fotografia por dia, em PASTA_HISTORICO/aaaa-mm-dd.json.gz. A primeira é
+# completa; as seguintes guardam só o que mudou desde a anterior:
+#   {"data": "2024-05-02", "tabelas": {"dados": {"removidos": [ids],
+#     "colunas": [...], "ids": [...], "linhas": [[...], ...]}, "atendidos": {...}}}
+# "linhas" são as linhas novas ou alteradas, inteiras. O espaço em disco cresce
+# com o número de alterações por dia, não com o tamanho da lista.
+#
+# A comparação é pelo id da linha, que todos os modos de armazenamento gravam
+# (no modo csv, a coluna _id). Se os CSVs forem regravados sem ela (por uma
+# versão antiga do app), as linhas são renumeradas na carga e a fotografia
+# daquele dia guarda a lista inteira: continua correta, só não é pequena.
+#
+# A fotografia de um dia é o estado no início dele (tirada na virada do dia ou
+# na primeira vez que o app sobe naquele dia).
+
+def _nome_arquivo(data):
+    return f"{data.isoformat()}.json.gz"
+
+def _data_do_arquivo(nome):
+    try:
+        return date.fromisoformat(nome[:-len(".json.gz")]) if nome.endswith(".json.gz") else None
+    except ValueError:
+        return None
+
+# Representação comparável entre cargas: mesmas unidades de data, categorias
+# como texto e inteiros como float (NaN para vazios)
+def _comparavel(df):
+    df = aplicar_esquema(df)
+    colunas = {}
+    for coluna in colunas_padrao:
+        serie = df[coluna]
+        if coluna in COLUNAS_DATA:
+            serie = serie.astype("datetime64[s]")
+        elif coluna in COLUNAS_INTEIRAS:
+            serie = serie.astype("Float64").astype(float)
+        elif coluna in COLUNAS_CATEGORICAS:
+            serie = serie.astype(object)
+        else:
+            serie = serie.astype(object).where(serie.notna(), None)
+        colunas[coluna] = serie
+    return pd.DataFrame(colunas, index=df.index)
+
+def _hash_linhas(df):
+    return pd.util.hash_pandas_object(_comparavel(df), index=False)
+
+# Ids removidos e linhas novas ou alteradas de "anterior" para "atual"
+def diferenca(anterior, atual):
+    removidos = anterior.index.difference(atual.index)
+    comuns = atual.index.intersection(anterior.index)
+    hash_atual = _hash_linhas(atual)
+    alterados = comuns[(hash_atual.loc[comuns].to_numpy() != _hash_linhas(anterior).loc[comuns].to_numpy())]
+    novos = atual.index.difference(anterior.index)
+    return removidos, atual.loc[atual.index.isin(alterados.union(novos))]
+
+def _para_json(removidos, linhas):
+    valores = linhas[colunas_padrao].astype(object).where(linhas[colunas_padrao].notna(), None)
+    return {
+        "removidos": [int(i) for i in removidos],
+        "colunas": colunas_padrao,
+        "ids": [int(i) for i in linhas.index],
+        "linhas": valores.to_numpy().tolist(),
+    }
+
+def _de_json(tabela):
+    linhas = pd.DataFrame(tabela["linhas"], index=pd.Index(tabela["ids"], dtype="int64"),
+                          columns=tabela["colunas"])
+    return aplicar_esquema(linhas)
+
+# Aplica de uma vez a versão final de cada id alterado ({id: linha ou None se
+# removido}), para que reconstruir muitos dias não copie a tabela a cada dia
+def _aplicar(df, finais):
+    retirar = df.index.intersection(pd.Index(list(finais), dtype="int64"))
+    linhas = {id_: linha for id_, linha in finais.items() if linha is not None}
+    df = df.drop(index=retirar)
+    if linhas:
+        novas = pd.DataFrame.from_dict(linhas, orient="index").reindex(columns=colunas_padrao)
+        df = concatenar([df, novas])
+    return aplicar_esquema(df.sort_index())
+
+def _tabela_vazia():
+    return aplicar_esquema(pd.DataFrame(columns=colunas_padrao, index=pd.Index([], dtype="int64")))
+
+class HistoricoDiario:
+    def __init__(self, pasta=PASTA_HISTORICO):
+        self.pasta = pasta
+        self._ultima = None   # (data, dados, atendidos) da fotografia mais recente
+        self._base = None     # (data, dados, atendidos) da primeira fotografia, já lida
+        self._trava = threading.Lock()
+
+    def datas(self):
+        if not os.path.isdir(self.pasta):
+            return []
+        return sorted(d for d in map(_data_do_arquivo, os.listdir(self.pasta)) if d is not None)
+
+    def tamanho_em_disco(self):
+        return sum(os.path.getsize(os.path.join(self.pasta, _nome_arquivo(d))) for d in self.datas())
+
+    def _ler(self, data):
+        with gzip.open(os.path.join(self.pasta, _nome_arquivo(data)), "rt", encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+
+    def _gravar(self, data, conteudo):
+        caminho = os.path.join(self.pasta, _nome_arquivo(data))
+        temporario = caminho + ".tmp"
+        with gzip.open(temporario, "wt", encoding="utf-8", compresslevel=6) as arquivo:
+            json.dump(conteudo, arquivo, default=_serializar, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporario, caminho)
+
+    # Lê a primeira fotografia (completa) e junta as diferenças dos dias
+    # seguintes guardando só a versão mais recente de cada id
+    def _reconstruir(self, datas, ate):
+        pendentes = [d for d in datas if d <= ate]
+        if self._ultima is not None and self._ultima[0] == pendentes[-1]:
+            return list(self._ultima[1:])
+        if self._base is None or self._base[0] != pendentes[0]:
+            conteudo = self._ler(pendentes[0])
+            self._base = (pendentes[0], *(_de_json(conteudo["tabelas"][nome]) for nome in TABELAS))
+        finais = [{} for _ in TABELAS]
+        for data in pendentes[1:]:
+            conteudo = self._ler(data)
+            for i, nome in enumerate(TABELAS):
+                tabela = conteudo["tabelas"][nome]
+                for id_ in tabela["removidos"]:
+                    finais[i][id_] = None
+                for id_, linha in zip(tabela["ids"], tabela["linhas"]):
+                    finais[i][id_] = dict(zip(tabela["colunas"], linha))
+        return [_aplicar(df, f) for df, f in zip(self._base[1:], finais)]
+
+    # Grava a fotografia do dia (hoje por padrão) se ela for mais nova que a
+    # última gravada. Devolve True se gravou.
+    def fotografar(self, dados, atendidos, data=None):
+        data = date.today() if data is None else data
+        os.makedirs(self.pasta, exist_ok=True)
+        with self._trava, trava_arquivo(os.path.join(self.pasta, ".lock")):
+            datas = self.datas()
+            # Só acrescenta no fim: uma fotografia no meio quebraria a cadeia
+            if datas and data <= datas[-1]:
+                return False
+            anteriores = datas
+            if self._ultima is None or not anteriores or self._ultima[0] != anteriores[-1]:
+                # Primeira fotografia deste processo, ou outro processo gravou depois
+                base = self._reconstruir(datas, anteriores[-1]) if anteriores else [_tabela_vazia(), _tabela_vazia()]
+                self._ultima = (anteriores[-1] if anteriores else None, *base)
+            conteudo = {"data": data.isoformat(), "tabelas": {}}
+            for nome, anterior, atual in zip(TABELAS, self._ultima[1:], (dados, atendidos)):
+                conteudo["tabelas"][nome] = _para_json(*diferenca(anterior, atual))
+            self._gravar(data, conteudo)
+            self._ultima = (data, aplicar_esquema(dados), aplicar_esquema(atendidos))
+            return True
+
+    # (dados, atendidos) como estavam no início do dia "data", ou None se a
+    # data for anterior à primeira fotografia
+    def em(self, data):
+        with self._trava:
+            datas = self.datas()
+            if not datas or data < datas[0]:
+                return None
+            return tuple(self._reconstruir(datas, data))
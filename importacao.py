@@ -0,0 +1,163 @@
+# Importação em lote de pacientes a partir de CSV ou XLSX
+import unicodedata
+
+import pandas as pd
+
+from esquema import ESPECIALIDADES, HORARIOS, colunas_padrao
+from indice import normalizar_carteirinha
+
+# Linhas validadas por vez; o arquivo nunca é lido inteiro para a memória
+TAMANHO_BLOCO_IMPORTACAO = 5_000
+
+# Outros nomes aceitos no cabeçalho do arquivo
+SINONIMOS_COLUNAS = {
+    "nº da carteirinha": "Nº Carteirinha",
+    "carteirinha": "Nº Carteirinha",
+    "numero da carteirinha": "Nº Carteirinha",
+    "data do primeiro contato": "Data 1º Contato",
+    "data primeiro contato": "Data 1º Contato",
+    "turno preferido": "Horário Preferencial",
+    "turno": "Horário Preferencial",
+    "profissional preferido": "Profissional Indicado",
+}
+
+class ErroImportacao(ValueError):
+    pass
+
+def _sem_acentos(texto):
+    texto = unicodedata.normalize("NFKD", str(texto).strip().lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+_COLUNAS_POR_CHAVE = {_sem_acentos(c): c for c in colunas_padrao}
+_COLUNAS_POR_CHAVE.update({_sem_acentos(k): v for k, v in SINONIMOS_COLUNAS.items()})
+_ESPECIALIDADES_POR_CHAVE = {_sem_acentos(e): e for e in ESPECIALIDADES}
+_HORARIOS_POR_CHAVE = {_sem_acentos(h): h for h in HORARIOS}
+
+def _renomear_colunas(colunas):
+    return {c: _COLUNAS_POR_CHAVE[_sem_acentos(c)] for c in colunas if _sem_acentos(c) in _COLUNAS_POR_CHAVE}
+
+# ============================
+# LEITURA EM BLOCOS
+# ============================
+
+def _blocos_csv(arquivo, tamanho):
+    for bloco in pd.read_csv(arquivo, dtype=str, chunksize=tamanho, keep_default_na=False,
+                             sep=None, engine="python", encoding="utf-8-sig"):
+        yield bloco
+
+def _blocos_xlsx(arquivo, tamanho):
+    from openpyxl import load_workbook
+
+    planilha = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        linhas = planilha.worksheets[0].iter_rows(values_only=True)
+        cabecalho = [str(c) if c is not None else "" for c in next(linhas, [])]
+        bloco = []
+        for linha in linhas:
+            bloco.append(linha)
+            if len(bloco) >= tamanho:
+                yield pd.DataFrame(bloco, columns=cabecalho)
+                bloco = []
+        if bloco:
+            yield pd.DataFrame(bloco, columns=cabecalho)
+    finally:
+        planilha.close()
+
+def ler_em_blocos(arquivo, nome_arquivo, tamanho=TAMANHO_BLOCO_IMPORTACAO):
+    nome = nome_arquivo.lower()
+    if nome.endswith(".csv"):
+        return _blocos_csv(arquivo, tamanho)
+    if nome.endswith(".xlsx"):
+        return _blocos_xlsx(arquivo, tamanho)
+    raise ErroImportacao(f"Formato não suportado: {nome_arquivo} (use .csv ou .xlsx)")
+
+# ============================
+# VALIDAÇÃO
+# ============================
+
+def _texto(serie):
+    return serie.astype(object).where(serie.notna(), "").astype(str).str.strip()
+
+# Aceita aaaa-mm-dd, dd/mm/aaaa e células de data do Excel
+def _datas(serie):
+    datas = pd.to_datetime(serie, format="%Y-%m-%d", errors="coerce")
+    for formato in ("%d/%m/%Y", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M"):
+        faltando = datas.isna() & serie.notna()
+        if not faltando.any():
+            break
+        datas[faltando] = pd.to_datetime(serie[faltando], format=formato, errors="coerce")
+    return datas
+
+# Valida e normaliza um bloco. Devolve os registros válidos (no esquema de
+# colunas_padrao) e a lista de erros como (linha no arquivo, mensagem).
+# carteirinhas_vistas acumula as carteirinhas do arquivo entre blocos;
+# carteirinha_existente diz se ela já está na lista de espera.
+def validar_bloco(bloco, primeira_linha, carteirinhas_vistas, carteirinha_existente=None):
+    bloco = bloco.rename(columns=_renomear_colunas(bloco.columns))
+    bloco = bloco.loc[:, ~bloco.columns.duplicated()].reindex(columns=colunas_padrao)
+    bloco.index = range(primeira_linha, primeira_linha + len(bloco))
+
+    normalizado = pd.DataFrame(index=bloco.index)
+    for coluna in colunas_padrao:
+        normalizado[coluna] = _texto(bloco[coluna]) if coluna != "Data 1º Contato" else bloco[coluna]
+
+    erros = {}
+    def marcar(mascara, mensagem):
+        for linha in mascara[mascara].index:
+            erros.setdefault(linha, []).append(mensagem)
+
+    marcar(normalizado["Nome"] == "", "nome em branco")
+
+    especialidade = normalizado["Especialidade"].map(lambda e: _ESPECIALIDADES_POR_CHAVE.get(_sem_acentos(e)))
+    marcar(especialidade.isna(), "especialidade inválida")
+    normalizado["Especialidade"] = especialidade
+
+    horario = normalizado["Horário Preferencial"].replace("", "Indiferente")
+    horario = horario.map(lambda h: _HORARIOS_POR_CHAVE.get(_sem_acentos(h)))
+    marcar(horario.isna(), "turno inválido (use Manhã, Tarde ou Indiferente)")
+    normalizado["Horário Preferencial"] = horario
+
+    datas = _datas(bloco["Data 1º Contato"])
+    marcar(datas.isna(), "data do primeiro contato inválida")
+    marcar(datas > pd.Timestamp.today(), "data do primeiro contato no futuro")
+    normalizado["Data 1º Contato"] = datas
+    # Calculado a cada dia pela lista de espera (espera.DiasEsperaMaterializados)
+    normalizado["Dias de Espera"] = None
+
+    normalizado["Preferência Profissional"] = (normalizado["Profissional Indicado"] != "").map({True: "Sim", False: "Não"})
+    normalizado["Vaga Concedida"] = "Não"
+
+    carteirinhas = normalizado["Nº Carteirinha"].map(normalizar_carteirinha)
+    for linha, carteirinha in carteirinhas.dropna().items():
+        if carteirinha in carteirinhas_vistas:
+            erros.setdefault(linha, []).append(f"carteirinha repetida no arquivo (linha {carteirinhas_vistas[carteirinha]})")
+        elif carteirinha_existente is not None and carteirinha_existente(carteirinha):
+            erros.setdefault(linha, []).append("carteirinha já está na lista de espera")
+        else:
+            carteirinhas_vistas[carteirinha] = linha
+
+    validos = normalizado.drop(index=list(erros))
+    lista_erros = [(linha, "; ".join(mensagens)) for linha, mensagens in sorted(erros.items())]
+    return validos, lista_erros
+
+# Lê o arquivo em blocos e valida cada um. Só os registros válidos ficam em
+# memória, prontos para serem gravados de uma vez com "adicionar_lote".
+def preparar_importacao(arquivo, nome_arquivo, usuario, carteirinha_existente=None,
+                        tamanho=TAMANHO_BLOCO_IMPORTACAO):
+    validos, erros, vistas = [], [], {}
+    # Linha 1 do arquivo é o cabeçalho
+    primeira_linha = 2
+    agora = pd.Timestamp.now().strftime("%d/%m/%Y %H:%M")
+    for bloco in ler_em_blocos(arquivo, nome_arquivo, tamanho):
+        bloco_validos, bloco_erros = validar_bloco(bloco, primeira_linha, vistas, carteirinha_existente)
+        primeira_linha += len(bloco)
+        bloco_validos["Registrado Por"] = usuario
+        bloco_validos["Data Registro"] = agora
+        validos.append(bloco_validos)
+        erros.extend(bloco_erros)
+    registros = pd.concat(validos) if validos else pd.DataFrame(columns=colunas_padrao)
+    return registros, erros
+
+def operacao_lote(registros, tabela="dados"):
+    registros = registros.astype(object).where(registros.notna(), None)
+    return {"op": "adicionar_lote", "tabela": tabela, "registros": registros.to_dict("records")}
@@ -0,0 +1,95 @@
+# Índice em memória de Nº Carteirinha -> pacientes
+import pandas as pd
+
+COLUNA_CARTEIRINHA = "Nº Carteirinha"
+
+# Campos que não são sobrescritos ao mesclar um cadastro repetido: a data do
+# primeiro contato define a posição na fila e o registro guarda quem cadastrou
+CAMPOS_PRESERVADOS_NA_MESCLA = {"Data 1º Contato", "Dias de Espera", "Registrado Por", "Data Registro"}
+
+class CarteirinhaDuplicada(ValueError):
+    def __init__(self, carteirinha, ids):
+        super().__init__(f"A carteirinha {carteirinha} já está na lista de espera")
+        self.carteirinha = carteirinha
+        self.ids = ids
+
+def normalizar_carteirinha(valor):
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+# Campos não vazios do novo cadastro que atualizam o existente
+def campos_para_mesclar(registro):
+    return {coluna: valor for coluna, valor in registro.items()
+            if coluna not in CAMPOS_PRESERVADOS_NA_MESCLA
+            and normalizar_carteirinha(valor) is not None}
+
+# Mantido de forma incremental a cada operação, cobre as duas tabelas e
+# responde em tempo constante onde está cada carteirinha
+class IndiceCarteirinha:
+    def __init__(self):
+        self._por_carteirinha = {}  # carteirinha -> {id: tabela}
+        self._por_id = {}           # id -> carteirinha
+
+    def construir(self, dados, atendidos):
+        self._por_carteirinha = {}
+        self._por_id = {}
+        for tabela, df in (("dados", dados), ("atendidos", atendidos)):
+            for id_, carteirinha in zip(df.index, df[COLUNA_CARTEIRINHA].tolist()):
+                self._incluir(int(id_), carteirinha, tabela)
+
+    def _incluir(self, id_, carteirinha, tabela):
+        carteirinha = normalizar_carteirinha(carteirinha)
+        if carteirinha is None:
+            return
+        self._por_carteirinha.setdefault(carteirinha, {})[id_] = tabela
+        self._por_id[id_] = carteirinha
+
+    def _excluir(self, id_):
+        carteirinha = self._por_id.pop(id_, None)
+        if carteirinha is None:
+            return
+        ids = self._por_carteirinha.get(carteirinha, {})
+        ids.pop(id_, None)
+        if not ids:
+            self._por_carteirinha.pop(carteirinha, None)
+
+    def aplicar(self, operacao, antes=None, depois=None):
+        tipo = operacao["op"]
+        id_ = int(operacao["id"])
+        if tipo == "adicionar":
+            self._excluir(id_)
+            self._incluir(id_, operacao["registro"].get(COLUNA_CARTEIRINHA), operacao["tabela"])
+        elif tipo == "mover":
+            carteirinha = self._por_id.get(id_)
+            if COLUNA_CARTEIRINHA in operacao["campos"]:
+                carteirinha = operacao["campos"][COLUNA_CARTEIRINHA]
+            self._excluir(id_)
+            self._incluir(id_, carteirinha, "atendidos")
+        elif tipo == "editar":
+            if COLUNA_CARTEIRINHA in operacao["campos"]:
+                self._excluir(id_)
+                self._incluir(id_, operacao["campos"][COLUNA_CARTEIRINHA], operacao["tabela"])
+        elif tipo == "remover":
+            self._excluir(id_)
+
+    # Só dicionários: percorre o lote sem montar uma operação por linha
+    def aplicar_lote(self, operacao, antes=None, depois=None):
+        if operacao["op"] == "adicionar_lote":
+            for id_, registro in zip(operacao["ids"], operacao["registros"]):
+                self._excluir(int(id_))
+                self._incluir(int(id_), registro.get(COLUNA_CARTEIRINHA), operacao["tabela"])
+        else:
+            for id_, campos in zip(operacao["ids"], operacao["campos"]):
+                carteirinha = campos.get(COLUNA_CARTEIRINHA, self._por_id.get(int(id_)))
+                self._excluir(int(id_))
+                self._incluir(int(id_), carteirinha, "atendidos")
+
+    # Lista de (tabela, id) com essa carteirinha
+    def localizar(self, carteirinha):
+        ids = self._por_carteirinha.get(normalizar_carteirinha(carteirinha), {})
+        return [(tabela, id_) for id_, tabela in ids.items()]
+
+    def ids_em(self, carteirinha, tabela):
+        return [id_ for t, id_ in self.localizar(carteirinha) if t == tabela]
@@ -0,0 +1,210 @@
+# Métricas do serviço no formato de texto do Prometheus, servidas em
+# http://127.0.0.1:<porta>/metrics
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites (em segundos) dos baldes dos histogramas de latência
+BALDES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _rotulos(nomes, valores, extra=()):
+    pares = list(zip(nomes, valores)) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+def _numero(valor):
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._trava = threading.Lock()
+
+    def _chave(self, rotulos):
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def expor(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._trava:
+            linhas += self._amostras()
+        return linhas
+
+    def _amostras(self):
+        return [f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}"
+                for chave, valor in sorted(self._valores.items())]
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def incrementar(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._trava:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+# Valor lido na hora da coleta: funcao() devolve um número ou, para métricas
+# com rótulos, um dicionário {valores dos rótulos (tupla): número}
+class Medidor(_Metrica):
+    tipo = "gauge"
+
+    def __init__(self, nome, ajuda, rotulos=(), funcao=None):
+        super().__init__(nome, ajuda, rotulos)
+        self.funcao = funcao
+
+    def definir(self, valor, **rotulos):
+        with self._trava:
+            self._valores[self._chave(rotulos)] = valor
+
+    def _amostras(self):
+        if self.funcao is not None:
+            valores = self.funcao()
+            if not isinstance(valores, dict):
+                valores = {(): valores}
+            self._valores = {tuple(map(str, chave if isinstance(chave, tuple) else (chave,))): valor
+                             for chave, valor in valores.items()}
+        return super()._amostras()
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), baldes=BALDES_LATENCIA):
+        super().__init__(nome, ajuda, rotulos)
+        self.baldes = tuple(sorted(baldes)) + (math.inf,)
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self._trava:
+            contagens, soma = self._valores.get(chave, ([0] * len(self.baldes), 0.0))
+            for i, limite in enumerate(self.baldes):
+                if valor <= limite:
+                    contagens[i] += 1
+                    break
+            self._valores[chave] = (contagens, soma + valor)
+
+    def _amostras(self):
+        linhas = []
+        for chave, (contagens, soma) in sorted(self._valores.items()):
+            acumulado = 0
+            for limite, contagem in zip(self.baldes, contagens):
+                acumulado += contagem
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, [('le', _numero(limite))])} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {acumulado}")
+        return linhas
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = {}
+        self._trava = threading.Lock()
+
+    def _adicionar(self, metrica):
+        with self._trava:
+            return self._metricas.setdefault(metrica.nome, metrica)
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._adicionar(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome, ajuda, rotulos=(), funcao=None):
+        return self._adicionar(Medidor(nome, ajuda, rotulos, funcao))
+
+    def histograma(self, nome, ajuda, rotulos=(), baldes=BALDES_LATENCIA):
+        return self._adicionar(Histograma(nome, ajuda, rotulos, baldes))
+
+    def expor(self):
+        with self._trava:
+            metricas = list(self._metricas.values())
+        linhas = []
+        for metrica in metricas:
+            linhas += metrica.expor()
+        return "\n".join(linhas) + "\n"
+
+# Registro do processo, alimentado pelos caminhos de carga, gravação e exportação
+REGISTRO = RegistroMetricas()
+
+DURACAO_EXECUCAO = REGISTRO.histograma(
+    "lista_espera_execucao_segundos", "Duração de cada execução do script Streamlit.")
+DURACAO_ETAPA = REGISTRO.histograma(
+    "lista_espera_etapa_segundos", "Duração de cada etapa de uma execução.", ["etapa"])
+DURACAO_ARMAZENAMENTO = REGISTRO.histograma(
+    "lista_espera_armazenamento_segundos", "Latência de leitura e escrita no armazenamento.", ["modo", "operacao"])
+BYTES_ARMAZENAMENTO = REGISTRO.contador(
+    "lista_espera_armazenamento_bytes_total", "Bytes lidos e gravados no armazenamento (aproximado).",
+    ["modo", "direcao"])
+EXPORTACOES = REGISTRO.contador(
+    "lista_espera_exportacoes_total", "Arquivos de exportação gerados.", ["formato", "metodo"])
+DURACAO_EXPORTACAO = REGISTRO.histograma(
+    "lista_espera_exportacao_segundos", "Tempo para gerar um arquivo de exportação.", ["formato", "metodo"])
+
+# ============================
+# BYTES EM DISCO
+# ============================
+
+# (inode, tamanho) de cada arquivo, para medir o que uma escrita gravou
+def estado_arquivos(caminhos):
+    estado = {}
+    for caminho in caminhos:
+        try:
+            info = os.stat(caminho)
+            estado[caminho] = (info.st_ino, info.st_size)
+        except FileNotFoundError:
+            estado[caminho] = None
+    return estado
+
+# Arquivo substituído (novo inode) conta inteiro; arquivo alterado no lugar
+# conta o que cresceu. Reescritas no meio de um arquivo não são contadas.
+def bytes_gravados(antes, depois):
+    total = 0
+    for caminho, atual in depois.items():
+        anterior = antes.get(caminho)
+        if atual is None:
+            continue
+        if anterior is None or anterior[0] != atual[0]:
+            total += atual[1]
+        else:
+            total += max(atual[1] - anterior[1], 0)
+    return total
+
+def bytes_em_disco(caminhos):
+    return sum(estado[1] for estado in estado_arquivos(caminhos).values() if estado is not None)
+
+# ============================
+# SERVIDOR HTTP
+# ============================
+
+def _criar_manipulador(registro):
+    class Manipulador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            corpo = registro.expor().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", TIPO_CONTEUDO)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, formato, *args):
+            pass
+
+    return Manipulador
+
+# Sobe o servidor em uma thread de fundo. Por padrão só escuta localmente.
+def iniciar_servidor(porta, endereco="127.0.0.1", registro=REGISTRO):
+    servidor = ThreadingHTTPServer((endereco, porta), _criar_manipulador(registro))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="metricas", daemon=True).start()
+    return servidor
@@ -0,0 +1,101 @@
+# Previsão da data de admissão de quem está na lista de espera, pela posição
+# na fila da especialidade e pelo ritmo recente de admissões
+import math
+import threading
+
+import pandas as pd
+
+from espera import hoje_referencia
+from esquema import como_texto
+
+# Semanas completas de admissões usadas para medir o ritmo de cada especialidade
+JANELA_VAZAO_SEMANAS = 12
+
+# Estrutura derivada do CacheDados. Guarda a posição de cada paciente na fila
+# da sua especialidade (ordem de "Data 1º Contato", sem data no fim, como em
+# filas.py). Uma operação só marca a especialidade afetada; na próxima consulta
+# apenas essas filas são reordenadas. O ritmo vem das admissões por semana já
+# contadas em EstatisticasEspera, então uma admissão nova muda a previsão sem
+# percorrer o histórico.
+#
+# Previsão = hoje + (posição / admissões por dia), arredondada para cima.
+# Especialidades sem admissões na janela ficam sem previsão (NaT).
+class PrevisaoAdmissao:
+    def __init__(self, estatisticas, semanas=JANELA_VAZAO_SEMANAS):
+        self.estatisticas = estatisticas
+        self.semanas = semanas
+        self._dados = None
+        self._posicoes = {}   # especialidade -> Series(posição a partir de 1, index=id)
+        self._sujas = set()
+        self._todas_sujas = True
+        self._trava = threading.Lock()
+
+    def construir(self, dados, atendidos):
+        with self._trava:
+            self._dados = dados
+            self._posicoes = {}
+            self._todas_sujas = True
+
+    def aplicar(self, operacao, antes, depois):
+        id_ = int(operacao["id"])
+        with self._trava:
+            self._dados = depois[0]
+            for dados in (antes[0], depois[0]):
+                if id_ in dados.index:
+                    self._sujas.add(como_texto(dados.at[id_, "Especialidade"]))
+
+    def aplicar_lote(self, operacao, antes, depois):
+        ids = pd.Index(operacao["ids"])
+        especialidades = set()
+        for dados in (antes[0], depois[0]):
+            especialidades.update(dados.loc[dados.index.intersection(ids), "Especialidade"].astype(object).unique())
+        with self._trava:
+            self._dados = depois[0]
+            self._sujas.update(como_texto(especialidade) for especialidade in especialidades)
+
+    def _atualizar(self):
+        dados = self._dados
+        especialidades = None if self._todas_sujas else self._sujas
+        if dados is None or (especialidades is not None and not especialidades):
+            return
+        fila = pd.DataFrame({
+            "especialidade": dados["Especialidade"].astype(object),
+            "data": pd.to_datetime(dados["Data 1º Contato"], errors="coerce").dt.normalize(),
+            "id": dados.index,
+        }, index=dados.index)
+        if especialidades is not None:
+            fila = fila[fila["especialidade"].isin(list(especialidades))]
+            for especialidade in especialidades:
+                self._posicoes.pop(especialidade, None)
+        else:
+            self._posicoes = {}
+        fila = fila.sort_values(["especialidade", "data", "id"], na_position="last", kind="stable")
+        posicoes = fila.groupby("especialidade", sort=False, dropna=False).cumcount() + 1
+        for especialidade, grupo in posicoes.groupby(fila["especialidade"], sort=False, dropna=False):
+            self._posicoes[como_texto(especialidade)] = grupo.rename(como_texto(especialidade))
+        self._sujas = set()
+        self._todas_sujas = False
+
+    # Admissões por dia de cada especialidade na janela
+    def vazao(self, hoje=None):
+        recentes = self.estatisticas.admissoes_recentes(self.semanas, hoje)
+        return {especialidade: n / (self.semanas * 7) for especialidade, n in recentes.items() if n}
+
+    # Previsão de um paciente: dicionário com posição, tamanho da fila e data
+    # (NaT sem ritmo conhecido), ou None se ele não está na lista de espera.
+    # Só reordena as filas alteradas desde a última consulta.
+    def paciente(self, id_, hoje=None):
+        hoje = hoje_referencia() if hoje is None else pd.Timestamp(hoje).normalize()
+        vazao = self.vazao(hoje)
+        with self._trava:
+            self._atualizar()
+            if self._dados is None or id_ not in self._dados.index:
+                return None
+            especialidade = como_texto(self._dados.at[id_, "Especialidade"])
+            posicoes = self._posicoes.get(especialidade)
+            if posicoes is None or id_ not in posicoes.index:
+                return None
+            posicao = int(posicoes.at[id_])
+        ritmo = vazao.get(especialidade)
+        data = hoje + pd.Timedelta(days=math.ceil(posicao / ritmo)) if ritmo else pd.NaT
+        return {"posicao": posicao, "na_fila": len(posicoes), "data": data}
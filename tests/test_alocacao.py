@@ -0,0 +1,84 @@
+# Alocação automática de vagas (alocacao.alocar_vagas) contra busca exaustiva
+import os
+import random
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alocacao import _profissional, alocar_vagas
+from filas import TURNOS_COMPATIVEIS
+
+ESPECIALIDADES = ["Psicologia", "Fonoaudiologia"]
+TURNOS = ["Manhã", "Tarde", "Indiferente"]
+PROFISSIONAIS = ["Dra Ana", "Dr Beto"]
+
+def _espera(linhas):
+    return pd.DataFrame(linhas, index=range(len(linhas)),
+                        columns=["Especialidade", "Horário Preferencial", "Preferência Profissional",
+                                 "Profissional Indicado", "Dias de Espera"])
+
+def _vaga(id_, especialidade, turno, profissional=None, inicio="2026-01-05"):
+    return {"id": id_, "Especialidade": especialidade, "Turno": turno, "Profissional": profissional,
+            "Horário": "08:00", "Data de Início": inicio}
+
+def _caso(rng):
+    pacientes = []
+    for _ in range(rng.randint(1, 7)):
+        indicado = rng.choice([None, None, *PROFISSIONAIS])
+        pacientes.append({"Especialidade": rng.choice(ESPECIALIDADES), "Horário Preferencial": rng.choice(TURNOS),
+                          "Preferência Profissional": "Sim" if indicado else "Não",
+                          "Profissional Indicado": indicado, "Dias de Espera": rng.randint(0, 60)})
+    vagas = [_vaga(f"v{j}", rng.choice(ESPECIALIDADES), rng.choice(["Manhã", "Tarde"]),
+                   rng.choice([None, *PROFISSIONAIS]), f"2026-01-{rng.randint(1, 28):02d}")
+             for j in range(rng.randint(1, 5))]
+    return _espera(pacientes), vagas
+
+def _compativel(paciente, vaga, respeitar_profissional):
+    if paciente["Especialidade"] != vaga["Especialidade"]:
+        return False
+    if paciente["Horário Preferencial"] not in TURNOS_COMPATIVEIS[vaga["Turno"]]:
+        return False
+    indicado = _profissional(paciente["Profissional Indicado"]) if respeitar_profissional else None
+    return indicado is None or indicado == _profissional(vaga["Profissional"])
+
+# Maior soma de dias de espera entre todas as formas de preencher as vagas
+def _melhor_soma(espera, vagas, respeitar_profissional):
+    pacientes = list(espera.to_dict("index").items())
+    def melhor(j, usados):
+        if j == len(vagas):
+            return 0
+        resultado = melhor(j + 1, usados)
+        for id_, paciente in pacientes:
+            if id_ not in usados and _compativel(paciente, vagas[j], respeitar_profissional):
+                resultado = max(resultado, paciente["Dias de Espera"] + melhor(j + 1, usados | {id_}))
+        return resultado
+    return melhor(0, frozenset())
+
+@pytest.mark.parametrize("respeitar_profissional", [True, False])
+def test_soma_igual_a_da_busca_exaustiva(respeitar_profissional):
+    rng = random.Random(3)
+    for _ in range(200):
+        espera, vagas = _caso(rng)
+        resultado = alocar_vagas(espera, vagas, respeitar_profissional)
+        assert resultado["id"].is_unique and resultado["vaga"].is_unique
+        por_id = {vaga["id"]: vaga for vaga in vagas}
+        for id_, vaga in zip(resultado["id"], resultado["vaga"]):
+            assert _compativel(espera.loc[id_].to_dict(), por_id[vaga], respeitar_profissional)
+        assert resultado["Dias de Espera"].sum() == _melhor_soma(espera, vagas, respeitar_profissional)
+
+def test_caminho_aumentante_troca_quem_aceita_qualquer_turno():
+    # O mais antigo aceita qualquer turno e ocuparia a vaga da manhã; a busca
+    # o passa para a tarde para caber quem só pode de manhã
+    espera = _espera([
+        {"Especialidade": "Psicologia", "Horário Preferencial": "Indiferente", "Preferência Profissional": "Não",
+         "Profissional Indicado": None, "Dias de Espera": 30},
+        {"Especialidade": "Psicologia", "Horário Preferencial": "Manhã", "Preferência Profissional": "Não",
+         "Profissional Indicado": None, "Dias de Espera": 20},
+    ])
+    vagas = [_vaga("manha", "Psicologia", "Manhã", inicio="2026-01-01"),
+             _vaga("tarde", "Psicologia", "Tarde", inicio="2026-01-02")]
+    resultado = alocar_vagas(espera, vagas)
+    assert dict(zip(resultado["id"], resultado["vaga"])) == {0: "tarde", 1: "manha"}
@@ -0,0 +1,67 @@
+# Modos de armazenamento: o que foi gravado volta igual numa carga nova
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from armazenamento import MODOS_ARMAZENAMENTO, criar_armazenamento
+from cache_dados import CacheDados
+from esquema import COLUNAS_DATA, COLUNAS_TEXTO, aplicar_esquema, colunas_padrao
+
+VAGA = {"Vaga Concedida": "Sim", "Data de Início": "2026-01-12", "Data Registro": "05/01/2026 10:00",
+        "Profissional Responsável": "Dra X"}
+
+def _pacientes():
+    return aplicar_esquema(pd.DataFrame([
+        {"Nome": f"Paciente {n}", "Nº Carteirinha": f"{n:05d}", "Data 1º Contato": f"2025-0{n % 9 + 1}-10",
+         "Especialidade": "Psicologia" if n % 2 else "Acupuntura", "Registrado Por": "admin",
+         "Data Registro": "10/01/2025 08:30"} for n in range(8)
+    ]).reindex(columns=colunas_padrao))
+
+OPERACOES = [
+    {"op": "adicionar", "tabela": "dados", "registro": {"Nome": "Nova", "Data 1º Contato": "2025-12-01",
+                                                        "Especialidade": "Fonoaudiologia"}},
+    {"op": "editar", "tabela": "dados", "id": 1, "campos": {"Telefone": "555", "Especialidade": "Acupuntura"}},
+    {"op": "mover", "id": 2, "campos": VAGA},
+    {"op": "remover", "tabela": "dados", "id": 3},
+    {"op": "adicionar_lote", "tabela": "dados", "registros": [{"Nome": "Lote A"}, {"Nome": "Lote B"}]},
+    {"op": "mover_lote", "ids": [4, 5], "campos": [VAGA, VAGA]},
+    {"op": "editar", "tabela": "atendidos", "id": 4, "campos": {"Profissional Responsável": "Dr Y"}},
+]
+
+# Texto vazio pode voltar como None ou NA conforme o modo; os dois valem vazio
+def _comparavel(df):
+    df = df.sort_index()
+    df[COLUNAS_TEXTO] = df[COLUNAS_TEXTO].astype(object).where(df[COLUNAS_TEXTO].notna(), None)
+    return df
+
+@pytest.mark.parametrize("modo", list(MODOS_ARMAZENAMENTO))
+def test_carga_nova_igual_ao_cache(tmp_path, monkeypatch, modo):
+    monkeypatch.chdir(tmp_path)
+    criar_armazenamento(modo).salvar(_pacientes(), aplicar_esquema(pd.DataFrame(columns=colunas_padrao)))
+    cache = CacheDados(criar_armazenamento(modo))
+    for operacao in OPERACOES:
+        cache.registrar(operacao)
+    for esperado, carregado in zip(cache.obter(), criar_armazenamento(modo).carregar()):
+        pd.testing.assert_frame_equal(_comparavel(carregado), _comparavel(esperado),
+                                      check_dtype=False, check_categorical=False)
+        for coluna in COLUNAS_DATA:
+            assert carregado[coluna].dtype == "datetime64[us]"
+
+def test_sqlite_consulta_filtrada(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    armazenamento = criar_armazenamento("sqlite")
+    armazenamento.salvar(_pacientes(), aplicar_esquema(pd.DataFrame(columns=colunas_padrao)))
+    resultado = armazenamento.consultar("dados", especialidade="Psicologia", desde="2025-03-01")
+    assert list(resultado["Nome"]) == ["Paciente 3", "Paciente 5", "Paciente 7"]
+    assert list(armazenamento.consultar("dados", carteirinha="00006").index) == [6]
+
+def test_sqlite_importa_os_csvs_na_primeira_execucao(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    criar_armazenamento("csv").salvar(_pacientes().drop(index=0), aplicar_esquema(pd.DataFrame(columns=colunas_padrao)))
+    dados, atendidos = criar_armazenamento("sqlite").carregar()
+    assert list(dados.index) == list(range(1, 8))
+    assert atendidos.empty
@@ -0,0 +1,52 @@
+# Cadastro com carteirinha repetida (CacheDados.adicionar_paciente)
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from armazenamento import criar_armazenamento
+from cache_dados import CacheDados
+from esquema import aplicar_esquema, colunas_padrao
+from indice import CarteirinhaDuplicada
+
+CONTATO = pd.Timestamp.today().normalize() - pd.Timedelta(days=40)
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dados = pd.DataFrame([{"Nome": "Ana", "Nº Carteirinha": "001", "Data 1º Contato": CONTATO,
+                           "Telefone": "111", "Registrado Por": "recepcao"}]).reindex(columns=colunas_padrao)
+    vazia = pd.DataFrame(columns=colunas_padrao)
+    criar_armazenamento("diario").salvar(aplicar_esquema(dados), aplicar_esquema(vazia))
+    return CacheDados(criar_armazenamento("diario"))
+
+def _novo_cadastro(**campos):
+    registro = {"Nome": "Ana Souza", "Nº Carteirinha": "001", "Data 1º Contato": pd.Timestamp.today().normalize(),
+                "Registrado Por": "admin"}
+    registro.update(campos)
+    return registro
+
+def test_rejeitar_carteirinha_repetida(cache):
+    with pytest.raises(CarteirinhaDuplicada) as erro:
+        cache.adicionar_paciente("dados", _novo_cadastro())
+    assert erro.value.ids == [0]
+
+def test_mesclar_atualiza_o_cadastro_e_preserva_a_data(cache):
+    cache.adicionar_paciente("dados", _novo_cadastro(Telefone="222"), duplicados="mesclar")
+    dados, _ = cache.obter()
+    assert len(dados) == 1
+    assert dados.at[0, "Nome"] == "Ana Souza"
+    assert dados.at[0, "Telefone"] == "222"
+    assert dados.at[0, "Data 1º Contato"] == CONTATO
+    assert dados.at[0, "Registrado Por"] == "recepcao"
+
+def test_mesclar_com_vaga_congela_a_espera_do_cadastro_existente(cache):
+    registro = _novo_cadastro(**{"Vaga Concedida": "Sim", "Dias de Espera": 0, "Data de Início": "2024-06-01"})
+    cache.adicionar_paciente("atendidos", registro, duplicados="mesclar")
+    dados, atendidos = cache.obter()
+    assert dados.empty
+    assert atendidos.at[0, "Dias de Espera"] == 40
+    assert atendidos.at[0, "Data 1º Contato"] == CONTATO
@@ -0,0 +1,157 @@
+# Controle otimista: conflitos e mescla em nível de coluna entre sessões e processos
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from armazenamento import ConflitoEdicao, criar_armazenamento, valores_lidos, verificar_conflito
+from cache_dados import CacheDados
+from esquema import aplicar_esquema, colunas_padrao
+
+def _tabela(linhas, inicio=0):
+    df = pd.DataFrame(linhas, index=range(inicio, inicio + len(linhas))).reindex(columns=colunas_padrao)
+    return aplicar_esquema(df)
+
+def _pacientes():
+    return _tabela([
+        {"Nome": "Ana", "Nº Carteirinha": "001", "Data 1º Contato": "2024-01-10", "Telefone": "111"},
+        {"Nome": "Bia", "Nº Carteirinha": "002", "Data 1º Contato": "2024-02-10", "Telefone": "222"},
+        {"Nome": "Caio", "Nº Carteirinha": "003", "Data 1º Contato": "2024-03-10", "Telefone": "333"},
+    ])
+
+VAGA = {"Vaga Concedida": "Sim", "Data de Início": "2024-06-01", "Profissional Responsável": "Dra X"}
+
+@pytest.fixture
+def pasta(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+# ============================
+# verificar_conflito
+# ============================
+
+def test_mover_com_identidade_igual_passa():
+    dados = _pacientes()
+    operacao = {"op": "mover", "id": 1, "campos": VAGA, "esperado": valores_lidos(dados, [1])[0]}
+    verificar_conflito(dados, _tabela([]), operacao)
+
+def test_mover_id_reaproveitado_por_outro_paciente_da_conflito():
+    lido = valores_lidos(_pacientes(), [1])[0]
+    # O id 1 agora é de outro paciente (ex.: lista renumerada em outro processo)
+    atual = _pacientes().drop(index=0)
+    atual.index = range(len(atual))
+    with pytest.raises(ConflitoEdicao) as erro:
+        verificar_conflito(atual, _tabela([]), {"op": "mover", "id": 1, "campos": VAGA, "esperado": lido})
+    assert erro.value.ids == [1]
+    assert set(erro.value.colunas) == {"Nº Carteirinha", "Data 1º Contato"}
+
+def test_mover_paciente_que_ja_saiu_da_conflito():
+    dados = _pacientes()
+    with pytest.raises(ConflitoEdicao) as erro:
+        verificar_conflito(dados.drop(index=2), _tabela([]), {"op": "mover", "id": 2, "campos": VAGA})
+    assert erro.value.ids == [2]
+
+def test_mover_lote_aponta_so_os_ids_alterados():
+    lidos = valores_lidos(_pacientes(), [0, 1, 2])
+    atual = _pacientes()
+    atual.at[2, "Nº Carteirinha"] = "999"
+    operacao = {"op": "mover_lote", "ids": [0, 1, 2], "campos": [VAGA] * 3, "esperados": lidos}
+    with pytest.raises(ConflitoEdicao) as erro:
+        verificar_conflito(atual, _tabela([]), operacao)
+    assert erro.value.ids == [2]
+    assert erro.value.colunas == ["Nº Carteirinha"]
+
+def test_mover_lote_sem_esperados_so_confere_a_presenca():
+    operacao = {"op": "mover_lote", "ids": [0, 1], "campos": [VAGA] * 2}
+    verificar_conflito(_pacientes(), _tabela([]), operacao)
+
+def test_editar_coluna_alterada_por_outra_sessao_da_conflito():
+    lido = valores_lidos(_pacientes(), [0], ["Telefone"])[0]
+    atual = _pacientes()
+    atual.at[0, "Telefone"] = "555"
+    operacao = {"op": "editar", "tabela": "dados", "id": 0, "campos": {"Telefone": "777"}, "esperado": lido}
+    with pytest.raises(ConflitoEdicao) as erro:
+        verificar_conflito(atual, _tabela([]), operacao)
+    assert erro.value.colunas == ["Telefone"]
+
+def test_editar_mesmo_valor_ou_outra_coluna_nao_da_conflito():
+    lido = valores_lidos(_pacientes(), [0], ["Nome", "Telefone"])[0]
+    atual = _pacientes()
+    atual.at[0, "Telefone"] = "777"
+    # A outra sessão gravou o mesmo telefone; o nome não foi tocado por ela
+    verificar_conflito(atual, _tabela([]), {"op": "editar", "tabela": "dados", "id": 0,
+                                            "campos": {"Telefone": "777"}, "esperado": lido})
+    # Só o telefone mudou fora: editar o nome continua valendo
+    verificar_conflito(atual, _tabela([]), {"op": "editar", "tabela": "dados", "id": 0,
+                                            "campos": {"Nome": "Ana Maria"}, "esperado": lido})
+
+def test_remover_confere_todas_as_colunas_esperadas():
+    lido = valores_lidos(_pacientes(), [0], ["Nome", "Telefone"])[0]
+    atual = _pacientes()
+    atual.at[0, "Telefone"] = "555"
+    with pytest.raises(ConflitoEdicao):
+        verificar_conflito(atual, _tabela([]), {"op": "remover", "tabela": "dados", "id": 0, "esperado": lido})
+
+# ============================
+# Entre processos (dois caches sobre os mesmos arquivos)
+# ============================
+
+@pytest.mark.parametrize("modo", ["csv", "diario"])
+def test_ids_sobrevivem_a_recarga(pasta, modo):
+    criar_armazenamento(modo).salvar(_pacientes().drop(index=0), _tabela([]))
+    dados, _ = criar_armazenamento(modo).carregar()
+    assert list(dados.index) == [1, 2]
+    assert list(dados["Nome"]) == ["Bia", "Caio"]
+
+def test_csv_antigo_sem_id_e_numerado_e_ganha_a_coluna(pasta):
+    _pacientes().to_csv("data_espera.csv", index=False)
+    armazenamento = criar_armazenamento("csv")
+    dados, atendidos = armazenamento.carregar()
+    assert list(dados.index) == [0, 1, 2]
+    armazenamento.salvar(dados.drop(index=0), atendidos)
+    assert list(criar_armazenamento("csv").carregar()[0].index) == [1, 2]
+
+@pytest.mark.parametrize("modo", ["csv", "diario"])
+def test_mover_paciente_removido_em_outro_processo(pasta, modo):
+    criar_armazenamento(modo).salvar(_pacientes(), _tabela([]))
+    sessao, outro = CacheDados(criar_armazenamento(modo)), CacheDados(criar_armazenamento(modo))
+    lido = sessao.obter()[0]
+    outro.registrar({"op": "remover", "tabela": "dados", "id": 0})
+    outro.registrar({"op": "adicionar", "tabela": "dados",
+                     "registro": {"Nome": "Davi", "Nº Carteirinha": "004", "Data 1º Contato": "2024-04-10"}})
+    operacao = {"op": "mover", "id": 0, "campos": VAGA, "esperado": valores_lidos(lido, [0])[0]}
+    with pytest.raises(ConflitoEdicao):
+        sessao.registrar(operacao)
+    dados, atendidos = CacheDados(criar_armazenamento(modo)).obter()
+    assert "Davi" in set(dados["Nome"])
+    assert atendidos.empty
+
+@pytest.mark.parametrize("modo", ["csv", "diario"])
+def test_edicoes_em_colunas_diferentes_sao_mescladas(pasta, modo):
+    criar_armazenamento(modo).salvar(_pacientes(), _tabela([]))
+    sessao, outro = CacheDados(criar_armazenamento(modo)), CacheDados(criar_armazenamento(modo))
+    lido = sessao.obter()[0]
+    outro.registrar({"op": "editar", "tabela": "dados", "id": 1, "campos": {"Telefone": "999"},
+                     "esperado": valores_lidos(outro.obter()[0], [1], ["Telefone"])[0]})
+    sessao.registrar({"op": "editar", "tabela": "dados", "id": 1, "campos": {"Nome": "Beatriz"},
+                      "esperado": valores_lidos(lido, [1], ["Nome"])[0]})
+    dados, _ = CacheDados(criar_armazenamento(modo)).obter()
+    assert dados.at[1, "Nome"] == "Beatriz"
+    assert dados.at[1, "Telefone"] == "999"
+
+@pytest.mark.parametrize("modo", ["csv", "diario"])
+def test_mover_lote_com_conflito_nao_grava_nada(pasta, modo):
+    criar_armazenamento(modo).salvar(_pacientes(), _tabela([]))
+    sessao, outro = CacheDados(criar_armazenamento(modo)), CacheDados(criar_armazenamento(modo))
+    lido = sessao.obter()[0]
+    outro.registrar({"op": "editar", "tabela": "dados", "id": 2, "campos": {"Data 1º Contato": "2023-12-01"}})
+    operacao = {"op": "mover_lote", "ids": [0, 2], "campos": [VAGA] * 2, "esperados": valores_lidos(lido, [0, 2])}
+    with pytest.raises(ConflitoEdicao) as erro:
+        sessao.registrar(operacao)
+    assert erro.value.ids == [2]
+    dados, atendidos = CacheDados(criar_armazenamento(modo)).obter()
+    assert list(dados.index) == [0, 1, 2]
+    assert atendidos.empty
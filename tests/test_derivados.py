@@ -0,0 +1,101 @@
+# Estruturas derivadas do CacheDados: depois de operações (em lote ou não),
+# cada uma deve responder como se tivesse sido construída do zero
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from armazenamento import criar_armazenamento
+from cache_dados import CacheDados
+from espera import DiasEsperaMaterializados
+from esquema import ESPECIALIDADES, aplicar_esquema, colunas_padrao
+from estatisticas import EstatisticasEspera
+from filas import FilasPrioridade
+from indice import IndiceCarteirinha
+from previsao import PrevisaoAdmissao
+
+HOJE = pd.Timestamp("2026-01-20")
+VAGA = {"Vaga Concedida": "Sim", "Data de Início": "2026-01-12", "Data Registro": "05/01/2026 10:00"}
+
+def _paciente(n, especialidade=None, turno=None):
+    return {"Nome": f"Paciente {n}", "Nº Carteirinha": f"{n:05d}",
+            "Data 1º Contato": (pd.Timestamp("2025-06-01") + pd.Timedelta(days=n % 90)).strftime("%Y-%m-%d"),
+            "Especialidade": especialidade or ESPECIALIDADES[n % 3],
+            "Horário Preferencial": turno or ["Manhã", "Tarde", "Indiferente"][n % 3]}
+
+def _com_derivados(cache):
+    cache.filas = cache.adicionar_derivado(FilasPrioridade())
+    cache.dias_espera = cache.adicionar_derivado(DiasEsperaMaterializados())
+    cache.estatisticas = cache.adicionar_derivado(EstatisticasEspera())
+    cache.previsao = cache.adicionar_derivado(PrevisaoAdmissao(cache.estatisticas))
+    return cache
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dados = pd.DataFrame([_paciente(n) for n in range(30)]).reindex(columns=colunas_padrao)
+    criar_armazenamento("diario").salvar(aplicar_esquema(dados), aplicar_esquema(pd.DataFrame(columns=colunas_padrao)))
+    cache = _com_derivados(CacheDados(criar_armazenamento("diario")))
+    cache.obter()
+    return cache
+
+# Compara as consultas de cada estrutura com as de uma construída agora
+def _conferir(cache):
+    dados, atendidos = tabelas = cache.obter()
+    frescas = {nome: estrutura() for nome, estrutura in
+               (("filas", FilasPrioridade), ("dias_espera", DiasEsperaMaterializados),
+                ("estatisticas", EstatisticasEspera), ("indice", IndiceCarteirinha))}
+    frescas["previsao"] = PrevisaoAdmissao(frescas["estatisticas"])
+    for estrutura in frescas.values():
+        estrutura.construir(*tabelas)
+
+    for especialidade in ESPECIALIDADES:
+        assert cache.filas.tamanho(especialidade) == frescas["filas"].tamanho(especialidade)
+        for turno in (None, "Manhã", "Tarde"):
+            assert (cache.filas.proximos(especialidade, 1000, turno)
+                    == frescas["filas"].proximos(especialidade, 1000, turno))
+
+    pd.testing.assert_series_equal(cache.dias_espera.tabela(hoje=HOJE)["Dias de Espera"],
+                                   frescas["dias_espera"].tabela(hoje=HOJE)["Dias de Espera"])
+
+    pd.testing.assert_frame_equal(cache.estatisticas.resumo(HOJE), frescas["estatisticas"].resumo(HOJE))
+    pd.testing.assert_frame_equal(cache.estatisticas.percentis(hoje=HOJE), frescas["estatisticas"].percentis(hoje=HOJE))
+    pd.testing.assert_frame_equal(cache.estatisticas.admissoes_por_semana(hoje=HOJE),
+                                  frescas["estatisticas"].admissoes_por_semana(hoje=HOJE))
+
+    for carteirinha in pd.concat([dados["Nº Carteirinha"], atendidos["Nº Carteirinha"]]).dropna():
+        assert sorted(cache.indice.localizar(carteirinha)) == sorted(frescas["indice"].localizar(carteirinha))
+
+    for id_ in dados.index:
+        assert cache.previsao.paciente(id_, HOJE) == frescas["previsao"].paciente(id_, HOJE)
+
+def test_adicionar_lote(cache):
+    cache.registrar({"op": "adicionar_lote", "tabela": "dados",
+                     "registros": [_paciente(n) for n in range(100, 120)]})
+    cache.registrar({"op": "adicionar_lote", "tabela": "atendidos",
+                     "registros": [dict(_paciente(n), **VAGA) for n in range(200, 205)]})
+    _conferir(cache)
+
+def test_mover_lote(cache):
+    ids = [0, 3, 4, 9, 17]
+    cache.registrar({"op": "mover_lote", "ids": ids, "campos": [VAGA] * len(ids)})
+    _conferir(cache)
+    assert not set(ids) & set(cache.filas.proximos(ESPECIALIDADES[0], 1000))
+
+def test_sequencia_mista(cache):
+    cache.registrar({"op": "adicionar_lote", "tabela": "dados",
+                     "registros": [_paciente(n, "Psicologia", "Tarde") for n in range(100, 110)]})
+    cache.registrar({"op": "editar", "tabela": "dados", "id": 1,
+                     "campos": {"Data 1º Contato": "2024-01-01", "Especialidade": "Psicologia"}})
+    cache.registrar({"op": "editar", "tabela": "dados", "id": 2, "campos": {"Nº Carteirinha": "99999"}})
+    # Sai da posição na fila e volta para ela
+    cache.registrar({"op": "editar", "tabela": "dados", "id": 7, "campos": {"Horário Preferencial": "Manhã"}})
+    cache.registrar({"op": "editar", "tabela": "dados", "id": 7, "campos": {"Horário Preferencial": "Tarde"}})
+    cache.registrar({"op": "mover", "id": 5, "campos": VAGA})
+    cache.registrar({"op": "remover", "tabela": "dados", "id": 6})
+    cache.registrar({"op": "mover_lote", "ids": [1, 30, 31], "campos": [VAGA] * 3})
+    cache.registrar({"op": "adicionar", "tabela": "dados", "registro": _paciente(300, "Psicologia", "Manhã")})
+    _conferir(cache)
@@ -0,0 +1,116 @@
+# Reaplicação do diário (modo diário) em blocos e compactação
+import json
+import os
+import random
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import armazenamento
+import esquema
+from armazenamento import aplicar_operacao, aplicar_operacoes, criar_armazenamento
+from cache_dados import CacheDados
+from esquema import aplicar_esquema, colunas_padrao
+
+def _pacientes(n):
+    return aplicar_esquema(pd.DataFrame({
+        "Nome": [f"Paciente {i}" for i in range(n)],
+        "Nº Carteirinha": [f"{i:05d}" for i in range(n)],
+        "Data 1º Contato": pd.Timestamp("2024-01-01") + pd.to_timedelta(range(n), unit="D"),
+        "Especialidade": "Psicologia",
+    }).reindex(columns=colunas_padrao))
+
+def _vazia():
+    return aplicar_esquema(pd.DataFrame(columns=colunas_padrao))
+
+# Diário misturado, com ids repetidos (edição logo após inclusão, saída de quem
+# acabou de ser editado) para forçar vários blocos
+def _diario(dados, quantidade, semente=7):
+    rng = random.Random(semente)
+    em_espera, atendidos, proximo = list(dados.index), [], len(dados)
+    operacoes = []
+    for k in range(quantidade):
+        sorteio = rng.random()
+        if sorteio < 0.35 or not em_espera:
+            operacoes.append({"op": "adicionar", "tabela": "dados", "id": proximo, "registro": {
+                "Nome": f"Novo {k}", "Data 1º Contato": "2024-05-01", "Especialidade": "Fonoaudiologia"}})
+            em_espera.append(proximo)
+            proximo += 1
+        elif sorteio < 0.6:
+            id_ = em_espera.pop(rng.randrange(len(em_espera)))
+            operacoes.append({"op": "mover", "id": id_, "campos": {
+                "Vaga Concedida": "Sim", "Data de Início": "2026-01-05", "Data Registro": "02/01/2026 10:00"}})
+            atendidos.append(id_)
+        elif sorteio < 0.8:
+            operacoes.append({"op": "editar", "tabela": "dados", "id": rng.choice(em_espera),
+                              "campos": {"Telefone": str(k), "Horário Preferencial": "Tarde"}})
+        elif sorteio < 0.9 and atendidos:
+            operacoes.append({"op": "editar", "tabela": "atendidos", "id": rng.choice(atendidos),
+                              "campos": {"Profissional Responsável": f"Dra {k}"}})
+        else:
+            id_ = em_espera.pop(rng.randrange(len(em_espera)))
+            operacoes.append({"op": "remover", "tabela": "dados", "id": id_})
+    operacoes.append({"op": "adicionar_lote", "tabela": "dados", "ids": [proximo, proximo + 1],
+                      "registros": [{"Nome": "Lote A"}, {"Nome": "Lote B"}]})
+    operacoes.append({"op": "mover_lote", "ids": [proximo, em_espera[0]], "campos": [{"Vaga Concedida": "Sim"}] * 2})
+    return operacoes
+
+def _iguais(a, b):
+    pd.testing.assert_frame_equal(a.sort_index(), b.sort_index(), check_dtype=False, check_categorical=False)
+    for coluna in esquema.COLUNAS_DATA:
+        assert a[coluna].dtype == b[coluna].dtype == "datetime64[us]"
+
+def _uma_por_uma(dados, atendidos, operacoes):
+    for operacao in operacoes:
+        dados, atendidos = aplicar_operacao(dados, atendidos, operacao)
+    return dados, atendidos
+
+def test_blocos_equivalem_a_aplicar_uma_por_uma():
+    dados, atendidos = _pacientes(50), _vazia()
+    operacoes = _diario(dados, 200)
+    esperado = _uma_por_uma(dados, atendidos, operacoes)
+    obtido = aplicar_operacoes(dados, atendidos, operacoes)
+    _iguais(obtido[0], esperado[0])
+    _iguais(obtido[1], esperado[1])
+
+def test_carga_paga_o_esquema_por_bloco(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dados = _pacientes(50)
+    criar_armazenamento("diario").salvar(dados, _vazia())
+    operacoes = _diario(dados, 200)
+    with open("data_diario.jsonl", "w", encoding="utf-8") as arquivo:
+        for operacao in operacoes:
+            arquivo.write(json.dumps(operacao) + "\n")
+
+    chamadas = []
+    original = esquema.aplicar_esquema
+    def contar(df):
+        chamadas.append(len(df))
+        return original(df)
+    with monkeypatch.context() as m:
+        m.setattr(esquema, "aplicar_esquema", contar)
+        m.setattr(armazenamento, "aplicar_esquema", contar)
+        carregados = criar_armazenamento("diario").carregar()
+    # Uma a uma seriam duas chamadas por operação (linha nova + concatenação)
+    assert len(chamadas) < len(operacoes) / 2
+
+    esperado = _uma_por_uma(dados, _vazia(), operacoes)
+    _iguais(carregados[0], esperado[0])
+    _iguais(carregados[1], esperado[1])
+
+def test_compactacao_usa_o_estado_da_escrita(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    criar_armazenamento("diario").salvar(_pacientes(10), _vazia())
+    cache = CacheDados(criar_armazenamento("diario", limite_compactacao=5))
+    cache.obter()
+    reaplicacoes = []
+    with monkeypatch.context() as m:
+        m.setattr(armazenamento, "aplicar_operacoes", lambda *a: reaplicacoes.append(a) or a[:2])
+        for k in range(5):
+            cache.registrar({"op": "editar", "tabela": "dados", "id": k, "campos": {"Telefone": f"9{k}"}})
+    assert reaplicacoes == []
+    assert os.path.getsize("data_diario.jsonl") == 0
+    dados, _ = criar_armazenamento("diario").carregar()
+    assert list(dados["Telefone"][:5]) == ["90", "91", "92", "93", "94"]
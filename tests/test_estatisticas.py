@@ -0,0 +1,48 @@
+# Esboço de quantis (estatisticas.EsbocoQuantis) contra os quantis exatos
+import os
+import random
+import sys
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from estatisticas import PRECISAO_ESBOCO, EsbocoQuantis, _quantis_contagem
+
+QUANTIS = (0.0, 0.1, 0.5, 0.9, 0.99, 1.0)
+
+def _esperas(semente, quantidade=5_000):
+    rng = random.Random(semente)
+    return [int(rng.expovariate(1 / 90)) for _ in range(quantidade)]
+
+@pytest.mark.parametrize("semente", [1, 2, 3])
+def test_erro_relativo_dentro_da_precisao(semente):
+    valores = _esperas(semente)
+    esboco = EsbocoQuantis()
+    for valor in valores:
+        esboco.adicionar(valor)
+    for q, exato in zip(QUANTIS, _quantis_contagem(Counter(valores), QUANTIS)):
+        estimado = esboco.quantil(q)
+        assert abs(estimado - exato) <= PRECISAO_ESBOCO * exato + 1e-9
+
+def test_mesclar_e_desfazer():
+    a, b = _esperas(1, 1_000), _esperas(2, 1_000)
+    juntos, so_a, so_b = EsbocoQuantis(), EsbocoQuantis(), EsbocoQuantis()
+    for valor in a:
+        juntos.adicionar(valor)
+        so_a.adicionar(valor)
+    for valor in b:
+        juntos.adicionar(valor)
+        so_b.adicionar(valor)
+    mesclado = so_a.copia().mesclar(so_b)
+    assert mesclado.baldes == juntos.baldes and mesclado.total == juntos.total
+    # Retirar os valores de b com quantidade negativa volta ao esboço de a
+    for valor in b:
+        mesclado.adicionar(valor, -1)
+    assert mesclado.baldes == so_a.baldes and mesclado.total == so_a.total
+    assert so_a.quantil(0.5) is not None and EsbocoQuantis().quantil(0.5) is None
+
+def test_mesclar_precisoes_diferentes_falha():
+    with pytest.raises(ValueError):
+        EsbocoQuantis(0.01).mesclar(EsbocoQuantis(0.02))
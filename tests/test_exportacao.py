@@ -0,0 +1,58 @@
+# Exportação em blocos: o arquivo tem todas as linhas, em qualquer tamanho de bloco
+import gzip
+import os
+import sys
+import zipfile
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from esquema import aplicar_esquema, colunas_padrao
+from exportacao import ABAS, exportar_em_blocos
+
+def _tabela(nomes, **campos):
+    linhas = [dict({"Nome": nome, "Nº Carteirinha": f"{n:05d}", "Data 1º Contato": "2025-03-10",
+                    "Especialidade": "Psicologia"}, **campos) for n, nome in enumerate(nomes)]
+    return aplicar_esquema(pd.DataFrame(linhas, columns=colunas_padrao))
+
+DADOS = _tabela([f"Espera {n}" for n in range(7)])
+ATENDIDOS = _tabela(["Atendido 0", "Atendido 1"], **{"Vaga Concedida": "Sim", "Data de Início": "2026-01-12"})
+
+@pytest.mark.parametrize("tamanho", [1, 3, 100])
+def test_csv_gz(tmp_path, tamanho):
+    caminho = exportar_em_blocos(DADOS, ATENDIDOS, "csv.gz", tmp_path / "lista.csv.gz", tamanho)
+    with gzip.open(caminho, "rt", encoding="utf-8") as arquivo:
+        lido = pd.read_csv(arquivo, dtype=str)
+    assert list(lido.columns) == colunas_padrao + ["Situação"]
+    assert list(lido["Nome"]) == list(DADOS["Nome"]) + list(ATENDIDOS["Nome"])
+    assert list(lido["Situação"]) == [ABAS["dados"]] * 7 + [ABAS["atendidos"]] * 2
+
+def test_csv_gz_vazio_tem_cabecalho(tmp_path):
+    vazia = DADOS.iloc[:0]
+    caminho = exportar_em_blocos(vazia, vazia, "csv.gz", tmp_path / "lista.csv.gz")
+    with gzip.open(caminho, "rt", encoding="utf-8") as arquivo:
+        assert list(pd.read_csv(arquivo).columns) == colunas_padrao + ["Situação"]
+
+def test_zip(tmp_path):
+    caminho = exportar_em_blocos(DADOS, ATENDIDOS, "zip", tmp_path / "lista.zip", tamanho=2)
+    with zipfile.ZipFile(caminho) as arquivo_zip:
+        assert sorted(arquivo_zip.namelist()) == ["atendidos.csv", "dados.csv"]
+        with arquivo_zip.open("dados.csv") as arquivo:
+            lido = pd.read_csv(arquivo, dtype=str)
+    assert list(lido.columns) == colunas_padrao
+    assert list(lido["Nº Carteirinha"]) == list(DADOS["Nº Carteirinha"])
+
+def test_xlsx(tmp_path):
+    caminho = exportar_em_blocos(DADOS, ATENDIDOS, "xlsx", str(tmp_path / "lista.xlsx"), tamanho=2)
+    planilha = load_workbook(caminho, read_only=True)
+    try:
+        assert planilha.sheetnames == [ABAS["dados"], ABAS["atendidos"]]
+        linhas = list(planilha[ABAS["atendidos"]].iter_rows(values_only=True))
+    finally:
+        planilha.close()
+    assert list(linhas[0]) == colunas_padrao
+    assert [linha[0] for linha in linhas[1:]] == ["Atendido 0", "Atendido 1"]
+    assert linhas[1][colunas_padrao.index("Data de Início")] == pd.Timestamp("2026-01-12")
@@ -0,0 +1,32 @@
+# Fotografias diárias (historico.py) com ids estáveis entre reinícios
+import os
+import sys
+from datetime import date
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from armazenamento import criar_armazenamento
+from cache_dados import CacheDados
+from esquema import colunas_padrao
+from historico import HistoricoDiario
+
+def test_csv_guarda_so_a_diferenca_entre_reinicios(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pd.DataFrame({"Nome": [f"Paciente {n}" for n in range(200)], "Nº Carteirinha": [f"{n:05d}" for n in range(200)],
+                  "Data 1º Contato": "2024-01-10"}).reindex(columns=colunas_padrao).to_csv("data_espera.csv", index=False)
+    HistoricoDiario().fotografar(*CacheDados(criar_armazenamento("csv")).obter(), data=date(2026, 1, 1))
+
+    # Novo processo: remove o primeiro da lista e fotografa o dia seguinte
+    cache = CacheDados(criar_armazenamento("csv"))
+    cache.registrar({"op": "remover", "tabela": "dados", "id": 0})
+    historico = HistoricoDiario()
+    historico.fotografar(*CacheDados(criar_armazenamento("csv")).obter(), data=date(2026, 1, 2))
+
+    diferenca = historico._ler(date(2026, 1, 2))["tabelas"]["dados"]
+    assert diferenca["removidos"] == [0]
+    assert diferenca["ids"] == []
+    dados, _ = historico.em(date(2026, 1, 2))
+    assert list(dados.index) == list(range(1, 200))
+    assert list(historico.em(date(2026, 1, 1))[0]["Nome"][:2]) == ["Paciente 0", "Paciente 1"]
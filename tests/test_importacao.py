@@ -0,0 +1,51 @@
+# Importação em lote: validação por bloco e linhas de erro no arquivo original
+import io
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from importacao import preparar_importacao, validar_bloco
+
+CABECALHO = "Nome;Carteirinha;Data do primeiro contato;Especialidade;Turno\n"
+
+def _arquivo(linhas):
+    return io.StringIO(CABECALHO + "".join(linha + "\n" for linha in linhas))
+
+def test_validar_bloco_numera_a_partir_da_primeira_linha():
+    bloco = pd.DataFrame({
+        "Nome": ["Ana", "", "Caio", "Duda"],
+        "Nº Carteirinha": ["001", "002", "003", "004"],
+        "Data 1º Contato": ["2024-01-10", "10/02/2024", "ontem", "2024-03-10"],
+        "Especialidade": ["psicologia", "Psicologia", "Psicologia", "Astrologia"],
+        "Horário Preferencial": ["", "manha", "Tarde", "Noite"],
+    })
+    validos, erros = validar_bloco(bloco, 12, {})
+    assert list(validos.index) == [12]
+    assert validos.at[12, "Especialidade"] == "Psicologia"
+    assert validos.at[12, "Horário Preferencial"] == "Indiferente"
+    assert [linha for linha, _ in erros] == [13, 14, 15]
+    assert erros[0][1] == "nome em branco"
+    assert erros[1][1] == "data do primeiro contato inválida"
+    assert "especialidade inválida" in erros[2][1] and "turno inválido" in erros[2][1]
+
+def test_linhas_de_erro_seguem_o_arquivo_entre_blocos():
+    arquivo = _arquivo([
+        "Ana;001;2024-01-10;Psicologia;Manhã",      # linha 2
+        "Bia;002;2024-01-11;Psicologia;Tarde",      # linha 3
+        "Caio;003;2024-01-12;Nenhuma;Tarde",        # linha 4
+        "Davi;004;2024-01-13;Fonoaudiologia;",      # linha 5
+        "Eva;001;2024-01-14;Psicologia;Manhã",      # linha 6: repete a da linha 2
+        "Fabi;999;2024-01-15;Psicologia;Manhã",     # linha 7: já está na lista
+    ])
+    registros, erros = preparar_importacao(arquivo, "pacientes.csv", "admin",
+                                           carteirinha_existente=lambda c: c == "999", tamanho=2)
+    assert list(registros["Nome"]) == ["Ana", "Bia", "Davi"]
+    assert set(registros["Registrado Por"]) == {"admin"}
+    assert erros == [
+        (4, "especialidade inválida"),
+        (6, "carteirinha repetida no arquivo (linha 2)"),
+        (7, "carteirinha já está na lista de espera"),
+    ]
@@ -0,0 +1,129 @@
+# Cadastro de usuários único por processo, persistido em JSON
+import hashlib
+import json
+import os
+import threading
+
+ARQUIVO_USUARIOS = "usuarios.json"
+
+PERFIS = ["Administrador", "Comum"]
+
+# Usuário que não pode ser excluído
+USUARIO_PROTEGIDO = "admin"
+
+def hash_senha(senha):
+    return hashlib.sha256(senha.encode()).hexdigest()
+
+# Gravados no primeiro uso, quando o arquivo ainda não existe
+def usuarios_iniciais():
+    return {
+        "admin": {"senha": hash_senha("admin123"), "perfil": "Administrador"},
+        "user1": {"senha": hash_senha("senha123"), "perfil": "Comum"},
+    }
+
+def _assinatura(caminho):
+    try:
+        info = os.stat(caminho)
+        return info.st_mtime_ns, info.st_size
+    except FileNotFoundError:
+        return None
+
+# Os usuários ficam em um dicionário em memória compartilhado por todas as
+# sessões, então consultas (autenticar, perfil) são O(1) e não leem o arquivo.
+# Cada alteração grava o JSON inteiro (atômico) e incrementa "versao". Não há
+# aviso ativo às outras sessões: cada execução do app consulta o cadastro (e
+# usa "versao" nas chaves dos widgets da tela de usuários), e toda consulta
+# confere a assinatura do arquivo (mtime e tamanho) e o recarrega se outro
+# processo o alterou.
+class CadastroUsuarios:
+    def __init__(self, arquivo=ARQUIVO_USUARIOS):
+        self.arquivo = arquivo
+        self.versao = 0
+        self._usuarios = {}
+        self._assinatura = None
+        self._trava = threading.RLock()
+        with self._trava:
+            if not os.path.exists(self.arquivo):
+                self._usuarios = usuarios_iniciais()
+                self._gravar()
+            self._recarregar_se_mudou()
+
+    def _recarregar_se_mudou(self):
+        assinatura = _assinatura(self.arquivo)
+        if assinatura != self._assinatura:
+            with open(self.arquivo, encoding="utf-8") as arquivo:
+                self._usuarios = json.load(arquivo)
+            self._assinatura = assinatura
+            self.versao += 1
+
+    def _gravar(self):
+        temporario = self.arquivo + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(self._usuarios, arquivo, ensure_ascii=False, indent=2)
+        os.replace(temporario, self.arquivo)
+        self._assinatura = _assinatura(self.arquivo)
+        self.versao += 1
+
+    # ============================
+    # CONSULTAS
+    # ============================
+
+    def obter(self, usuario):
+        with self._trava:
+            self._recarregar_se_mudou()
+            dados = self._usuarios.get(usuario)
+            return dict(dados) if dados is not None else None
+
+    def existe(self, usuario):
+        return self.obter(usuario) is not None
+
+    def autenticar(self, usuario, senha):
+        dados = self.obter(usuario)
+        return dados is not None and dados["senha"] == hash_senha(senha)
+
+    def perfil(self, usuario):
+        dados = self.obter(usuario)
+        return dados["perfil"] if dados is not None else None
+
+    # Cópia de {usuario: dados}, sem as senhas
+    def listar(self):
+        with self._trava:
+            self._recarregar_se_mudou()
+            return {u: {c: v for c, v in d.items() if c != "senha"} for u, d in self._usuarios.items()}
+
+    # ============================
+    # ALTERAÇÕES
+    # ============================
+
+    def adicionar(self, usuario, senha, perfil):
+        with self._trava:
+            self._recarregar_se_mudou()
+            if not usuario or usuario in self._usuarios:
+                return False
+            self._usuarios[usuario] = {"senha": hash_senha(senha), "perfil": perfil}
+            self._gravar()
+            return True
+
+    def alterar_senha(self, usuario, nova_senha):
+        self._alterar(usuario, senha=hash_senha(nova_senha))
+
+    def alterar_perfil(self, usuario, perfil):
+        self._alterar(usuario, perfil=perfil)
+
+    def _alterar(self, usuario, **campos):
+        with self._trava:
+            self._recarregar_se_mudou()
+            if usuario not in self._usuarios:
+                return False
+            self._usuarios[usuario] = dict(self._usuarios[usuario], **campos)
+            self._gravar()
+            return True
+
+    def excluir(self, usuario):
+        with self._trava:
+            self._recarregar_se_mudou()
+            if usuario not in self._usuarios or usuario == USUARIO_PROTEGIDO:
+                return False
+            del self._usuarios[usuario]
+            self._gravar()
+            return True